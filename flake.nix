@@ -44,8 +44,7 @@
 
             propagatedBuildInputs = [
               pythonPackages.setuptools
-              pythonPackages.psutil
-              pythonPackages.pillow
+              pythonPackages.numpy
               (bytefmt.lib.bytefmtWithPythonPackages pythonPackages)
             ];
           };
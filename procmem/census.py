@@ -0,0 +1,109 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Optional
+
+import numpy as np
+
+from procmem.memory_region import RegionTable
+from procmem.process import DEFAULT_SAMPLE_JOBS, sample
+
+
+# smaps counters collected per pathname, in bytes
+CENSUS_FIELDS = ["Size", "Rss", "Pss", "Anonymous", "Swap"]
+
+# Pathname under which mappings without a backing file are collected
+ANONYMOUS_PATHNAME = "[anon]"
+
+
+def read_smaps_by_pathname(pid: int) -> dict[str, list[int]]:
+    """Return the CENSUS_FIELDS of /proc/$PID/smaps summed up per pathname"""
+    table = RegionTable.from_pid(pid)
+    counters = table.counters()
+
+    # the regions of a table are already grouped by their interned pathname
+    present = np.unique(table.path_idx)
+    columns = []
+    for field in CENSUS_FIELDS:
+        sums = np.zeros(len(table.pathnames), dtype=np.int64)
+        column = counters.get(field)
+        if column is not None:
+            np.add.at(sums, table.path_idx, column)
+        columns.append(sums[present].tolist())
+
+    return {table.pathnames[idx] or ANONYMOUS_PATHNAME: [column[row] for column in columns]
+            for row, idx in enumerate(present.tolist())}
+
+
+class CensusEntry:
+
+    def __init__(self, pathname: str) -> None:
+        self.pathname = pathname
+        self.values = [0] * len(CENSUS_FIELDS)
+        self.pids: list[int] = []
+
+    def get(self, field: str) -> int:
+        return self.values[CENSUS_FIELDS.index(field)]
+
+    def to_json(self) -> dict[str, Any]:
+        js: dict[str, Any] = {"pathname": self.pathname, "processes": len(self.pids)}
+        js.update({field.lower(): value for field, value in zip(CENSUS_FIELDS, self.values)})
+        return js
+
+
+class Census:
+    """The memory usage of many processes aggregated by pathname, so
+    that e.g. a library shared by hundreds of processes shows up as a
+    single entry"""
+
+    def __init__(self) -> None:
+        self.entries: dict[str, CensusEntry] = {}
+        self.pids: list[int] = []
+
+    def add(self, pid: int, totals: dict[str, list[int]]) -> None:
+        self.pids.append(pid)
+        for pathname, values in totals.items():
+            entry = self.entries.get(pathname)
+            if entry is None:
+                entry = self.entries[pathname] = CensusEntry(pathname)
+            entry.values = [lhs + rhs for lhs, rhs in zip(entry.values, values)]
+            entry.pids.append(pid)
+
+    def sorted_entries(self, field: str = "Pss", limit: Optional[int] = None) -> list[CensusEntry]:
+        """Return the entries with the largest 'field' first"""
+        idx = CENSUS_FIELDS.index(field)
+        entries = sorted(self.entries.values(), key=lambda entry: (-entry.values[idx], entry.pathname))
+        return entries[:limit] if limit is not None else entries
+
+    def totals(self) -> list[int]:
+        result = [0] * len(CENSUS_FIELDS)
+        for entry in self.entries.values():
+            result = [lhs + rhs for lhs, rhs in zip(result, entry.values)]
+        return result
+
+
+def take_census(pids: list[int], jobs: int = DEFAULT_SAMPLE_JOBS) -> Census:
+    """Read the smaps of all 'pids' with at most 'jobs' reads in
+    flight, processes that exit in the meantime or can't be accessed
+    are left out"""
+    census = Census()
+    for pid, totals in sample(pids, read_smaps_by_pathname, jobs):
+        census.add(pid, totals)
+    return census
+
+
+# EOF #
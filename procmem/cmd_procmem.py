@@ -19,18 +19,29 @@ import re
 import os
 import sys
 import argparse
-import signal
-import psutil
 import logging
 
+from procmem.census import CENSUS_FIELDS
+from procmem.dump import COMPRESSIONS, DEFAULT_READERS
+from procmem.main_census import main_census
+from procmem.main_diff import main_diff
 from procmem.main_info import main_info
 from procmem.main_list import main_list
 from procmem.main_read import main_read
 from procmem.main_replace import main_replace
+from procmem.main_scan import CHANGE_OPS, main_scan
 from procmem.main_search import main_search
+from procmem.main_snapshot import main_snapshot
 from procmem.main_statm import main_statm
+from procmem.main_stats import main_stats
 from procmem.main_watch import main_watch
 from procmem.main_write import main_write
+from procmem.png import DEFAULT_PNG_WIDTH
+from procmem.process import DEFAULT_SAMPLE_JOBS, ProcessCache, ProcessMatcher, find_processes, stopped
+from procmem.snapshot import DEFAULT_COMPRESSION_LEVEL
+from procmem.stats import METRICS
+from procmem.typedscan import SCAN_OPS
+from procmem.watch import DEFAULT_HISTORY_SIZE
 
 
 def AddressRangeOpt(text: str) -> range:
@@ -69,6 +80,15 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     pid_p.add_argument("-P", "--process", metavar="NAME", type=str,
                        help="The name of the process to read or write to")
 
+    parser.add_argument("-E", "--regex", dest="process_regex", action='store_true', default=False,
+                        help="Interpret the --process NAME as a regular expression")
+    parser.add_argument("--cmdline", action='store_true', default=False,
+                        help="Match the --process NAME as a regular expression against the command line")
+    parser.add_argument("-a", "--all", action='store_true', default=False,
+                        help="Run the command on every process matching --process instead of requiring a unique one")
+    parser.add_argument("--cache", action='store_true', default=False,
+                        help="Remember the process names for a few seconds to speed up repeated --process lookups")
+
     parser.add_argument("-S", "--suspend", action='store_true', default=False,
                         help="Suspend the given process while interacting with the memory")
 
@@ -78,6 +98,22 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
                         help="Save memory to FILE")
     read_p.add_argument("--png", metavar="FILE", type=str, default=None,
                         help="Save memory into a PNG file")
+    read_p.add_argument("--core", metavar="FILE", type=str, default=None,
+                        help="Save memory as an ELF core file loadable by a debugger")
+    read_p.add_argument("--compress", choices=COMPRESSIONS, default=None,
+                        help="Save memory to --outfile as a compressed dump with a frame index, "
+                        "read and compressed by a pipeline of worker threads")
+    read_p.add_argument("--level", metavar="NUM", type=int, default=None,
+                        help="Compression level of --compress")
+    read_p.add_argument("--readers", metavar="NUM", type=int, default=DEFAULT_READERS,
+                        help="Read memory for --compress with NUM threads")
+    read_p.add_argument("-j", "--jobs", metavar="NUM", type=int, default=0,
+                        help="Compress memory for --compress with NUM threads, 0 for one per CPU")
+    read_p.add_argument("--png-width", metavar="NUM", type=int, default=DEFAULT_PNG_WIDTH,
+                        help="Width of the --png and --overview images")
+    read_p.add_argument("--overview", metavar="FILE", type=str, default=None,
+                        help="Save an RGB image with one pixel per page to FILE, "
+                        "red is pointer density, green entropy and blue the share of non-zero bytes")
     read_p.add_argument("-S", "--sparse", action='store_true', default=False,
                         help="Write a sparse output file")
     read_p.add_argument("-s", "--split", action='store_true', default=False,
@@ -119,36 +155,180 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
                           help="Display context after the located address")
     search_p.add_argument("-W", "--width", metavar="NUM", type=int, default=16,
                           help="Write NUM bytes per row")
-    search_p.add_argument("NEEDLE", help="Search for NEEDLE")
+    search_p.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1,
+                          help="Scan memory with NUM worker processes, 0 for one per CPU")
+    search_p.add_argument("-E", "--regex", action='store_true', default=False,
+                          help="Interpret NEEDLE as a regular expression over bytes")
+    search_p.add_argument("--max-match-length", metavar="BYTES", type=int, default=4096,
+                          help="Longest --regex match that is guaranteed to be found across chunk boundaries")
+    search_p.add_argument("--op", choices=sorted(SCAN_OPS), default=None,
+                          help="Compare the values of --type against NEEDLE instead of searching for bytes, "
+                          "'range' takes two NEEDLEs")
+    search_p.add_argument("--align", metavar="BYTES", type=int, default=1,
+                          help="Only compare --op values at addresses aligned to BYTES")
+    search_p.add_argument("--tolerance", metavar="DELTA", type=float, default=0.0,
+                          help="Maximum difference for --op approx")
+    search_p.add_argument("-f", "--needle-file", metavar="FILE", type=str, default=None,
+                          help="Read additional needles from FILE, one per line, "
+                          "a 'TYPE:' prefix overrides --type for a single needle")
+    search_p.add_argument("NEEDLE", nargs="*",
+                          help="Search for NEEDLE")
 
     statm_p = subparsers.add_parser("statm", help="Memory usage information")
     statm_p.set_defaults(command=main_statm)
 
     replace_p = subparsers.add_parser("replace", help="Search and replace a section of memory")
     replace_p.set_defaults(command=main_replace)
-    replace_p.add_argument("NEEDLE", help="Search for NEEDLE")
-    replace_p.add_argument("DATA", help="Replace NEEDLE with DATA")
+    replace_p.add_argument("-e", "--pair", metavar=("NEEDLE", "DATA"), nargs=2, action="append", default=None,
+                           help="Additionally replace NEEDLE with DATA, can be given multiple times")
+    replace_p.add_argument("-f", "--pair-file", metavar="FILE", type=str, default=None,
+                           help="Read NEEDLE and DATA pairs from FILE, one tab separated pair per line, "
+                           "a 'TYPE:' prefix overrides --type for a single NEEDLE or DATA")
+    replace_p.add_argument("NEEDLE", nargs="?", help="Search for NEEDLE")
+    replace_p.add_argument("DATA", nargs="?", help="Replace NEEDLE with DATA")
 
     watch_p = subparsers.add_parser("watch", help="Watch memory region")
     watch_p.set_defaults(command=main_watch)
-    watch_p.add_argument("-r", "--range", type=AddressRangeOpt, default=None,
-                         help="Watch the given range for changes")
+    watch_p.add_argument("-r", "--range", type=AddressRangeOpt, action="append", default=None,
+                         help="Watch the given range for changes, can be given multiple times")
+    watch_p.add_argument("-v", "--var", metavar="ADDR[+OFFSET]:TYPE", type=str, action="append", default=None,
+                         help="Watch a typed value, e.g. '7f12a0:int32' or '7f12a0+1c:float' for a struct field")
+    watch_p.add_argument("-f", "--target-file", metavar="FILE", type=str, default=None,
+                         help="Read additional ADDR[+OFFSET]:TYPE targets from FILE, one per line")
+    watch_p.add_argument("-i", "--interval", metavar="SECONDS", type=float, default=0.1,
+                         help="Time between reads")
+    watch_p.add_argument("--adaptive", action='store_true', default=False,
+                         help="Read more often while values are changing, --interval becomes the maximum")
+    watch_p.add_argument("--min-interval", metavar="SECONDS", type=float, default=0.0005,
+                         help="Shortest interval used by --adaptive")
+    watch_p.add_argument("--history", metavar="NUM", type=int, default=DEFAULT_HISTORY_SIZE,
+                         help="Number of changes kept for --export")
+    watch_p.add_argument("--export", metavar="FILE", type=str, default=None,
+                         help="Write the recorded changes to FILE as JSON lines when done")
+    watch_p.add_argument("--duration", metavar="SECONDS", type=float, default=None,
+                         help="Stop watching after SECONDS")
+    watch_p.add_argument("-n", "--ticks", metavar="NUM", type=int, default=None,
+                         help="Stop watching after NUM reads")
+
+    scan_p = subparsers.add_parser("scan",
+                                   description="Narrow down the location of a value over multiple scans",
+                                   help="Incremental value scan")
+    scan_p.set_defaults(command=main_scan)
+    scan_subparsers = scan_p.add_subparsers(dest="scan_command", required=True)
+
+    scan_new_p = scan_subparsers.add_parser("new", help="Start a session with all matching values")
+    scan_new_p.add_argument("-t", "--type", metavar="TYPE", type=str, default="int32",
+                            help="Type of the value (int8, int16, float, double, ...)")
+    scan_new_p.add_argument("--op", choices=sorted(SCAN_OPS), default=None,
+                            help="Compare against VALUE with the given operator, "
+                            "defaults to 'eq' or to 'any' when no VALUE is given")
+    scan_new_p.add_argument("--align", metavar="BYTES", type=int, default=None,
+                            help="Only consider addresses aligned to BYTES, defaults to the size of TYPE")
+    scan_new_p.add_argument("SESSION", help="Directory to store the candidates in")
+    scan_new_p.add_argument("VALUE", nargs="*", help="Value to compare against")
+
+    scan_next_p = scan_subparsers.add_parser("next", help="Keep only the candidates fulfilling CONDITION")
+    scan_next_p.add_argument("SESSION", help="Directory of the session")
+    scan_next_p.add_argument("CONDITION", choices=CHANGE_OPS + sorted(set(SCAN_OPS) - {"any"}),
+                             help="Compare against the previous value or against VALUE")
+    scan_next_p.add_argument("VALUE", nargs="*", help="Value to compare against")
+
+    scan_list_p = scan_subparsers.add_parser("list", help="Print the candidates")
+    scan_list_p.add_argument("SESSION", help="Directory of the session")
+
+    for p in [scan_new_p, scan_next_p]:
+        p.add_argument("--tolerance", metavar="DELTA", type=float, default=0.0,
+                       help="Maximum difference for 'approx'")
+
+    for p in [scan_new_p, scan_next_p, scan_list_p]:
+        p.add_argument("-n", "--limit", metavar="NUM", type=int, default=None,
+                       help="Print at most NUM candidates")
+
+    snapshot_p = subparsers.add_parser("snapshot", help="Save memory into a compact snapshot file")
+    snapshot_p.set_defaults(command=main_snapshot)
+    snapshot_p.add_argument("-l", "--level", metavar="NUM", type=int, default=DEFAULT_COMPRESSION_LEVEL,
+                            help="zlib compression level of the snapshot")
+    snapshot_p.add_argument("--incremental", action='store_true', default=False,
+                            help="After the base snapshot keep writing FILE.1, FILE.2, ... containing only "
+                            "the pages written to since the previous one")
+    snapshot_p.add_argument("-i", "--interval", metavar="SECONDS", type=float, default=5.0,
+                            help="Time between --incremental snapshots")
+    snapshot_p.add_argument("-n", "--count", metavar="NUM", type=int, default=None,
+                            help="Stop after NUM --incremental snapshots")
+    snapshot_p.add_argument("FILE", help="Write the snapshot to FILE")
+
+    diff_p = subparsers.add_parser("diff",
+                                   description="Compare two snapshots or a snapshot with the live process",
+                                   help="Compare memory states")
+    diff_p.set_defaults(command=main_diff)
+    diff_p.add_argument("-s", "--summary", action='store_true', default=False,
+                        help="Only print the changes per region, not the changed bytes")
+    diff_p.add_argument("OLD", help="Snapshot to compare against")
+    diff_p.add_argument("NEW", nargs="?", default=None,
+                        help="Snapshot to compare with, defaults to the current memory of the process")
+
+    stats_p = subparsers.add_parser("stats",
+                                    description="Compute entropy, zero bytes, byte histogram and pointer density "
+                                    "of memory regions without dumping them",
+                                    help="Memory content statistics")
+    stats_p.set_defaults(command=main_stats)
+    stats_p.add_argument("-s", "--sort", metavar="METRIC", choices=METRICS, default="size",
+                         help="Sort by METRIC ({}), highest first".format(", ".join(METRICS)))
+    stats_p.add_argument("-n", "--limit", metavar="NUM", type=int, default=None,
+                         help="Print at most NUM regions and pages")
+    stats_p.add_argument("--pages", action='store_true', default=False,
+                         help="Also print the metrics of individual pages")
+    stats_p.add_argument("--histogram", action='store_true', default=False,
+                         help="Include the byte histogram of every region in the --json output")
+    stats_p.add_argument("--json", action='store_true', default=False,
+                         help="Print the result as JSON")
+
+    census_p = subparsers.add_parser("census",
+                                     description="Aggregate the memory usage of all processes by pathname",
+                                     help="System wide memory usage per mapped file")
+    census_p.set_defaults(command=main_census)
+    census_p.add_argument("-s", "--sort", metavar="FIELD", choices=CENSUS_FIELDS, default="Pss",
+                          help="Sort by FIELD ({})".format(", ".join(CENSUS_FIELDS)))
+    census_p.add_argument("-n", "--limit", metavar="NUM", type=int, default=None,
+                          help="Print at most NUM entries")
+    census_p.add_argument("--json", action='store_true', default=False,
+                          help="Print the result as JSON")
 
     # MemoryRegion filter
-    for p in [read_p, info_p, search_p, replace_p]:
+    for p in [read_p, info_p, search_p, replace_p, scan_new_p, snapshot_p, diff_p, stats_p]:
         g = p.add_argument_group("Memory Region Filter")
         g.add_argument("-P", "--pathname", type=str, default=None,
                        help="Limit output to segments matching pathname")
         g.add_argument("-w", "--writable", action='store_true', default=False,
                        help="Only dump writable pages")
+        g.add_argument("-x", "--executable", action='store_true', default=False,
+                       help="Only dump executable pages")
         g.add_argument("--size", metavar="SIZE", type=int, default=None,
                        help="Only show areas larger than SIZE")
+        g.add_argument("--rss", metavar="SIZE", type=int, default=None,
+                       help="Only show areas with at least SIZE bytes resident")
         g.add_argument("--no-default-filter", action='store_true', default=False,
-                       help="Do not filter [vvar] and [vsyscall] regions")
+                       help="Do not filter [vvar], [vvar_vclock] and [vsyscall] regions")
+
+    for p in [info_p, statm_p, census_p]:
+        p.add_argument("-m", "--match", metavar="REGEX", type=str, default=None,
+                       help="Select all processes whose name matches REGEX")
+        p.add_argument("--pids", metavar="PID", type=int, nargs="+", default=None,
+                       help="Select the given processes")
+        p.add_argument("-j", "--jobs", metavar="NUM", type=int, default=DEFAULT_SAMPLE_JOBS,
+                       help="Read NUM processes concurrently")
+
+    for p in [read_p, search_p, scan_new_p, snapshot_p, diff_p, stats_p]:
+        p.add_argument("--resident-only", action='store_true', default=False,
+                       help="Only read pages present in RAM, skipping untouched and swapped out pages")
+
+    for p in [search_p, replace_p, watch_p]:
+        p.add_argument("--symbols", action='store_true', default=False,
+                       help="Resolve addresses in mapped ELF files to symbol+offset")
 
     for p in [write_p, search_p, replace_p]:
         p.add_argument("-t", "--type", metavar="TYPE", type=str, default="string",
-                       help="Specify the type of the data (int8, int16, float, double, ...)")
+                       help="Specify the type of the data (int8, int16, float, double, bytes-pattern, ...)")
 
     args = parser.parse_args(argv)
     if args.command is None:
@@ -157,41 +337,43 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     return args
 
 
-def pid_by_name(name: str) -> list[int]:
-    return [p.pid for p in psutil.process_iter() if p.name() == name]
+def pid_by_name(name: str, regex: bool = False, cmdline: bool = False, cache: bool = False) -> list[int]:
+    return find_processes(ProcessMatcher(name, regex, cmdline), ProcessCache() if cache else None)
 
 
-def pid_from_args(args: argparse.Namespace) -> int:
+def pids_from_args(args: argparse.Namespace) -> list[int]:
     if args.pid is not None:
         if args.pid == "self":
-            return os.getpid()
+            return [os.getpid()]
         else:
-            return int(args.pid)
+            return [int(args.pid)]
     elif args.process is not None:
-        pids = pid_by_name(args.process)
+        pids = pid_by_name(args.process, args.process_regex, args.cmdline, args.cache)
         if len(pids) == 0:
             raise Exception("Couldn't find process with name={}".format(args.process))
-        elif len(pids) == 1:
-            return pids[0]
+        elif len(pids) == 1 or args.all:
+            return pids
         else:
-            raise Exception("process is not unique: name={}".format(args.process))
+            raise Exception("process is not unique: name={} pids={}, use --all to select all of them"
+                            .format(args.process, " ".join(str(pid) for pid in pids)))
     else:
-        return os.getpid()
+        return [os.getpid()]
 
 
 def main(argv: list[str]) -> None:
     logging.basicConfig(level=logging.DEBUG)
     args = parse_args(argv[1:])
-    pid = pid_from_args(args)
 
-    if args.suspend:
-        os.kill(pid, signal.SIGSTOP)
-        try:
+    pids = pids_from_args(args)
+    for pid in pids:
+        if len(pids) > 1:
+            print("==> {} <==".format(pid))
+
+        if args.suspend:
+            with stopped(pid):
+                args.command(pid, args)
+        else:
             args.command(pid, args)
-        finally:
-            os.kill(pid, signal.SIGCONT)
-    else:
-        args.command(pid, args)
 
 
 def main_entrypoint() -> None:
@@ -0,0 +1,163 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import BinaryIO, Optional, Sequence
+
+import logging
+import os
+import platform
+import struct
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion
+
+
+ET_CORE = 4
+EV_CURRENT = 1
+PT_LOAD = 1
+PT_NOTE = 4
+PF_X = 1
+PF_W = 2
+PF_R = 4
+
+NT_PRPSINFO = 3
+NT_AUXV = 6
+NT_FILE = 0x46494c45
+
+ELF_MACHINES = {
+    "x86_64": 62,
+    "aarch64": 183,
+    "ppc64le": 21,
+    "riscv64": 243,
+}
+
+ELF_HEADER = struct.Struct("<16sHHIQQQIHHHHHH")
+PROGRAM_HEADER = struct.Struct("<IIQQQQQQ")
+
+# struct elf_prpsinfo of 64bit Linux
+PRPSINFO = struct.Struct("<cccc4xQIIiiii16s80s")
+
+
+def make_note(name: bytes, note_type: int, desc: bytes) -> bytes:
+    """Encode an ELF note, name and descriptor are padded to 4 bytes"""
+    name += b"\0"
+    return (struct.pack("<III", len(name), len(desc), note_type) +
+            name + bytes(-len(name) % 4) +
+            desc + bytes(-len(desc) % 4))
+
+
+def file_note(regions: Sequence[MemoryRegion], page_size: int) -> bytes:
+    """NT_FILE lists the file backed regions, which lets a debugger
+    find the shared libraries of the process"""
+    files = [region for region in regions if region.inode != 0 and region.pathname.startswith("/")]
+    desc = struct.pack("<QQ", len(files), page_size)
+    desc += b"".join(struct.pack("<QQQ", region.addr_beg, region.addr_end, region.offset // page_size)
+                     for region in files)
+    desc += b"".join(region.pathname.encode() + b"\0" for region in files)
+    return make_note(b"CORE", NT_FILE, desc)
+
+
+def prpsinfo_note(pid: int) -> bytes:
+    procdir = os.path.join("/proc", str(pid))
+    with open(os.path.join(procdir, "stat"), "r") as fin:
+        stat = fin.read()
+    name = stat[stat.index("(") + 1:stat.rindex(")")]
+    fields = stat[stat.rindex(")") + 2:].split()
+    state = fields[0]
+    ppid, pgrp, sid = int(fields[1]), int(fields[2]), int(fields[3])
+    nice, flags = int(fields[16]), int(fields[6])
+
+    with open(os.path.join(procdir, "cmdline"), "rb") as fin:
+        args = fin.read().replace(b"\0", b" ").strip()
+    st = os.stat(procdir)
+
+    desc = PRPSINFO.pack(bytes([max(0, "RSDTZW".find(state))]), state.encode()[:1],
+                         b"\1" if state == "Z" else b"\0", struct.pack("<b", nice),
+                         flags, st.st_uid, st.st_gid, pid, ppid, pgrp, sid,
+                         name.encode()[:15], args[:79])
+    return make_note(b"CORE", NT_PRPSINFO, desc)
+
+
+def read_auxv(pid: int) -> Optional[bytes]:
+    try:
+        with open(os.path.join("/proc", str(pid), "auxv"), "rb") as fin:
+            return fin.read()
+    except OSError:
+        return None
+
+
+def write_core(mem: Memory, regions: Sequence[MemoryRegion], fout: BinaryIO, page_size: int,
+               resident_only: bool = False) -> int:
+    """Write an ELF core file with one PT_LOAD per region, the headers
+    are written first and the memory is then streamed chunk by chunk.
+    Pages that can't be read or aren't resident become holes in the
+    file and read back as zeroes. Returns the number of bytes read."""
+    machine = ELF_MACHINES.get(platform.machine())
+    if machine is None:
+        raise Exception("unsupported architecture for core files: {}".format(platform.machine()))
+
+    notes = prpsinfo_note(mem.pid)
+    auxv = read_auxv(mem.pid)
+    if auxv is not None:
+        notes += make_note(b"CORE", NT_AUXV, auxv)
+    notes += file_note(regions, page_size)
+
+    phnum = len(regions) + 1
+    if phnum >= 0xffff:
+        raise Exception("too many regions for a core file: {}".format(len(regions)))
+
+    notes_offset = ELF_HEADER.size + PROGRAM_HEADER.size * phnum
+    data_offset = (notes_offset + len(notes) + page_size - 1) // page_size * page_size
+
+    headers = [PROGRAM_HEADER.pack(PT_NOTE, 0, notes_offset, 0, 0, len(notes), 0, 1)]
+    offsets = []
+    offset = data_offset
+    for region in regions:
+        # regions without read permission are recorded without content, like gcore does
+        filesz = region.length() if region.readable else 0
+        flags = (PF_R if region.readable else 0) | (PF_W if region.writable else 0) | \
+            (PF_X if region.executable else 0)
+        headers.append(PROGRAM_HEADER.pack(PT_LOAD, flags, offset, region.addr_beg, 0,
+                                           filesz, region.length(), page_size))
+        offsets.append(offset)
+        offset += filesz
+
+    ident = b"\x7fELF" + bytes([2, 1, EV_CURRENT, 0]) + bytes(8)
+    fout.write(ELF_HEADER.pack(ident, ET_CORE, machine, EV_CURRENT, 0,
+                               ELF_HEADER.size, 0, 0, ELF_HEADER.size, PROGRAM_HEADER.size, phnum, 0, 0, 0))
+    fout.write(b"".join(headers))
+    fout.write(notes)
+
+    total = 0
+    for region, base in zip(regions, offsets):
+        if not region.readable:
+            continue
+        try:
+            for beg, end in mem.ranges(region.addr_beg, region.addr_end, resident_only):
+                for addr, chunk in mem.chunks(beg, end):
+                    fout.seek(base + addr - region.addr_beg)
+                    fout.write(chunk)
+                    total += len(chunk)
+        except (OSError, OverflowError) as err:
+            logging.warning("%s: failed to read: %s", region, err)
+
+    # trailing holes have to be part of the file
+    fout.truncate(offset)
+    return total
+
+
+# EOF #
@@ -0,0 +1,165 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Sequence
+
+import logging
+
+import numpy as np
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion, region_mask
+from procmem.snapshot import Snapshot, page_digests
+
+
+# Number of bytes of old and new content kept for each changed run
+RUN_PREVIEW = 16
+
+
+def changed_runs(addr: int, old: Any, new: Any) -> list[tuple[int, int]]:
+    """Return the [beg, end) address ranges in which 'old' and 'new' differ"""
+    mask = np.frombuffer(old, dtype=np.uint8) != np.frombuffer(new, dtype=np.uint8)
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8), prepend=0, append=0))
+    return [(addr + beg, addr + end) for beg, end in zip(edges[0::2].tolist(), edges[1::2].tolist())]
+
+
+class SnapshotDiff:
+    """The differences between two memory states"""
+
+    def __init__(self, old_regions: Sequence[MemoryRegion], new_regions: Sequence[MemoryRegion]) -> None:
+        def key(region: MemoryRegion) -> tuple[int, int, str]:
+            return (region.addr_beg, region.addr_end, region.pathname)
+
+        old_keys = {key(region) for region in old_regions}
+        new_keys = {key(region) for region in new_regions}
+
+        self.regions = new_regions
+        self.appeared = [region for region in new_regions if key(region) not in old_keys]
+        self.vanished = [region for region in old_regions if key(region) not in new_keys]
+
+        # (beg, end, old preview, new preview) of all changed bytes
+        self.runs: list[tuple[int, int, bytes, bytes]] = []
+        self.changed_pages: list[int] = []
+
+        self.compared_pages = 0
+        self.old_only_pages = 0
+        self.new_only_pages = 0
+
+    def add_page(self, addr: int, old: Any, new: Any) -> None:
+        """Record the changes between the 'old' and 'new' content of the page at 'addr'"""
+        self.changed_pages.append(addr)
+        for beg, end in changed_runs(addr, old, new):
+            old_bytes = bytes(old[beg - addr:min(end, beg + RUN_PREVIEW) - addr])
+            new_bytes = bytes(new[beg - addr:min(end, beg + RUN_PREVIEW) - addr])
+
+            # runs continuing on the next page are merged
+            if self.runs and self.runs[-1][1] == beg:
+                last_beg, _, last_old, last_new = self.runs[-1]
+                self.runs[-1] = (last_beg, end,
+                                 (last_old + old_bytes)[:RUN_PREVIEW],
+                                 (last_new + new_bytes)[:RUN_PREVIEW])
+            else:
+                self.runs.append((beg, end, old_bytes, new_bytes))
+
+    def changed_bytes(self) -> int:
+        return sum(end - beg for beg, end, _, _ in self.runs)
+
+    def region_changes(self) -> list[tuple[MemoryRegion, int, int]]:
+        """Return (region, changed pages, changed bytes) for all regions with changes"""
+        regions = sorted(self.regions, key=lambda region: region.addr_beg)
+        begs = np.array([region.addr_beg for region in regions], dtype=np.uint64)
+
+        page_counts = np.zeros(len(regions), dtype=np.int64)
+        byte_counts = np.zeros(len(regions), dtype=np.int64)
+        if regions and self.changed_pages:
+            page_idx = np.searchsorted(begs, np.array(self.changed_pages, dtype=np.uint64), side="right") - 1
+            np.add.at(page_counts, page_idx, 1)
+
+            run_begs = np.array([beg for beg, _, _, _ in self.runs], dtype=np.uint64)
+            run_lengths = np.array([end - beg for beg, end, _, _ in self.runs], dtype=np.int64)
+            np.add.at(byte_counts, np.searchsorted(begs, run_begs, side="right") - 1, run_lengths)
+
+        return [(region, int(pages), int(count))
+                for region, pages, count in zip(regions, page_counts, byte_counts)
+                if pages > 0]
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot,
+                   old_regions: Sequence[MemoryRegion], new_regions: Sequence[MemoryRegion]) -> SnapshotDiff:
+    """Compare the pages of two snapshots within the given regions,
+    only pages with differing digests are compared byte by byte"""
+    diff = SnapshotDiff(old_regions, new_regions)
+
+    old_idx = np.flatnonzero(region_mask(old_regions, old.page_addrs))
+    new_idx = np.flatnonzero(region_mask(new_regions, new.page_addrs))
+    _, old_common, new_common = np.intersect1d(old.page_addrs[old_idx], new.page_addrs[new_idx],
+                                               assume_unique=True, return_indices=True)
+    old_common = old_idx[old_common]
+    new_common = new_idx[new_common]
+
+    diff.compared_pages = len(old_common)
+    diff.old_only_pages = len(old_idx) - len(old_common)
+    diff.new_only_pages = len(new_idx) - len(new_common)
+
+    mismatch = (old.page_digests[old_common] != new.page_digests[new_common]).any(axis=1)
+    for i, j in zip(old_common[mismatch].tolist(), new_common[mismatch].tolist()):
+        diff.add_page(int(old.page_addrs[i]), old.read_page(i), new.read_page(j))
+
+    return diff
+
+
+def diff_live(old: Snapshot, mem: Memory, old_regions: Sequence[MemoryRegion], new_regions: Sequence[MemoryRegion],
+              resident_only: bool = False) -> SnapshotDiff:
+    """Compare a snapshot with the current memory of a process, which
+    is hashed chunk by chunk while being read"""
+    diff = SnapshotDiff(old_regions, new_regions)
+    page_size = old.page_size
+
+    old_idx = np.flatnonzero(region_mask(old_regions, old.page_addrs))
+    old_addrs = old.page_addrs[old_idx]
+
+    for region in new_regions:
+        try:
+            for beg, end in mem.ranges(region.addr_beg, region.addr_end, resident_only):
+                for addr, chunk in mem.chunks(beg, end):
+                    digests = page_digests(chunk, page_size)
+                    addrs = addr + np.arange(len(digests), dtype=np.uint64) * page_size
+
+                    if len(old_addrs) > 0:
+                        pos = np.minimum(np.searchsorted(old_addrs, addrs), len(old_addrs) - 1)
+                        present = old_addrs[pos] == addrs
+                    else:
+                        pos = np.zeros(len(addrs), dtype=np.intp)
+                        present = np.zeros(len(addrs), dtype=np.bool_)
+                    idx = old_idx[pos[present]]
+                    mismatch = (old.page_digests[idx] != digests[present]).any(axis=1)
+
+                    diff.compared_pages += len(idx)
+                    diff.new_only_pages += len(addrs) - len(idx)
+                    with memoryview(chunk) as view:
+                        for i, k in zip(np.flatnonzero(present)[mismatch].tolist(), idx[mismatch].tolist()):
+                            diff.add_page(addr + i * page_size, old.read_page(k),
+                                          view[i * page_size:(i + 1) * page_size])
+        except (OSError, OverflowError) as err:
+            logging.warning("%012x-%012x %s: failed to read: %s",
+                            region.addr_beg, region.addr_end, region.pathname, err)
+
+    diff.old_only_pages = len(old_addrs) - diff.compared_pages
+    return diff
+
+
+# EOF #
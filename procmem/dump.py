@@ -0,0 +1,380 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional, Sequence
+
+import functools
+import json
+import lzma
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory_region import MemoryRegion
+from procmem.pagemap import PAGE_SIZE
+
+
+# Compressed memory dumps written by a pipeline of worker threads
+#
+# A dump file looks like this:
+#
+#     MAGIC
+#     frames         compressed chunks of memory in address order
+#     frame index    FRAME_DTYPE[frames]  address, length, file offset and size of every frame
+#     footer         JSON with the regions, the compression and the offset of the index
+#     trailer        footer offset, footer length, MAGIC
+#
+# Every frame is compressed on its own, so any address can be read back
+# by a binary search over the index and the decompression of a single
+# frame. Frames containing only zeros have a size of 0 and no data,
+# frames that don't compress are stored as they are with a size equal
+# to their length, unreadable pages have no frame at all. A dump that
+# was interrupted has no index and no trailer, so it can't be mistaken
+# for a complete one.
+MAGIC = b"PMDUMP01"
+TRAILER = struct.Struct("<QQ8s")
+
+FRAME_DTYPE = np.dtype([("addr", "<u8"), ("length", "<u8"), ("offset", "<u8"), ("size", "<u8")])
+
+# Bytes of memory per frame, larger frames compress better, smaller
+# ones are faster to read back
+DUMP_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Threads doing positional reads of /proc/$PID/mem, the reads spend
+# most of their time in the kernel copying pages
+DEFAULT_READERS = 4
+
+# Compression level used when none is given, the fastest level of each
+# codec already shrinks memory a lot
+DEFAULT_LEVELS = {"zlib": 1, "lzma": 0}
+
+COMPRESSIONS = sorted(DEFAULT_LEVELS) + ["none"]
+
+# Number of decompressed frames kept around by DumpFile
+FRAME_CACHE_SIZE = 4
+
+
+def compressor(compression: str, level: Optional[int] = None) -> Callable[[bytes], bytes]:
+    """Return a function compressing a frame, zlib and lzma release the
+    GIL while they work, so frames can be compressed by threads"""
+    if level is None:
+        level = DEFAULT_LEVELS.get(compression, 0)
+
+    if compression == "zlib":
+        return functools.partial(zlib.compress, level=level)
+    elif compression == "lzma":
+        return functools.partial(lzma.compress, preset=level)
+    elif compression == "none":
+        return bytes
+    else:
+        raise Exception("unknown compression: {}".format(compression))
+
+
+def decompressor(compression: str) -> Callable[[bytes], bytes]:
+    if compression == "zlib":
+        return zlib.decompress
+    elif compression == "lzma":
+        return lzma.decompress
+    elif compression == "none":
+        return bytes
+    else:
+        raise Exception("unknown compression: {}".format(compression))
+
+
+def split_chunks(ranges: Iterable[tuple[int, int]], chunk_size: int) -> Iterator[tuple[int, int]]:
+    for beg, end in ranges:
+        for start in range(beg, end, chunk_size):
+            yield start, min(end, start + chunk_size)
+
+
+def read_frames(fd: int, start: int, end: int, page_size: int = PAGE_SIZE) -> list[tuple[int, bytes]]:
+    """Read [start, end) from the /proc/$PID/mem file descriptor 'fd'
+    and return (address, data) tuples of the readable parts, after the
+    first failure the rest is read page by page"""
+    try:
+        data = os.pread(fd, end - start, start)
+    except (OSError, OverflowError):
+        data = b""
+    if len(data) == end - start:
+        return [(start, data)]
+
+    frames: list[tuple[int, bytes]] = []
+    run_addr = start
+    run = [data] if data else []
+    addr = start + len(data)
+    while addr < end:
+        stop = min(end, addr - addr % page_size + page_size)
+        try:
+            page = os.pread(fd, stop - addr, addr)
+        except (OSError, OverflowError):
+            page = b""
+
+        if page:
+            if not run:
+                run_addr = addr
+            run.append(page)
+        if len(page) < stop - addr and run:
+            frames.append((run_addr, b"".join(run)))
+            run = []
+        addr = stop
+
+    if run:
+        frames.append((run_addr, b"".join(run)))
+    return frames
+
+
+class DumpWriter:
+    """Writes a dump, frames have to be added in ascending address order"""
+
+    def __init__(self, filename: str, regions: Sequence[MemoryRegion],
+                 compression: str = "zlib", level: Optional[int] = None,
+                 meta: Optional[dict[str, Any]] = None) -> None:
+        self.filename = filename
+        self.regions = regions
+        self.compression = compression
+        self.level = DEFAULT_LEVELS.get(compression, 0) if level is None else level
+        self.meta = meta or {}
+
+        self._fout: BinaryIO = open(filename, "wb")
+        self._fout.write(MAGIC)
+        self._frames: list[tuple[int, int, int, int]] = []
+
+        self.length = 0
+        self.size = 0
+
+    def __enter__(self) -> 'DumpWriter':
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, addr: int, length: int, payload: bytes) -> None:
+        """Append a frame of 'length' bytes of memory at 'addr',
+        'payload' is the compressed data or empty for a zero frame"""
+        if self._frames:
+            last_addr, last_length, _, _ = self._frames[-1]
+            assert addr >= last_addr + last_length, "frames must be added in address order"
+
+        self._frames.append((addr, length, self._fout.tell(), len(payload)))
+        self._fout.write(payload)
+        self.length += length
+        self.size += len(payload)
+
+    def abort(self) -> None:
+        """Close the file without the index and the trailer, which
+        marks it as incomplete"""
+        self._fout.close()
+
+    def close(self) -> None:
+        if self._fout.closed:
+            return
+
+        # keep the index aligned, so it can be mapped directly
+        self._fout.write(bytes(-self._fout.tell() % 8))
+        index_offset = self._fout.tell()
+        self._fout.write(np.array(self._frames, dtype=FRAME_DTYPE).tobytes())
+
+        footer = dict(self.meta)
+        footer.update({
+            "version": 1,
+            "time": time.time(),
+            "compression": self.compression,
+            "level": self.level,
+            "frames": len(self._frames),
+            "index": index_offset,
+            "regions": [region.to_json() for region in self.regions],
+        })
+
+        footer_data = json.dumps(footer).encode()
+        footer_offset = self._fout.tell()
+        self._fout.write(footer_data)
+        self._fout.write(TRAILER.pack(footer_offset, len(footer_data), MAGIC))
+        self._fout.close()
+
+
+class DumpFile:
+    """Read access to a dump written by DumpWriter"""
+
+    @staticmethod
+    def open(filename: str) -> 'DumpFile':
+        return DumpFile(filename)
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._fin: BinaryIO = open(filename, "rb")
+        try:
+            self.footer: dict[str, Any] = self._read_footer()
+        except BaseException:
+            self._fin.close()
+            raise
+
+        self.compression: str = self.footer["compression"]
+        self.regions = [MemoryRegion.from_json(js) for js in self.footer["regions"]]
+        self._decompress = decompressor(self.compression)
+
+        self.frames: npt.NDArray[Any]
+        if self.footer["frames"] == 0:
+            self.frames = np.zeros(0, dtype=FRAME_DTYPE)
+        else:
+            self.frames = np.memmap(filename, dtype=FRAME_DTYPE, mode="r",
+                                    offset=self.footer["index"], shape=(self.footer["frames"],))
+
+        self._frame_cache: OrderedDict[int, bytes] = OrderedDict()
+
+    def _read_footer(self) -> dict[str, Any]:
+        if self._fin.read(len(MAGIC)) != MAGIC:
+            raise Exception("{}: not a procmem dump".format(self.filename))
+
+        if os.fstat(self._fin.fileno()).st_size < len(MAGIC) + TRAILER.size:
+            raise Exception("{}: truncated or incomplete dump".format(self.filename))
+        self._fin.seek(-TRAILER.size, 2)
+        footer_offset, footer_length, magic = TRAILER.unpack(self._fin.read(TRAILER.size))
+        if magic != MAGIC:
+            raise Exception("{}: truncated or incomplete dump".format(self.filename))
+        self._fin.seek(footer_offset)
+        footer: dict[str, Any] = json.loads(self._fin.read(footer_length))
+        return footer
+
+    def __enter__(self) -> 'DumpFile':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._fin.close()
+
+    def read_frame(self, idx: int) -> bytes:
+        """Return the decompressed memory of frame 'idx'"""
+        data = self._frame_cache.get(idx)
+        if data is not None:
+            self._frame_cache.move_to_end(idx)
+            return data
+
+        _, length, offset, size = (int(x) for x in self.frames[idx].tolist())
+        if size == 0:
+            data = bytes(length)
+        elif size == length:
+            self._fin.seek(offset)
+            data = self._fin.read(size)
+        else:
+            self._fin.seek(offset)
+            data = self._decompress(self._fin.read(size))
+
+        self._frame_cache[idx] = data
+        if len(self._frame_cache) > FRAME_CACHE_SIZE:
+            self._frame_cache.popitem(last=False)
+        return data
+
+    def read(self, start: int, end: int) -> bytes:
+        """Return the memory in [start, end), bytes that weren't
+        dumped read as zeros"""
+        result = bytearray(end - start)
+        addrs = self.frames["addr"]
+        idx = max(0, int(np.searchsorted(addrs, start, side="right")) - 1)
+        while idx < len(self.frames):
+            frame_addr, frame_length = int(addrs[idx]), int(self.frames["length"][idx])
+            if frame_addr >= end:
+                break
+            beg, stop = max(start, frame_addr), min(end, frame_addr + frame_length)
+            if beg < stop:
+                result[beg - start:stop - start] = self.read_frame(idx)[beg - frame_addr:stop - frame_addr]
+            idx += 1
+        return bytes(result)
+
+
+def _chain(future: 'Future[Any]', executor: Executor, func: Callable[[Any], Any]) -> 'Future[Any]':
+    """Run 'func' on the result of 'future' in 'executor' as soon as it
+    is available and return a future for its result"""
+    result: Future[Any] = Future()
+
+    def done(fut: 'Future[Any]') -> None:
+        if fut.exception() is not None:
+            result.set_exception(fut.exception())
+        else:
+            result.set_result(fut.result())
+
+    def submit(fut: 'Future[Any]') -> None:
+        try:
+            if fut.exception() is not None:
+                result.set_exception(fut.exception())
+            else:
+                executor.submit(func, fut.result()).add_done_callback(done)
+        except RuntimeError as err:
+            # the executor was shut down after an error elsewhere
+            result.set_exception(err)
+
+    future.add_done_callback(submit)
+    return result
+
+
+def write_dump(pid: int, ranges: Iterable[tuple[int, int]], writer: DumpWriter,
+               readers: int = DEFAULT_READERS, compressors: Optional[int] = None,
+               chunk_size: int = DUMP_CHUNK_SIZE) -> int:
+    """Dump the memory ranges of process 'pid' into 'writer' with a
+    pipeline of 'readers' threads reading chunks, 'compressors' threads
+    compressing them and the calling thread writing the frames in
+    address order. Returns the number of bytes dumped."""
+    compress = compressor(writer.compression, writer.level)
+
+    def compress_frame(data: bytes) -> bytes:
+        if data.count(0) == len(data):
+            return b""
+        payload = compress(data)
+        return payload if len(payload) < len(data) else data
+
+    def compress_frames(frames: list[tuple[int, bytes]]) -> list[tuple[int, int, bytes]]:
+        return [(addr, len(data), compress_frame(data)) for addr, data in frames]
+
+    # the chunks waiting to be written are bounded, so that reading
+    # doesn't run away from a slow disk
+    max_pending = 2 * (readers + (compressors or os.cpu_count() or 1))
+
+    fd = os.open(os.path.join("/proc", str(pid), "mem"), os.O_RDONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=readers) as read_executor, \
+             ThreadPoolExecutor(max_workers=compressors) as compress_executor:
+            pending: deque[Future[list[tuple[int, int, bytes]]]] = deque()
+
+            def write_next() -> None:
+                for addr, length, payload in pending.popleft().result():
+                    writer.add(addr, length, payload)
+
+            for start, end in split_chunks(ranges, chunk_size):
+                if len(pending) >= max_pending:
+                    write_next()
+                read = read_executor.submit(read_frames, fd, start, end)
+                pending.append(_chain(read, compress_executor, compress_frames))
+
+            while pending:
+                write_next()
+    finally:
+        os.close(fd)
+
+    return writer.length
+
+
+# EOF #
@@ -0,0 +1,316 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Callable, Optional
+
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory import Memory
+from procmem.memory_region import RegionTable
+
+
+ELF_MAGIC = b"\x7fELF"
+
+SHT_SYMTAB = 2
+SHT_DYNSYM = 11
+PT_LOAD = 1
+STT_OBJECT = 1
+STT_FUNC = 2
+SHN_UNDEF = 0
+
+# (header fields, section header, program header, symbol) layouts for ELFCLASS32 and ELFCLASS64
+_HEADER_FORMATS = {
+    1: ("16xHHIIIIIHHHHHH",
+        [("name", "u4"), ("type", "u4"), ("flags", "u4"), ("addr", "u4"), ("offset", "u4"),
+         ("size", "u4"), ("link", "u4"), ("info", "u4"), ("addralign", "u4"), ("entsize", "u4")],
+        [("type", "u4"), ("offset", "u4"), ("vaddr", "u4"), ("paddr", "u4"), ("filesz", "u4"),
+         ("memsz", "u4"), ("flags", "u4"), ("align", "u4")],
+        [("name", "u4"), ("value", "u4"), ("size", "u4"), ("info", "u1"), ("other", "u1"), ("shndx", "u2")]),
+    2: ("16xHHIQQQIHHHHHH",
+        [("name", "u4"), ("type", "u4"), ("flags", "u8"), ("addr", "u8"), ("offset", "u8"),
+         ("size", "u8"), ("link", "u4"), ("info", "u4"), ("addralign", "u8"), ("entsize", "u8")],
+        [("type", "u4"), ("flags", "u4"), ("offset", "u8"), ("vaddr", "u8"), ("paddr", "u8"),
+         ("filesz", "u8"), ("memsz", "u8"), ("align", "u8")],
+        [("name", "u4"), ("info", "u1"), ("other", "u1"), ("shndx", "u2"), ("value", "u8"), ("size", "u8")]),
+}
+
+
+def _structured(fields: list[tuple[str, str]], byteorder: str) -> 'np.dtype[Any]':
+    return np.dtype([(name, byteorder + kind) for name, kind in fields])
+
+
+class SymbolTable:
+    """The function and object symbols of an ELF file sorted by
+    address, along with the PT_LOAD segments needed to translate file
+    offsets into symbol addresses"""
+
+    @staticmethod
+    def from_file(filename: str) -> 'SymbolTable':
+        with open(filename, "rb") as fin:
+            if os.fstat(fin.fileno()).st_size == 0:
+                return SymbolTable.empty()
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return SymbolTable.from_bytes(data)
+
+    @staticmethod
+    def from_bytes(data: Any) -> 'SymbolTable':
+        if len(data) < 64 or data[:4] != ELF_MAGIC or data[4] not in _HEADER_FORMATS or data[5] not in (1, 2):
+            return SymbolTable.empty()
+
+        header_format, section_fields, segment_fields, symbol_fields = _HEADER_FORMATS[data[4]]
+        byteorder = "<" if data[5] == 1 else ">"
+        (_, _, _, _, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum, _) = \
+            struct.unpack_from(byteorder + header_format, data, 0)
+
+        section_dtype = _structured(section_fields, byteorder)
+        segment_dtype = _structured(segment_fields, byteorder)
+        symbol_dtype = _structured(symbol_fields, byteorder)
+        if shentsize != section_dtype.itemsize or (phnum and phentsize != segment_dtype.itemsize):
+            return SymbolTable.empty()
+
+        segments = np.frombuffer(data, dtype=segment_dtype, count=phnum, offset=phoff)
+        loads = segments[segments["type"] == PT_LOAD]
+        sections = np.frombuffer(data, dtype=section_dtype, count=shnum, offset=shoff)
+
+        values: list[npt.NDArray[np.uint64]] = []
+        sizes: list[npt.NDArray[np.uint64]] = []
+        names: list[bytes] = []
+        # .symtab comes first, so its names win over the .dynsym duplicates
+        for section_type in (SHT_SYMTAB, SHT_DYNSYM):
+            for section in sections[sections["type"] == section_type]:
+                strtab = sections[section["link"]]
+                symbols = np.frombuffer(data, dtype=symbol_dtype,
+                                        count=int(section["size"]) // symbol_dtype.itemsize,
+                                        offset=int(section["offset"]))
+                kind = symbols["info"] & 0xf
+                symbols = symbols[((kind == STT_FUNC) | (kind == STT_OBJECT)) &
+                                  (symbols["shndx"] != SHN_UNDEF) & (symbols["value"] != 0)]
+
+                strtab_beg = int(strtab["offset"])
+                strtab_end = strtab_beg + int(strtab["size"])
+                for name_offset in symbols["name"].tolist():
+                    beg = strtab_beg + name_offset
+                    end = data.find(b"\0", beg, strtab_end)
+                    names.append(data[beg:end if end >= 0 else strtab_end])
+                values.append(symbols["value"].astype(np.uint64))
+                sizes.append(symbols["size"].astype(np.uint64))
+
+        if not names:
+            return SymbolTable(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64),
+                               np.zeros(1, dtype=np.int64), b"", loads)
+
+        all_values = np.concatenate(values)
+        all_sizes = np.concatenate(sizes)
+        # np.unique keeps the first occurrence of each address and sorts them
+        all_values, first = np.unique(all_values, return_index=True)
+        name_list = [names[idx] for idx in first.tolist()]
+        name_offsets = np.cumsum([0] + [len(name) for name in name_list], dtype=np.int64)
+        return SymbolTable(all_values, all_sizes[first], name_offsets, b"".join(name_list), loads)
+
+    @staticmethod
+    def empty() -> 'SymbolTable':
+        return SymbolTable(np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64),
+                           np.zeros(1, dtype=np.int64), b"", None)
+
+    @staticmethod
+    def load(filename: str) -> 'SymbolTable':
+        with np.load(filename) as npz:
+            return SymbolTable(npz["values"], npz["sizes"], npz["name_offsets"], npz["names"].tobytes(),
+                               None, npz["load_offsets"], npz["load_vaddrs"], npz["load_sizes"])
+
+    def __init__(self, values: npt.NDArray[np.uint64], sizes: npt.NDArray[np.uint64],
+                 name_offsets: npt.NDArray[np.int64], names: bytes,
+                 loads: Optional[npt.NDArray[Any]],
+                 load_offsets: Optional[npt.NDArray[np.uint64]] = None,
+                 load_vaddrs: Optional[npt.NDArray[np.uint64]] = None,
+                 load_sizes: Optional[npt.NDArray[np.uint64]] = None) -> None:
+        self.values = values
+        self.sizes = sizes
+        # the names are kept in a single blob, so loading a cached table
+        # doesn't create a Python object per symbol
+        self.name_offsets = name_offsets
+        self.names = names
+
+        if loads is not None:
+            self.load_offsets = loads["offset"].astype(np.uint64)
+            self.load_vaddrs = loads["vaddr"].astype(np.uint64)
+            self.load_sizes = loads["filesz"].astype(np.uint64)
+        else:
+            empty = np.zeros(0, dtype=np.uint64)
+            self.load_offsets = load_offsets if load_offsets is not None else empty
+            self.load_vaddrs = load_vaddrs if load_vaddrs is not None else empty
+            self.load_sizes = load_sizes if load_sizes is not None else empty
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def save(self, filename: str) -> None:
+        # written to a temporary file first, so concurrent readers never see a partial table
+        tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+        with open(tmp_filename, "wb") as fout:
+            np.savez(fout, values=self.values, sizes=self.sizes, name_offsets=self.name_offsets,
+                     names=np.frombuffer(self.names, dtype=np.uint8),
+                     load_offsets=self.load_offsets, load_vaddrs=self.load_vaddrs, load_sizes=self.load_sizes)
+        os.replace(tmp_filename, filename)
+
+    def name(self, idx: int) -> str:
+        return self.names[int(self.name_offsets[idx]):int(self.name_offsets[idx + 1])].decode(errors="replace")
+
+    def file_offset_to_vaddr(self, offsets: npt.NDArray[np.uint64]) -> npt.NDArray[np.uint64]:
+        """Translate file offsets into the addresses used by the
+        symbols, offsets outside of all PT_LOAD segments are kept"""
+        result = offsets.copy()
+        for beg, vaddr, size in zip(self.load_offsets.tolist(), self.load_vaddrs.tolist(),
+                                    self.load_sizes.tolist()):
+            inside = (offsets >= beg) & (offsets < beg + size)
+            result[inside] = offsets[inside] - np.uint64(beg) + np.uint64(vaddr)
+        return result
+
+    def lookup(self, vaddrs: npt.NDArray[np.uint64]) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.uint64]]:
+        """Return the index of the symbol containing each address, -1
+        for none, and the offset of the address into it"""
+        vaddrs = np.asarray(vaddrs, dtype=np.uint64)
+        if len(self.values) == 0:
+            return np.full(len(vaddrs), -1, dtype=np.intp), np.zeros(len(vaddrs), dtype=np.uint64)
+
+        idx = np.searchsorted(self.values, vaddrs, side="right") - 1
+        clamped = np.maximum(idx, 0)
+        offsets = vaddrs - self.values[clamped]
+        # symbols without a size cover everything up to the next one
+        sizes = self.sizes[clamped]
+        found = (idx >= 0) & ((sizes == 0) | (offsets < sizes))
+        return np.where(found, idx, -1), offsets
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "procmem", "symbols")
+
+
+class Symbolizer:
+    """Resolves addresses to 'symbol+offset' using the ELF symbol
+    tables of the files mapped by a process. Parsed tables are cached
+    in 'cache_dir' keyed by the device, inode and mtime of the file,
+    so later runs only have to bisect.
+
+    With a 'pid' the files are opened through /proc/$PID/root, so that
+    processes in another mount namespace, such as containers, get
+    their own files, and through /proc/$PID/map_files when the file
+    can't be found that way, e.g. because it was replaced or deleted."""
+
+    def __init__(self, regions: RegionTable, cache_dir: Optional[str] = None, pid: Optional[int] = None) -> None:
+        self.regions = regions
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.pid = pid
+        self.root = os.path.join("/proc", str(pid), "root") if pid is not None else "/"
+        self._tables: dict[str, SymbolTable] = {}
+
+    def _filenames(self, idx: int) -> list[str]:
+        """Return the places where the file mapped by region 'idx' can be found"""
+        pathname = self.regions.pathnames[int(self.regions.path_idx[idx])]
+        filenames = [os.path.join(self.root, pathname.lstrip("/"))]
+        if self.pid is not None:
+            filenames.append(os.path.join("/proc", str(self.pid), "map_files", "{:x}-{:x}".format(
+                int(self.regions.addr_beg[idx]), int(self.regions.addr_end[idx]))))
+        return filenames
+
+    def table(self, idx: int) -> SymbolTable:
+        """Return the symbols of the file mapped by region 'idx', only
+        files that are still the inode that was mapped are used"""
+        pathname = self.regions.pathnames[int(self.regions.path_idx[idx])]
+        table = self._tables.get(pathname)
+        if table is not None:
+            return table
+
+        table = SymbolTable.empty()
+        for filename in self._filenames(idx):
+            try:
+                st = os.stat(filename)
+                if st.st_ino == int(self.regions.inode[idx]):
+                    table = self._load_cached(filename, st)
+                    break
+            except (OSError, ValueError, IndexError) as err:
+                logging.debug("%s: failed to read symbols: %s", filename, err)
+
+        self._tables[pathname] = table
+        return table
+
+    def _load_cached(self, filename: str, st: os.stat_result) -> SymbolTable:
+        cache_file = os.path.join(self.cache_dir, "{:x}-{:x}-{:x}.npz".format(st.st_dev, st.st_ino, st.st_mtime_ns))
+        try:
+            return SymbolTable.load(cache_file)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        table = SymbolTable.from_file(filename)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            table.save(cache_file)
+        except OSError as err:
+            logging.debug("%s: failed to cache symbols: %s", cache_file, err)
+        return table
+
+    def symbolize(self, addrs: npt.NDArray[np.uint64]) -> list[Optional[str]]:
+        """Return 'symbol+offset' for each address, None for addresses
+        outside of file mappings or without a symbol"""
+        addrs = np.asarray(addrs, dtype=np.uint64)
+        result: list[Optional[str]] = [None] * len(addrs)
+
+        region_idx = self.regions.locate(addrs)
+        file_backed = (region_idx >= 0) & (self.regions.inode[np.maximum(region_idx, 0)] != 0)
+        if not file_backed.any():
+            return result
+
+        # all addresses within files of the same pathname are looked up at once
+        path_idx = self.regions.path_idx[region_idx[file_backed]]
+        positions = np.flatnonzero(file_backed)
+        for path in np.unique(path_idx).tolist():
+            selected = positions[path_idx == path]
+            regions = region_idx[selected]
+            table = self.table(int(regions[0]))
+            if len(table) == 0:
+                continue
+
+            file_offsets = addrs[selected] - self.regions.addr_beg[regions] + self.regions.offset[regions]
+            symbol_idx, offsets = table.lookup(table.file_offset_to_vaddr(file_offsets))
+            for pos, idx, offset in zip(selected.tolist(), symbol_idx.tolist(), offsets.tolist()):
+                if idx >= 0:
+                    result[pos] = "{}+0x{:x}".format(table.name(idx), offset)
+        return result
+
+    def annotate(self, addr: int) -> str:
+        """Like RegionTable.annotate(), followed by the symbol if there is one"""
+        text = self.regions.annotate(addr)
+        symbol = self.symbolize(np.array([addr], dtype=np.uint64))[0]
+        return text if symbol is None else "{} {}".format(text, symbol)
+
+
+def address_annotator(mem: Memory, symbols: bool = False) -> Callable[[int], str]:
+    """Return a function describing addresses of 'mem', optionally with their symbol"""
+    if symbols:
+        return Symbolizer(mem.regions(), pid=mem.pid).annotate
+    else:
+        return mem.annotate
+
+
+# EOF #
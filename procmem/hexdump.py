@@ -15,17 +15,29 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import IO
+from typing import IO, Iterable, Sequence, Union
 
 import string
+from functools import lru_cache
+
+import numpy as np
+import numpy.typing as npt
 
 from procmem.itertools import chunk_iter
 
 
 PRINTABLE_CHARS = set([ord(c) for c in string.digits + string.ascii_letters + string.punctuation])
 
+# Number of rows rendered and written at once
+HEX_BLOCK_ROWS = 16384
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+# the character shown in the ASCII column for every byte value
+_ASCII_TABLE = bytes(i if i in PRINTABLE_CHARS else ord(".") for i in range(256))
+
 
-def write_hex(fout: IO[str], buf: bytes, offset: int, width: int = 16) -> None:
+def write_hex(fout: IO[str], buf: Union[bytes, bytearray], offset: int, width: int = 16) -> None:
     """Write the content of 'buf' out in a hexdump style
 
     Args:
@@ -35,39 +47,141 @@ def write_hex(fout: IO[str], buf: bytes, offset: int, width: int = 16) -> None:
         width: how many bytes should be displayed per row
     """
 
+    write_hex_chunks(fout, [(offset, buf)], width)
+
+
+def write_hex_chunks(fout: IO[str], chunks: Iterable[tuple[int, Union[bytes, bytearray]]],
+                     width: int = 16) -> None:
+    """Like write_hex(), but for a sequence of consecutive (offset,
+    buffer) tuples as produced by Memory.chunks(). Zero skipping
+    carries over from one buffer to the next. The length of all but
+    the last buffer must be a multiple of 'width'."""
+
     skipped_zeroes = 0
-    for i, chunk in enumerate(chunk_iter(buf, width)):
-        # zero skipping
-        if chunk == (b"\x00" * width):
-            skipped_zeroes += 1
-            continue
-        elif skipped_zeroes != 0:
-            fout.write("  -- skipped zeroes: {}\n".format(skipped_zeroes))
-            skipped_zeroes = 0
-
-        # starting address of the current line
-        fout.write("{:016x}  ".format(i * width + offset))
-
-        # bytes column
-        column = "  ".join([" ".join(["{:02x}".format(c) for c in subchunk])
-                            for subchunk in chunk_iter(chunk, 8)])
-        w = width * 2 + (width - 1) + ((width // 8) - 1)
-        if len(column) != w:
-            column += " " * (w - len(column))
-        fout.write(column)
-
-        # ASCII character column
-        fout.write("  |")
-        for c in chunk:
-            if c in PRINTABLE_CHARS:
-                fout.write(chr(c))
-            else:
-                fout.write(".")
-        if len(chunk) < width:
-            fout.write(" " * (width - len(chunk)))
-        fout.write("|")
-
-        fout.write("\n")
+    for offset, buf in chunks:
+        data = np.frombuffer(buf, dtype=np.uint8)
+        full = len(data) - len(data) % width
+        for beg in range(0, full, HEX_BLOCK_ROWS * width):
+            end = min(full, beg + HEX_BLOCK_ROWS * width)
+            skipped_zeroes = _write_hex_rows(fout, data[beg:end].reshape(-1, width), offset + beg, skipped_zeroes)
+
+        # a partial row never counts as zeroes
+        if full < len(data):
+            if skipped_zeroes != 0:
+                fout.write("  -- skipped zeroes: {}\n".format(skipped_zeroes))
+                skipped_zeroes = 0
+            _write_hex_row(fout, data[full:].tolist(), offset + full, width)
+
+
+class _HexLayout:
+    """A full hexdump row of 'width' bytes as a structured dtype, so that
+    the columns of many rows can be filled in with one assignment each"""
+
+    def __init__(self, width: int) -> None:
+        groups = [(beg, min(width, beg + 8)) for beg in range(0, width, 8)]
+
+        # the output of bytes.hex(" ") with a trailing space, cut into groups of 8 bytes
+        self.source = np.dtype([(name, "S{}".format(size))
+                                for idx, (beg, end) in enumerate(groups)
+                                for name, size in [("g{}".format(idx), 3 * (end - beg) - 1),
+                                                   ("s{}".format(idx), 1)]])
+
+        # address, two spaces, bytes column, "  |", ASCII column, "|\n"
+        fields = [("address", "S16")]
+        for idx, (beg, end) in enumerate(groups):
+            fields += [("s{}".format(idx), "S2"), ("g{}".format(idx), "S{}".format(3 * (end - beg) - 1))]
+        fields += [("ascii_beg", "S3"), ("ascii", "S{}".format(width)), ("ascii_end", "S2")]
+        self.row = np.dtype(fields)
+        self.groups = len(groups)
+
+
+@lru_cache(maxsize=None)
+def _hex_layout(width: int) -> _HexLayout:
+    return _HexLayout(width)
+
+
+def _write_hex_rows(fout: IO[str], rows: npt.NDArray[np.uint8], offset: int, skipped_zeroes: int) -> int:
+    """Write the full rows of a block at once, returns the number of
+    zero rows not yet reported"""
+    count, width = (int(x) for x in rows.shape)
+    if width % 8 == 0:
+        nonzero = np.flatnonzero(rows.view(np.uint64).any(axis=1))
+    else:
+        nonzero = np.flatnonzero(np.count_nonzero(rows, axis=1))
+    if len(nonzero) == 0:
+        return skipped_zeroes + count
+
+    rows = rows[nonzero]
+    text = _render_hex_rows(rows, np.uint64(offset) + nonzero.astype(np.uint64) * np.uint64(width))
+    length = _hex_layout(width).row.itemsize
+
+    # the text layer is bypassed when writing to a real file
+    buffer = getattr(fout, "buffer", None)
+    if buffer is not None:
+        fout.flush()
+
+    def write(data: Union[bytes, memoryview]) -> None:
+        if buffer is not None:
+            buffer.write(data)
+        else:
+            fout.write(str(data, "ascii"))
+
+    # a skipped zeroes line goes in front of every row following a run of zero rows
+    gaps = np.diff(nonzero, prepend=-1) - 1
+    gaps[0] += skipped_zeroes
+    pos = 0
+    for idx in np.flatnonzero(gaps).tolist():
+        write(text[pos:idx * length])
+        write("  -- skipped zeroes: {}\n".format(gaps[idx]).encode())
+        pos = idx * length
+    write(text[pos:])
+
+    return count - 1 - int(nonzero[-1])
+
+
+def _render_hex_rows(rows: npt.NDArray[np.uint8], addrs: npt.NDArray[np.uint64]) -> memoryview:
+    count, width = rows.shape
+    layout = _hex_layout(width)
+    data = rows.tobytes()
+
+    # bytes.hex() does the formatting, the result is only cut into
+    # columns, the big endian address bytes give its digits in order
+    digits = np.frombuffer((data.hex(" ") + " ").encode(), dtype=layout.source)
+    out = np.empty(count, dtype=layout.row)
+    out["address"] = np.frombuffer(addrs.astype(">u8").tobytes().hex().encode(), dtype="S16")
+    for group in range(layout.groups):
+        out["s{}".format(group)] = b"  "
+        out["g{}".format(group)] = digits["g{}".format(group)]
+    out["ascii_beg"] = b"  |"
+    out["ascii"] = np.frombuffer(data.translate(_ASCII_TABLE), dtype="S{}".format(width))
+    out["ascii_end"] = b"|\n"
+    return memoryview(out.view(np.uint8).data)
+
+
+def _write_hex_row(fout: IO[str], chunk: Sequence[int], address: int, width: int) -> None:
+    # starting address of the current line
+    fout.write("{:016x}  ".format(address))
+
+    # bytes column
+    column = "  ".join([" ".join(["{:02x}".format(c) for c in subchunk])
+                        for subchunk in chunk_iter(chunk, 8)])
+    w = width * 2 + (width - 1) + ((width // 8) - 1)
+    if len(column) != w:
+        column += " " * (w - len(column))
+    fout.write(column)
+
+    # ASCII character column
+    fout.write("  |")
+    for c in chunk:
+        if c in PRINTABLE_CHARS:
+            fout.write(chr(c))
+        else:
+            fout.write(".")
+    if len(chunk) < width:
+        fout.write(" " * (width - len(chunk)))
+    fout.write("|")
+
+    fout.write("\n")
 
 
 # EOF #
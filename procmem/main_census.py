@@ -0,0 +1,57 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import sys
+
+import bytefmt
+
+from procmem.census import CENSUS_FIELDS, take_census
+from procmem.process import list_pids, select_pids
+
+
+def main_census(pid: int, args: argparse.Namespace) -> None:
+    if args.match is not None or args.pids:
+        pids = select_pids(args.match, args.pids)
+    else:
+        pids = list_pids()
+
+    census = take_census(pids, args.jobs)
+    entries = census.sorted_entries(args.sort, args.limit)
+
+    if args.json:
+        json.dump({"processes": len(census.pids),
+                   "skipped": len(pids) - len(census.pids),
+                   "entries": [entry.to_json() for entry in entries]},
+                  sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    print("".join("{:>10}  ".format(field.upper()) for field in CENSUS_FIELDS) +
+          "{:>6}  {}".format("PROCS", "PATHNAME"))
+    for entry in entries:
+        print("".join("{:>10}  ".format(bytefmt.humanize(value, style="binary")) for value in entry.values) +
+              "{:>6}  {}".format(len(entry.pids), entry.pathname))
+    print("-" * 72)
+    print("".join("{:>10}  ".format(bytefmt.humanize(value, style="binary")) for value in census.totals()) +
+          "{:>6}  {}".format(len(census.pids), "TOTAL"))
+    if len(census.pids) < len(pids):
+        print("{} processes skipped, they exited or can't be accessed".format(len(pids) - len(census.pids)))
+
+
+# EOF #
@@ -0,0 +1,76 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+
+from procmem.diff import SnapshotDiff, diff_live, diff_snapshots
+from procmem.memory import ProcessVmMemory
+from procmem.memory_region import filter_memory_maps
+from procmem.snapshot import Snapshot
+
+
+def format_preview(data: bytes, length: int) -> str:
+    text = data.hex(" ")
+    if length > len(data):
+        text += " ..."
+    return text
+
+
+def print_diff(diff: SnapshotDiff, summary: bool) -> None:
+    for region in diff.vanished:
+        print("- {}".format(region))
+    for region in diff.appeared:
+        print("+ {}".format(region))
+    if diff.vanished or diff.appeared:
+        print()
+
+    if not summary and diff.runs:
+        for beg, end, old, new in diff.runs:
+            print("{:016x}-{:016x}  {:>8}  {}  ->  {}".format(
+                beg, end, end - beg, format_preview(old, end - beg), format_preview(new, end - beg)))
+        print()
+
+    for region, pages, count in diff.region_changes():
+        print("{:>8} pages  {:>10} bytes changed  {}".format(pages, count, region))
+
+    print("{} pages compared, {} changed, {} bytes changed, {} only in old, {} only in new".format(
+        diff.compared_pages, len(diff.changed_pages), diff.changed_bytes(),
+        diff.old_only_pages, diff.new_only_pages))
+
+
+def main_diff(pid: int, args: argparse.Namespace) -> None:
+    with Snapshot.open(args.OLD) as old:
+        old_regions = filter_memory_maps(args, old.regions)
+
+        if args.NEW is not None:
+            with Snapshot.open(args.NEW) as new:
+                new_regions = filter_memory_maps(args, new.regions)
+                diff = diff_snapshots(old, new, old_regions, new_regions)
+        else:
+            # compare against the process the snapshot was taken from
+            # unless one is given explicitly
+            if args.pid is None and args.process is None and "pid" in old.footer:
+                pid = old.footer["pid"]
+
+            with ProcessVmMemory.from_pid(pid) as mem:
+                new_regions = filter_memory_maps(args, mem.regions())
+                diff = diff_live(old, mem, old_regions, new_regions, args.resident_only)
+
+    print_diff(diff, args.summary)
+
+
+# EOF #
@@ -21,7 +21,8 @@ import sys
 
 import bytefmt
 
-from procmem.memory_region import MemoryRegion, filter_memory_maps
+from procmem.memory_region import RegionTable, filter_memory_maps
+from procmem.process import print_process_table, read_comm, read_smaps_rollup, sample, select_pids
 
 
 vmflags_to_doc = {
@@ -56,14 +57,24 @@ vmflags_to_doc = {
 }
 
 
+# smaps_rollup counters printed for each process
+ROLLUP_FIELDS = ["Rss", "Pss", "Swap"]
+
+
 def main_info(pid: int, args: argparse.Namespace) -> None:
-    if args.raw:
+    if args.match is not None or args.pids:
+        def rollup(pid: int) -> tuple[str, list[int]]:
+            totals = read_smaps_rollup(pid)
+            return read_comm(pid), [totals.get(field, 0) for field in ROLLUP_FIELDS]
+
+        print_process_table([field.upper() for field in ROLLUP_FIELDS],
+                            sample(select_pids(args.match, args.pids), rollup, args.jobs))
+    elif args.raw:
         filename = os.path.join("/proc", str(pid), "smaps")
         with open(filename, "r") as fin:
             sys.stdout.write(fin.read())
     else:
-        infos = MemoryRegion.regions_from_pid(pid)
-        infos = filter_memory_maps(args, infos)
+        infos = filter_memory_maps(args, RegionTable.from_pid(pid))
         total = 0
         for info in infos:
             total += info.length()
@@ -82,5 +93,11 @@ def main_info(pid: int, args: argparse.Namespace) -> None:
         print("-" * 72)
         print("Total: {} - {} bytes".format(bytefmt.humanize(total, style="binary"), total))
 
+        # the process wide counters come from smaps_rollup, so the
+        # smaps of the individual regions don't have to be parsed
+        totals = read_smaps_rollup(pid)
+        print("  ".join("{}: {}".format(field, bytefmt.humanize(totals.get(field, 0), style="binary"))
+                        for field in ROLLUP_FIELDS))
+
 
 # EOF #
@@ -16,12 +16,13 @@
 
 
 import argparse
-import psutil
+
+from procmem.process import scan_processes
 
 
 def main_list(pid: int, args: argparse.Namespace) -> None:
-    for p in psutil.process_iter():
-        print("{:5d}  {}".format(p.pid, p.name()))
+    for process in scan_processes():
+        print("{:5d}  {}".format(process.pid, process.full_name()))
 
 
 # EOF #
@@ -15,46 +15,128 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import Optional
+from typing import BinaryIO, Iterator, Optional
 
 import argparse
+import os
 import sys
 import logging
 from contextlib import ExitStack
 
-import PIL.Image
 import bytefmt
 
-from procmem.memory import Memory
-from procmem.memory_region import filter_memory_maps
-from procmem.hexdump import write_hex
+from procmem.coredump import write_core
+from procmem.dump import DumpWriter, write_dump
+from procmem.memory import Memory, DEFAULT_CHUNK_SIZE
+from procmem.memory_region import MemoryRegion, filter_memory_maps
+from procmem.overview import write_overview
+from procmem.pagemap import PAGE_SIZE
+from procmem.png import PngWriter
+from procmem.hexdump import write_hex_chunks
 
 
 def make_outfile(template: str, addr: int) -> str:
     return "{}-{:016x}".format(template, addr)
 
 
+def hex_chunk_size(width: int) -> int:
+    """Round the chunk size down to whole hexdump rows"""
+    return max(width, DEFAULT_CHUNK_SIZE - DEFAULT_CHUNK_SIZE % width)
+
+
+def read_chunks(mem: Memory, start: int, end: int, resident_only: bool,
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[tuple[int, bytearray]]:
+    """Like Memory.chunks(), but optionally skipping pages that aren't resident"""
+    for beg, stop in mem.ranges(start, end, resident_only):
+        yield from mem.chunks(beg, stop, chunk_size)
+
+
+def write_chunks(fout: BinaryIO, chunks: Iterator[tuple[int, bytearray]],
+                 start: int, end: int, base: int) -> Iterator[tuple[int, bytearray]]:
+    """Write the chunks of [start, end) to 'fout' at file position
+    'base' plus their offset, skipped pages become holes in the file.
+    The chunks are passed on to the caller."""
+    for addr, chunk in chunks:
+        fout.seek(base + addr - start)
+        fout.write(chunk)
+        yield addr, chunk
+
+    # make sure trailing holes are part of the file
+    fout.seek(base + end - start)
+    if fout.tell() > os.fstat(fout.fileno()).st_size:
+        fout.truncate()
+
+
 def main_read(pid: int, args: argparse.Namespace) -> None:
     total_length = 0
 
-    chunk: Optional[bytes] = None
-    if args.range is not None:
+    if args.compress is not None:
+        if args.outfile is None:
+            raise Exception("--compress requires --outfile")
+
+        with Memory.from_pid(pid) as mem:
+            if args.range is not None:
+                pieces, gaps = mem.regions().split_range(args.range.start, args.range.stop)
+                for beg, end in gaps:
+                    logging.warning("%016x-%016x: not mapped", beg, end)
+                dump_regions = [region for region in mem.regions() if region.addr_beg < args.range.stop
+                                and args.range.start < region.addr_end]
+            else:
+                dump_regions = list(filter_memory_maps(args, mem.regions()))
+                pieces = [(region.addr_beg, region.addr_end) for region in dump_regions]
+
+            # the resident pages are looked up up front, the pipeline only reads
+            ranges = [rng for beg, end in pieces for rng in mem.ranges(beg, end, args.resident_only)]
+
+            print("writing to {}".format(args.outfile))
+            with DumpWriter(args.outfile, dump_regions, args.compress, args.level, meta={"pid": pid}) as writer:
+                total_length = write_dump(pid, ranges, writer, args.readers, args.jobs or None)
+            print("compressed to {}".format(bytefmt.humanize(writer.size, style="binary")))
+    elif args.range is not None:
         with Memory.from_pid(pid) as mem:
-            chunk = mem.read(args.range.start, args.range.stop)
-            assert chunk is not None
+            # ranges spanning several regions are read region by
+            # region, the unmapped gaps in between are skipped
+            pieces, gaps = mem.regions().split_range(args.range.start, args.range.stop)
+            for beg, end in gaps:
+                logging.warning("%016x-%016x: not mapped", beg, end)
 
             if args.outfile is not None:
-                with open(args.outfile, 'wb') as fout:
-                    total_length += len(chunk)
-                    fout.write(chunk)
+                with open(args.outfile, 'wb') as range_fout:
+                    for beg, end in pieces:
+                        chunks = read_chunks(mem, beg, end, args.resident_only)
+                        for addr, chunk in write_chunks(range_fout, chunks, beg, end, beg - args.range.start):
+                            total_length += len(chunk)
+
+                    # gaps at the end become holes as well
+                    range_fout.truncate(len(args.range))
             else:
-                write_hex(sys.stdout, chunk, args.range.start, args.width)
+                def range_chunks() -> Iterator[tuple[int, bytearray]]:
+                    nonlocal total_length
+                    for beg, end in pieces:
+                        try:
+                            for addr, chunk in read_chunks(mem, beg, end, args.resident_only,
+                                                           hex_chunk_size(args.width)):
+                                total_length += len(chunk)
+                                yield addr, chunk
+                        except (OSError, OverflowError) as err:
+                            logging.warning("%016x-%016x: failed to read: %s", beg, end, err)
+
+                write_hex_chunks(sys.stdout, range_chunks(), args.width)
+    elif args.core is not None:
+        with Memory.from_pid(pid) as mem, open(args.core, "wb") as core_fout:
+            infos = filter_memory_maps(args, mem.regions())
+            print("writing to {}".format(args.core))
+            total_length = write_core(mem, infos, core_fout, PAGE_SIZE, args.resident_only)
+    elif args.overview is not None:
+        with Memory.from_pid(pid) as mem:
+            infos = filter_memory_maps(args, mem.regions())
+            pages = write_overview(mem, infos, args.overview, args.png_width, PAGE_SIZE, args.resident_only)
+            total_length = pages * PAGE_SIZE
     else:
-        fout = None
+        fout: Optional[BinaryIO] = None
         with ExitStack() as stack:
             with Memory.from_pid(pid) as mem:
-                infos = mem.regions()
-                infos = filter_memory_maps(args, infos)
+                infos = filter_memory_maps(args, mem.regions())
 
                 for info in infos:
                     if args.outfile is None:
@@ -73,32 +155,44 @@ def main_read(pid: int, args: argparse.Namespace) -> None:
                     if fout is None:
                         print(info)
 
+                    chunks = read_chunks(mem, info.addr_beg, info.addr_end, args.resident_only,
+                                         hex_chunk_size(args.width))
+                    if fout is not None:
+                        base = info.addr_beg if args.sparse else fout.tell()
+                        chunks = write_chunks(fout, chunks, info.addr_beg, info.addr_end, base)
+
+                    # the image is encoded while reading, one row of --png-width bytes at a time
+                    png: Optional[PngWriter] = None
+
+                    def tally_chunks(chunks: Iterator[tuple[int, bytearray]],
+                                     region: MemoryRegion) -> Iterator[tuple[int, bytearray]]:
+                        nonlocal total_length, png
+                        for addr, chunk in chunks:
+                            total_length += len(chunk)
+                            if args.png is not None:
+                                if png is None:
+                                    png_outfile = make_outfile(args.png, region.addr_beg) + ".png"
+                                    logging.info("writing %s", png_outfile)
+                                    png = PngWriter.open(png_outfile, args.png_width,
+                                                         (region.length() + args.png_width - 1) // args.png_width)
+                                # skipped pages are filled with zeroes
+                                png.skip(addr - region.addr_beg - png.position)
+                                png.write(chunk)
+                            yield addr, chunk
+
                     try:
-                        chunk = None
-                        chunk = mem.read(info.addr_beg, info.addr_end)
+                        if fout is None and args.png is None:
+                            write_hex_chunks(sys.stdout, tally_chunks(chunks, info), args.width)
+                        else:
+                            for _ in tally_chunks(chunks, info):
+                                pass
                     except OverflowError:
                         logging.exception("overflow error: %s", info)
                     except OSError:
                         logging.exception("OS error: %s", info)
-
-                    if chunk is not None:
-                        total_length += len(chunk)
-                        if fout is not None:
-                            if args.sparse:
-                                fout.seek(info.addr_beg)
-                            assert chunk is not None
-                            fout.write(chunk)
-
-                        if fout is None and args.png is None:
-                            write_hex(sys.stdout, chunk, info.addr_beg, args.width)
-
-                        if args.png is not None:
-                            png_outfile = make_outfile(args.png, info.addr_beg) + ".png"
-                            png_height = (len(chunk) + 1024) // 1024
-                            padding = (1024 - len(chunk) % 1024) * b"\00"
-                            img = PIL.Image.frombytes(mode="L", size=(1024, png_height), data=chunk + padding)
-                            logging.info("writing %s", png_outfile)
-                            img.save(png_outfile)
+                    finally:
+                        if png is not None:
+                            png.close()
 
     print("dumped {}".format(bytefmt.humanize(total_length, style="binary")))
 
@@ -15,31 +15,77 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from typing import Iterator, Optional
+
 import argparse
 
+from procmem.elfsym import address_annotator
+from procmem.main_search import search_ranges
 from procmem.memory import Memory
 from procmem.memory_region import filter_memory_maps
-from procmem.pack import text2bytes
-from procmem.main_search import search
+from procmem.multisearch import NeedleSet
+from procmem.pack import typed_text2bytes
+
+
+def read_pairs(args: argparse.Namespace) -> list[tuple[str, str, bool]]:
+    """Collect the (needle, data, from_file) tuples from the command
+    line and from the --pair-file, which contains one tab separated
+    pair per line. Only pairs from the file may carry 'TYPE:' prefixes."""
+    pairs: list[tuple[str, str, bool]] = []
+    if args.NEEDLE is not None:
+        if args.DATA is None:
+            raise Exception("no DATA given for NEEDLE")
+        pairs.append((args.NEEDLE, args.DATA, False))
+
+    pairs += [(needle, data, False) for needle, data in args.pair or []]
+
+    if args.pair_file is not None:
+        with open(args.pair_file, "r") as fin:
+            for line in fin:
+                line = line.rstrip("\n")
+                if line.strip():
+                    needle, sep, data = line.partition("\t")
+                    if not sep:
+                        raise Exception("missing tab in pair: {!r}".format(line))
+                    pairs.append((needle, data, True))
+
+    return pairs
+
+
+def replace_ranges(mem: Memory, ranges: list[tuple[int, int]], needles: NeedleSet,
+                   datas: list[bytes]) -> Iterator[int]:
+    """Replace the matches of 'needles' in 'ranges' with the
+    corresponding 'datas', yields the address of each replacement"""
+    for beg, end in ranges:
+        # collect the matches first, so that replacements can't
+        # feed back into the search of the same range
+        matches = list(search_ranges(mem, [(beg, end)], needles, jobs=1))
+
+        # matches are ordered by address, longest needle first,
+        # skip those overlapping an already replaced needle
+        replaced_end: Optional[int] = None
+        for addr, length, idx in matches:
+            if replaced_end is not None and addr < replaced_end:
+                continue
+            mem.write(addr, datas[idx])
+            replaced_end = addr + length
+            yield addr
 
 
 def main_replace(pid: int, args: argparse.Namespace) -> None:
-    needle = text2bytes(args.NEEDLE, args.type)
-    data = text2bytes(args.DATA, args.type)
+    pairs = read_pairs(args)
+    if not pairs:
+        raise Exception("nothing to replace")
+
+    needles = NeedleSet([typed_text2bytes(needle, args.type, from_file) for needle, _, from_file in pairs])
+    datas = [typed_text2bytes(data, args.type, from_file) for _, data, from_file in pairs]
 
     with Memory.from_pid(pid, mode='r+b') as mem:
-        infos = mem.regions()
-        infos = filter_memory_maps(args, infos)
-
-        for info in infos:
-            haystack = mem.read(info.addr_beg, info.addr_end)
-            assert haystack is not None
-            addrs = search(needle, haystack)
-
-            for addr in addrs:
-                assert data is not None
-                mem.write(info.addr_beg + addr, data)
-                print("replaced data at {:016x}".format(info.addr_beg + addr))
+        annotate = address_annotator(mem, args.symbols)
+        infos = filter_memory_maps(args, mem.regions())
+
+        for addr in replace_ranges(mem, [(info.addr_beg, info.addr_end) for info in infos], needles, datas):
+            print("replaced data at {:016x} ({})".format(addr, annotate(addr)))
 
 
 # EOF #
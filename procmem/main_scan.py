@@ -0,0 +1,142 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Optional
+
+import argparse
+import logging
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory import Memory, ProcessVmMemory
+from procmem.memory_region import filter_memory_maps
+from procmem.pack import ctype2dtype
+from procmem.session import ScanSession
+from procmem.typedscan import TypedScan
+
+
+# Conditions comparing the current value of a candidate to its
+# previous one, all other conditions are the operators of TypedScan
+CHANGE_OPS = ["changed", "unchanged", "increased", "decreased"]
+
+# Number of candidates printed after a scan
+DEFAULT_LIST_LIMIT = 20
+
+
+def first_scan(mem: Memory, session: ScanSession, ranges: list[tuple[int, int]], scan: TypedScan) -> None:
+    """Fill 'session' with all values in 'ranges' matching 'scan'"""
+    overlap = scan.max_length - 1
+    writer = session.writer()
+    for beg, end in ranges:
+        try:
+            for chunk_addr, haystack in mem.chunks(beg, end, overlap=overlap):
+                if chunk_addr + len(haystack) >= end:
+                    limit = len(haystack)
+                else:
+                    limit = len(haystack) - overlap
+
+                offsets, values = scan.find_array(haystack, chunk_addr)
+                keep = offsets < limit
+                writer.append(chunk_addr + offsets[keep], values[keep])
+        except (OSError, OverflowError) as err:
+            logging.warning("failed to read %016x-%016x: %s", beg, end, err)
+    session.commit(writer)
+
+
+def compare_change(op: str, current: npt.NDArray[Any], previous: npt.NDArray[Any]) -> npt.NDArray[np.bool_]:
+    mask: npt.NDArray[np.bool_]
+    if op == "changed":
+        mask = np.not_equal(current, previous)
+    elif op == "unchanged":
+        mask = np.equal(current, previous)
+    elif op == "increased":
+        mask = np.greater(current, previous)
+    elif op == "decreased":
+        mask = np.less(current, previous)
+    else:
+        raise ValueError("unknown condition: {}".format(op))
+    return mask
+
+
+def next_scan(mem: Memory, session: ScanSession, op: str, values: list[str], tolerance: float = 0.0) -> None:
+    """Re-read all candidates of 'session' and keep those fulfilling
+    the condition 'op'"""
+    scan = None
+    if op not in CHANGE_OPS:
+        scan = TypedScan(session.ctype, op, values, tolerance=tolerance)
+    elif values:
+        raise ValueError("condition '{}' takes no value".format(op))
+
+    writer = session.writer()
+    for addrs, previous in session.candidates():
+        data, valid = mem.gather(addrs, session.dtype.itemsize)
+        current = data.view(session.dtype).reshape(-1)
+
+        with np.errstate(invalid="ignore", over="ignore"):
+            if scan is not None:
+                mask = scan.compare(current)
+            else:
+                mask = compare_change(op, current, previous)
+
+        # candidates that can't be read anymore are dropped
+        mask &= valid
+        writer.append(addrs[mask], current[mask])
+    session.commit(writer)
+
+
+def print_candidates(session: ScanSession, limit: Optional[int]) -> None:
+    for addrs, values in session.candidates(limit=limit):
+        for addr, value in zip(addrs.tolist(), values.tolist()):
+            print("{:016x}: {}".format(addr, value))
+
+
+def main_scan(pid: int, args: argparse.Namespace) -> None:
+    if args.scan_command == "new":
+        # without a value every address is a candidate, an unknown initial value
+        op = args.op or ("eq" if args.VALUE else "any")
+        alignment = args.align or ctype2dtype(args.type).itemsize
+        scan = TypedScan(args.type, op, args.VALUE, alignment, args.tolerance)
+        session = ScanSession.create(args.SESSION, pid, args.type, alignment)
+
+        with ProcessVmMemory.from_pid(pid) as mem:
+            infos = filter_memory_maps(args, mem.regions())
+            ranges = [rng
+                      for info in infos
+                      for rng in mem.ranges(info.addr_beg, info.addr_end, args.resident_only)]
+            first_scan(mem, session, ranges, scan)
+    else:
+        session = ScanSession.load(args.SESSION)
+
+        # the process the session was started on is used unless one is given explicitly
+        if args.pid is None and args.process is None:
+            pid = session.pid
+
+        if args.scan_command == "next":
+            with ProcessVmMemory.from_pid(pid) as mem:
+                next_scan(mem, session, args.CONDITION, args.VALUE, args.tolerance)
+
+    print("{} candidates after scan {}".format(session.count, session.generation))
+    if args.scan_command == "list":
+        print_candidates(session, args.limit)
+    else:
+        limit = args.limit if args.limit is not None else DEFAULT_LIST_LIMIT
+        if session.count <= limit:
+            print_candidates(session, limit)
+
+
+# EOF #
@@ -15,32 +15,93 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from typing import Iterator, Optional
+
 import argparse
+import logging
 import sys
 
+from procmem.elfsym import address_annotator
 from procmem.memory_region import filter_memory_maps
-from procmem.memory import Memory
-from procmem.pack import text2bytes
+from procmem.memory import Memory, ProcessVmMemory
+from procmem.multisearch import Matcher, NeedleSet, PatternSet, RegexSearch
+from procmem.pack import typed_text2pattern
 from procmem.hexdump import write_hex
+from procmem.scan import parallel_scan
+from procmem.typedscan import TypedScan
 
 
-def search(needle: bytes, haystack: bytes) -> list[int]:
-    results: list[int] = []
+def read_needles(texts: list[str], filename: Optional[str]) -> list[tuple[str, bool]]:
+    """Collect the needle texts from the command line and from the
+    file 'filename', which contains one needle per line. Returns
+    (text, from_file) tuples, only needles from the file may carry a
+    'TYPE:' prefix."""
+    needles = [(text, False) for text in texts]
+    if filename is not None:
+        with open(filename, "r") as fin:
+            needles += [(line.rstrip("\n"), True) for line in fin if line.strip()]
+    return needles
 
-    cur = 0
-    while True:
-        i = haystack.find(needle, cur)
-        if i != -1:
-            results.append(i)
-            cur = i + 1
-        else:
-            break
 
-    return results
+def _search_chunks(mem: Memory, ranges: list[tuple[int, int]], matcher: Matcher) -> Iterator[tuple[int, int, int]]:
+    overlap = matcher.max_length - 1
+    for beg, end in ranges:
+        try:
+            for chunk_addr, haystack in mem.chunks(beg, end, overlap=overlap):
+                # matches starting in the last 'overlap' bytes might be
+                # cut short, they are found again in the next chunk
+                if chunk_addr + len(haystack) >= end:
+                    limit = len(haystack)
+                else:
+                    limit = len(haystack) - overlap
+
+                for offset, length, idx in matcher.find(haystack, chunk_addr):
+                    if offset < limit:
+                        yield chunk_addr + offset, length, idx
+        except (OSError, OverflowError) as err:
+            # unreadable ranges are skipped, like parallel_scan() does
+            logging.warning("failed to read %016x-%016x: %s", beg, end, err)
+
+
+def search_ranges(mem: Memory, ranges: list[tuple[int, int]], matcher: Matcher,
+                  jobs: int) -> Iterator[tuple[int, int, int]]:
+    """Yield (address, length, pattern index) for all matches in 'ranges'"""
+    if jobs != 1:
+        matches = parallel_scan(mem.pid, ranges, matcher.find, overlap=matcher.max_length - 1, jobs=jobs or None)
+    else:
+        matches = _search_chunks(mem, ranges, matcher)
+
+    if matcher.overlapping:
+        yield from matches
+    else:
+        # a chunk starting in the middle of an earlier match can
+        # produce a match for the remainder of it, drop those
+        match_end = 0
+        for addr, length, idx in matches:
+            if addr >= match_end:
+                yield addr, length, idx
+                match_end = addr + length
 
 
 def main_search(pid: int, args: argparse.Namespace) -> None:
-    needle = text2bytes(args.NEEDLE, args.type)
+    needles = read_needles(args.NEEDLE, args.needle_file)
+    texts = [text for text, _ in needles]
+    if not texts:
+        raise Exception("no needle given")
+
+    matcher: Matcher
+    if args.op is not None:
+        matcher = TypedScan(args.type, args.op, texts, args.align, args.tolerance)
+    elif args.regex:
+        if len(texts) != 1:
+            raise Exception("--regex requires exactly one pattern")
+        matcher = RegexSearch(texts[0].encode(), args.max_match_length)
+    else:
+        patterns = [typed_text2pattern(text, args.type, from_file) for text, from_file in needles]
+        if all(mask == b"\xff" * len(mask) for _, mask in patterns):
+            matcher = NeedleSet([value for value, _ in patterns])
+        else:
+            matcher = PatternSet(patterns)
 
     after_context: bool = False
     before_context: bool = False
@@ -52,23 +113,39 @@ def main_search(pid: int, args: argparse.Namespace) -> None:
         before_context = args.before_context or args.context
         after_context = args.after_context or args.context
 
-    with Memory.from_pid(pid) as mem:
-        infos = mem.regions()
-        infos = filter_memory_maps(args, infos)
-
-        for info in infos:
-            haystack = mem.read(info.addr_beg, info.addr_end)
-            assert haystack is not None
-            addrs = search(needle, haystack)
-            for addr in addrs:
-                print("found pattern at {:016x}".format(info.addr_beg + addr))
-                if show_context:
-                    s = max(0, addr - before_context)
-                    e = min(len(haystack), addr + len(needle) + after_context)
-                    assert haystack is not None
-                    context = haystack[s:e]
-                    write_hex(sys.stdout, context, info.addr_beg + s, args.width)
-                    print()
+    with ProcessVmMemory.from_pid(pid) as mem:
+        annotate = address_annotator(mem, args.symbols)
+        infos = filter_memory_maps(args, mem.regions())
+
+        ranges = [rng
+                  for info in infos
+                  for rng in mem.ranges(info.addr_beg, info.addr_end, args.resident_only)]
+
+        # matches come in address order, so the range containing
+        # them can be tracked with a single cursor
+        range_idx = 0
+        for addr, length, needle_idx in search_ranges(mem, ranges, matcher, args.jobs):
+            while ranges[range_idx][1] <= addr:
+                range_idx += 1
+            beg, end = ranges[range_idx]
+
+            if isinstance(matcher, TypedScan):
+                data = mem.read(addr, addr + length)
+                assert data is not None
+                print("found value at {:016x} ({}): {}".format(addr, annotate(addr), matcher.decode(data)))
+            elif len(matcher) == 1:
+                print("found pattern at {:016x} ({})".format(addr, annotate(addr)))
+            else:
+                print("found pattern at {:016x} ({}): {}".format(addr, annotate(addr), texts[needle_idx]))
+
+            if show_context:
+                # the context might extend beyond the current chunk
+                s = max(beg, addr - before_context)
+                e = min(end, addr + length + after_context)
+                context = mem.read(s, e)
+                assert context is not None
+                write_hex(sys.stdout, context, s, args.width)
+                print()
 
 
 # EOF #
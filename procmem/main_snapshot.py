@@ -0,0 +1,79 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import os
+import time
+
+import bytefmt
+
+from procmem.memory import ProcessVmMemory
+from procmem.memory_region import filter_memory_maps
+from procmem.pagemap import soft_dirty_supported
+from procmem.snapshot import SnapshotWriter, take_delta_snapshot, take_snapshot
+
+
+def print_stats(writer: SnapshotWriter) -> None:
+    page_size = writer.page_size
+    print("{:>10}  captured".format(bytefmt.humanize(writer.pages * page_size, style="binary")))
+    print("{:>10}  zero pages".format(bytefmt.humanize(writer.zero_pages * page_size, style="binary")))
+    print("{:>10}  duplicate pages".format(bytefmt.humanize(writer.duplicate_pages * page_size, style="binary")))
+    print("{:>10}  unique pages".format(bytefmt.humanize(writer.unique_pages * page_size, style="binary")))
+    print("{:>10}  written to {}".format(bytefmt.humanize(os.path.getsize(writer.filename), style="binary"),
+                                         writer.filename))
+
+
+def main_snapshot(pid: int, args: argparse.Namespace) -> None:
+    with ProcessVmMemory.from_pid(pid) as mem:
+        if args.incremental:
+            if not soft_dirty_supported():
+                raise Exception("--incremental requires a kernel with soft-dirty page tracking")
+            # cleared before the base snapshot, so that pages written
+            # to while it is taken end up in the first delta
+            mem.clear_soft_dirty()
+
+        infos = filter_memory_maps(args, mem.regions())
+        with SnapshotWriter(args.FILE, infos, level=args.level, meta={"pid": pid}) as writer:
+            take_snapshot(mem, infos, writer, args.resident_only)
+        print_stats(writer)
+
+        if not args.incremental:
+            return
+
+        parent = args.FILE
+        layer = 1
+        try:
+            while args.count is None or layer <= args.count:
+                time.sleep(args.interval)
+
+                filename = "{}.{}".format(args.FILE, layer)
+                infos = filter_memory_maps(args, mem.regions(refresh=True))
+                meta = {"pid": pid, "parent": os.path.relpath(parent, os.path.dirname(filename) or ".")}
+                with SnapshotWriter(filename, infos, level=args.level, meta=meta) as writer:
+                    take_delta_snapshot(mem, infos, writer)
+                print("{:>10}  changed, {} written to {}".format(
+                    bytefmt.humanize(writer.pages * writer.page_size, style="binary"),
+                    bytefmt.humanize(os.path.getsize(filename), style="binary"),
+                    filename))
+
+                parent = filename
+                layer += 1
+        except KeyboardInterrupt:
+            pass
+
+
+# EOF #
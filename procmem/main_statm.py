@@ -16,17 +16,24 @@
 
 
 import argparse
-import os
 
 import bytefmt
 
+from procmem.pagemap import PAGE_SIZE
+from procmem.process import print_process_table, read_comm, read_statm, sample, select_pids
+
 
 def main_statm(pid: int, args: argparse.Namespace) -> None:
-    filename = os.path.join("/proc", str(pid), "statm")
-    with open(filename, "r") as fin:
-        content = fin.read()
-    size, resident, shared, text, lib, data, dt = [int(x) for x in content.split()]
-    page_size = 4096
+    if args.match is not None or args.pids:
+        def statm(pid: int) -> tuple[str, list[int]]:
+            size, resident, shared, text, lib, data, dt = read_statm(pid)
+            return read_comm(pid), [x * PAGE_SIZE for x in [size, resident, shared, text, data]]
+
+        print_process_table(["SIZE", "RSS", "SHARED", "TEXT", "DATA"],
+                            sample(select_pids(args.match, args.pids), statm, args.jobs))
+        return
+
+    size, resident, shared, text, lib, data, dt = read_statm(pid)
     print(("{:>10}  total program size\n"
            "{:>10}  resident set size\n"
            "{:>10}  shared size\n"
@@ -35,7 +42,7 @@ def main_statm(pid: int, args: argparse.Namespace) -> None:
            "{:>10}  data + stack"
            # "{:>10}  dirty pages (unused, always 0)"
            "")
-          .format(*[bytefmt.humanize(x * page_size, style="binary")
+          .format(*[bytefmt.humanize(x * PAGE_SIZE, style="binary")
                     for x in [size, resident, shared, text, data]]))
 
 
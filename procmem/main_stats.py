@@ -0,0 +1,66 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import sys
+
+import bytefmt
+
+from procmem.memory import Memory
+from procmem.memory_region import filter_memory_maps
+from procmem.pagemap import PAGE_SIZE
+from procmem.stats import PageTable, collect_stats
+
+
+def main_stats(pid: int, args: argparse.Namespace) -> None:
+    pages = PageTable() if args.pages else None
+    with Memory.from_pid(pid) as mem:
+        infos = filter_memory_maps(args, mem.regions())
+        regions = collect_stats(mem, infos, PAGE_SIZE, args.resident_only, pages)
+
+    regions.sort(key=lambda stats: -stats.metric(args.sort))
+    if args.limit is not None:
+        regions = regions[:args.limit]
+
+    if args.json:
+        js = {"regions": [stats.to_json(args.histogram) for stats in regions]}
+        if pages is not None:
+            js["pages"] = [dict(page, address="{:x}".format(page["address"]))
+                           for page in pages.sorted(args.sort, args.limit)]
+        json.dump(js, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    print("{:>10}  {:>7}  {:>7}  {:>7}  {:>8}  {}".format("SIZE", "ENTROPY", "ZERO", "POINTER", "TOP", "REGION"))
+    for stats in regions:
+        value, share = stats.most_common()[0]
+        print("{:>10}  {:>7.3f}  {:>6.1f}%  {:>6.1f}%  {:02x}:{:>4.0f}%  {}".format(
+            bytefmt.humanize(stats.size, style="binary"),
+            stats.metric("entropy"), stats.metric("zero") * 100, stats.metric("pointer") * 100,
+            value, share * 100,
+            stats.region))
+
+    if pages is not None:
+        print()
+        print("{:>16}  {:>7}  {:>7}  {:>7}".format("PAGE", "ENTROPY", "ZERO", "POINTER"))
+        for page in pages.sorted(args.sort, args.limit):
+            print("{:016x}  {:>7.3f}  {:>6.1f}%  {:>6.1f}%".format(
+                page["address"], page["entropy"], page["zero"] * 100, page["pointer"] * 100))
+
+
+# EOF #
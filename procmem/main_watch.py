@@ -19,26 +19,80 @@ import argparse
 import time
 import sys
 
-from procmem.memory import Memory
+from procmem.elfsym import address_annotator
+from procmem.memory import ProcessVmMemory
 from procmem.hexdump import write_hex
+from procmem.watch import Watcher, WatchTarget
+
+
+def read_targets(args: argparse.Namespace) -> list[WatchTarget]:
+    """Collect the targets from --range, --var and --target-file"""
+    targets = [WatchTarget(rng.start, size=len(rng)) for rng in args.range or []]
+
+    texts = list(args.var or [])
+    if args.target_file is not None:
+        with open(args.target_file, "r") as fin:
+            texts += [line.strip() for line in fin if line.strip() and not line.startswith("#")]
+    targets += [WatchTarget.from_string(text) for text in texts]
+
+    return targets
 
 
 def main_watch(pid: int, args: argparse.Namespace) -> None:
-    beg = args.range.start
-    end = args.range.stop
+    targets = read_targets(args)
 
     print("watching pid {}".format(pid))
-    with Memory.from_pid(pid) as mem:
-        oldstate = None
-        while True:
-            newstate = mem.read(beg, end)
-            assert newstate is not None
-            if oldstate != newstate:
-                print("^-- change detected --")
-                write_hex(sys.stdout, newstate, beg)
-                sys.stdout.buffer.flush()
-                oldstate = newstate
-            time.sleep(0.1)
+    with ProcessVmMemory.from_pid(pid) as mem:
+        annotate = address_annotator(mem, args.symbols)
+        watcher = Watcher(mem, targets, args.history)
+
+        watcher.poll(time.time())
+        for idx, target in enumerate(targets):
+            if target.dtype is not None:
+                print("{} ({})  {}".format(target.label, annotate(target.addr),
+                                           target.decode(watcher.state(idx))))
+            else:
+                print("{} ({})".format(target.label, annotate(target.addr)))
+                write_hex(sys.stdout, watcher.state(idx), target.addr)
+        sys.stdout.flush()
+
+        # with --adaptive the interval shrinks while values are
+        # changing and grows back to --interval while they are not
+        interval = args.interval
+        start = time.monotonic()
+        deadline = start
+        ticks = 0
+        try:
+            while args.ticks is None or ticks < args.ticks:
+                deadline += interval
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # fell behind, don't try to catch up with missed ticks
+                    deadline = time.monotonic()
+
+                if args.duration is not None and time.monotonic() - start >= args.duration:
+                    break
+
+                events = watcher.poll(time.time())
+                ticks += 1
+                for event in events:
+                    print("{}  ({})".format(watcher.format_event(event), annotate(event[2])))
+                if events:
+                    sys.stdout.flush()
+
+                if args.adaptive:
+                    if events:
+                        interval = max(args.min_interval, interval / 2)
+                    else:
+                        interval = min(args.interval, interval * 2)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if args.export is not None:
+                with open(args.export, "w") as fout:
+                    watcher.export(fout)
 
 
 # EOF #
@@ -15,11 +15,27 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import Any, Optional, BinaryIO
+from typing import Any, Iterator, Optional, BinaryIO, Sequence, TypeVar, Union
 
+import errno
+import logging
 import os
 
-from procmem.memory_region import MemoryRegion
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory_region import MemoryRegion, RegionTable
+from procmem.pagemap import resident_ranges
+from procmem.process_vm import IOV_MAX, process_vm_readv
+
+
+# Number of bytes fetched per window by Memory.chunks()
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Addresses closer together than this are fetched with a single read by Memory.gather()
+GATHER_GAP = 256
+
+MemoryT = TypeVar('MemoryT', bound='Memory')
 
 
 class Memory:
@@ -31,35 +47,252 @@ class Memory:
     def __init__(self, pid: int, mode: str = "rb") -> None:
         self.pid: int = pid
         self.mode: str = mode
-        self._regions: Optional[list[MemoryRegion]] = None
+        self._regions: Optional[RegionTable] = None
         self.mem_fb: BinaryIO
+        self.pagemap_fp: Optional[BinaryIO] = None
 
         self.procdir = os.path.join("/proc", str(pid))
         self.mem_file = os.path.join(self.procdir, "mem")
-        self.maps_file = os.path.join(self.procdir, "smaps")
+        self.maps_file = os.path.join(self.procdir, "maps")
+        self.smaps_file = os.path.join(self.procdir, "smaps")
+        self.pagemap_file = os.path.join(self.procdir, "pagemap")
+        self.clear_refs_file = os.path.join(self.procdir, "clear_refs")
 
-    def __enter__(self) -> 'Memory':
+    def __enter__(self: MemoryT) -> MemoryT:
         self.mem_fp = open(self.mem_file, self.mode, buffering=0)
         return self
 
     def __exit__(self, *exc: Any) -> None:
         self.mem_fp.close()
+        if self.pagemap_fp is not None:
+            self.pagemap_fp.close()
 
     def read(self, start: int, end: int) -> Optional[bytes]:
         self.mem_fp.seek(start)
         return self.mem_fp.read(end - start)  # type: ignore
 
+    def readinto(self, addr: int, buf: Union[bytearray, memoryview]) -> int:
+        """Fill 'buf' with the memory starting at 'addr' and return
+        the number of bytes read, which is less than len(buf) when the
+        end of the readable memory was reached."""
+        self.mem_fp.seek(addr)
+        with memoryview(buf) as view:
+            total = 0
+            while total < len(view):
+                try:
+                    count = self.mem_fp.readinto(view[total:])  # type: ignore
+                except OSError:
+                    if total == 0:
+                        raise
+                    break
+
+                if not count:
+                    break
+                total += count
+            return total
+
+    def readv(self, requests: Sequence[tuple[int, Union[bytearray, memoryview]]]) -> list[int]:
+        """Fill the buffers of a list of (address, buffer) tuples and
+        return the number of bytes read into each, unreadable ranges
+        give a count of 0."""
+        counts: list[int] = []
+        for addr, buf in requests:
+            try:
+                counts.append(self.readinto(addr, buf))
+            except (OSError, OverflowError):
+                counts.append(0)
+        return counts
+
+    def gather(self, addrs: npt.NDArray[np.uint64],
+               size: int) -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.bool_]]:
+        """Read 'size' bytes at each of the sorted addresses in 'addrs'
+        with a single readv(), neighboring addresses are coalesced into
+        one read. Returns an (n, size) array of the bytes and a mask of
+        the addresses that could be read."""
+        if len(addrs) == 0:
+            return np.zeros((0, size), dtype=np.uint8), np.zeros(0, dtype=np.bool_)
+
+        # split the addresses into segments that get read as a whole
+        breaks = np.flatnonzero(np.diff(addrs) > GATHER_GAP) + 1
+        seg_first = np.concatenate(([0], breaks))
+        seg_last = np.concatenate((breaks - 1, [len(addrs) - 1]))
+        seg_beg = addrs[seg_first].astype(np.int64)
+        seg_len = addrs[seg_last].astype(np.int64) - seg_beg + size
+        seg_offset = np.concatenate(([0], np.cumsum(seg_len)[:-1]))
+
+        buf = bytearray(int(seg_len.sum()))
+        with memoryview(buf) as view:
+            counts = np.array(self.readv([(beg, view[offset:offset + length])
+                                          for beg, offset, length in zip(addrs[seg_first].tolist(),
+                                                                         seg_offset.tolist(),
+                                                                         seg_len.tolist())]),
+                              dtype=np.int64)
+
+        seg_idx = np.repeat(np.arange(len(seg_first)), seg_last - seg_first + 1)
+        rel = addrs.astype(np.int64) - seg_beg[seg_idx]
+        valid = rel + size <= counts[seg_idx]
+        pos = seg_offset[seg_idx] + rel
+        data = np.frombuffer(buf, dtype=np.uint8)
+        return data[pos[:, None] + np.arange(size)], valid
+
+    def chunks(self, start: int, end: int,
+               chunk_size: int = DEFAULT_CHUNK_SIZE,
+               overlap: int = 0) -> Iterator[tuple[int, bytearray]]:
+        """Iterate over the memory in [start, end) in windows of at
+        most 'chunk_size' new bytes, yields (address, window) tuples.
+
+        The last 'overlap' bytes of a window are repeated at the start
+        of the next one, so that patterns up to 'overlap + 1' bytes
+        long can't slip through the gap between two windows.
+
+        All windows share the same bytearray, it is only valid until
+        the next iteration and must be copied if it is to be kept.
+        """
+        chunk_size = min(chunk_size, end - start)
+        if chunk_size <= 0:
+            return
+
+        buf = bytearray(chunk_size)
+        kept = 0
+        addr = start
+        while addr < end:
+            size = kept + min(chunk_size, end - addr)
+            if len(buf) < size:
+                buf.extend(bytes(size - len(buf)))
+            elif len(buf) > size:
+                del buf[size:]
+
+            with memoryview(buf) as view:
+                count = self.readinto(addr, view[kept:])
+            if count == 0:
+                break
+
+            if kept + count < size:
+                del buf[kept + count:]
+            yield addr - kept, buf
+
+            addr += count
+            if len(buf) < size:
+                break
+
+            if overlap > 0:
+                kept = min(overlap, len(buf))
+                buf[:kept] = buf[len(buf) - kept:]
+
+    def resident_ranges(self, start: int, end: int) -> Iterator[tuple[int, int]]:
+        """Iterate over the ranges within [start, end) that are backed
+        by pages present in RAM, see procmem.pagemap.resident_ranges()"""
+        if self.pagemap_fp is None:
+            self.pagemap_fp = open(self.pagemap_file, "rb", buffering=0)
+        return resident_ranges(self.pagemap_fp, start, end)
+
+    def dirty_ranges(self, start: int, end: int) -> Iterator[tuple[int, int]]:
+        """Iterate over the ranges within [start, end) that were
+        written to since the last clear_soft_dirty()"""
+        if self.pagemap_fp is None:
+            self.pagemap_fp = open(self.pagemap_file, "rb", buffering=0)
+        return resident_ranges(self.pagemap_fp, start, end, mask=MemoryRegion.PAGE_SOFT_DIRTY)
+
+    def clear_soft_dirty(self) -> None:
+        """Reset the soft-dirty bits of all pages of the process, see
+        Documentation/admin-guide/mm/soft-dirty.rst"""
+        with open(self.clear_refs_file, "w") as fout:
+            fout.write("4")
+
+    def ranges(self, start: int, end: int, resident_only: bool = False) -> Iterator[tuple[int, int]]:
+        """Iterate over the ranges within [start, end) that should be
+        read, either the whole range or only the resident parts."""
+        if resident_only:
+            return self.resident_ranges(start, end)
+        else:
+            return iter([(start, end)])
+
     def write(self, addr: int, data: bytes) -> None:
         self.mem_fp.seek(addr)
         self.mem_fp.write(data)
 
-    def regions(self) -> list[MemoryRegion]:
-        if self._regions is not None:
-            return self._regions
-        else:
-            self._regions = MemoryRegion.regions_from_file(self.maps_file)
-            assert self._regions is not None
-            return self._regions
+    def regions(self, refresh: bool = False) -> RegionTable:
+        if self._regions is None or refresh:
+            self._regions = RegionTable.from_maps_file(self.maps_file, self.smaps_file)
+        return self._regions
+
+    def region_at(self, addr: int) -> Optional[MemoryRegion]:
+        """Return the region containing 'addr' or None if it is unmapped"""
+        regions = self.regions()
+        idx = regions.index_of(addr)
+        return regions[idx] if idx is not None else None
+
+    def annotate(self, addr: int) -> str:
+        """Describe 'addr' as 'pathname+offset' within its region"""
+        return self.regions().annotate(addr)
+
+
+class ProcessVmMemory(Memory):
+    """Memory that is read with process_vm_readv() instead of
+    /proc/$PID/mem, which saves the seek() and lets readv() gather
+    many ranges in a single syscall. Falls back to /proc/$PID/mem when
+    process_vm_readv() isn't permitted, writes always go there."""
+
+    @staticmethod
+    def from_pid(pid: int, mode: str = "rb") -> 'ProcessVmMemory':
+        return ProcessVmMemory(pid, mode)
+
+    def __init__(self, pid: int, mode: str = "rb") -> None:
+        super().__init__(pid, mode)
+        self._vm_available = True
+
+    def _disable_vm(self, err: OSError) -> None:
+        logging.info("process_vm_readv() not available (%s), falling back to %s", err, self.mem_file)
+        self._vm_available = False
+
+    def readinto(self, addr: int, buf: Union[bytearray, memoryview]) -> int:
+        if self._vm_available:
+            try:
+                count = process_vm_readv(self.pid, [(addr, buf)])
+            except OSError as err:
+                if err.errno in (errno.EPERM, errno.ENOSYS):
+                    self._disable_vm(err)
+                elif err.errno != errno.EFAULT:
+                    raise
+            else:
+                if count == len(buf):
+                    return count
+
+        # /proc/$PID/mem can read some things process_vm_readv()
+        # can't, such as regions mapped without read permission
+        return super().readinto(addr, buf)
+
+    def readv(self, requests: Sequence[tuple[int, Union[bytearray, memoryview]]]) -> list[int]:
+        counts: list[int] = []
+        while len(counts) < len(requests) and self._vm_available:
+            batch = requests[len(counts):len(counts) + IOV_MAX]
+            try:
+                total = process_vm_readv(self.pid, batch)
+            except OSError as err:
+                if err.errno == errno.EFAULT:
+                    # the first range is unreadable, continue after it
+                    counts.extend(super().readv(batch[:1]))
+                    continue
+                elif err.errno in (errno.EPERM, errno.ENOSYS):
+                    self._disable_vm(err)
+                    break
+                else:
+                    raise
+
+            # the kernel stops at the first range it can't read
+            # completely, so restart the batch after that one
+            for addr, buf in batch:
+                count = min(total, len(buf))
+                total -= count
+                if count < len(buf):
+                    counts.extend(super().readv([(addr, buf)]))
+                    break
+                counts.append(count)
+
+        if len(counts) < len(requests):
+            counts.extend(super().readv(requests[len(counts):]))
+
+        return counts
 
 
 # EOF #
@@ -15,25 +15,30 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import IO, Optional
+from typing import Any, Iterator, Optional, Sequence, Union, overload
 
 import argparse
-import logging
 import os
-import re
-import struct
+import sys
 
 import bytefmt
+import numpy as np
+import numpy.typing as npt
 
-from procmem.itertools import chunk_iter
 
+# Regions that can't be read, see filter_memory_maps()
+DEFAULT_FILTERED_PATHNAMES = ["[vvar]", "[vvar_vclock]", "[vsyscall]"]
+
+
+def filter_memory_maps(args: argparse.Namespace, infos: Sequence['MemoryRegion']) -> Sequence['MemoryRegion']:
+    if isinstance(infos, RegionTable):
+        return infos.filter(args)
 
-def filter_memory_maps(args: argparse.Namespace, infos: list['MemoryRegion']) -> list['MemoryRegion']:
     if not args.no_default_filter:
         # Reading [vvar] fails to read with OSError: "[Errno 5]
         # Input/output error", so we filter it out to prevent issues
         # https://stackoverflow.com/questions/42730260/unable-to-access-contents-of-a-vvar-memory-region-in-gdb
-        infos = [info for info in infos if info.pathname != "[vvar]"]
+        infos = [info for info in infos if info.pathname not in ("[vvar]", "[vvar_vclock]")]
 
         # Reading [vsyscall] fails with OverflowError: "Python int
         # too large to convert to C long", so it gets filtered as well
@@ -42,22 +47,41 @@ def filter_memory_maps(args: argparse.Namespace, infos: list['MemoryRegion']) ->
     if args.size is not None:
         infos = [info for info in infos if info.length() >= args.size]
 
+    if args.rss is not None:
+        # needs the smaps details, which get loaded on first access
+        infos = [info for info in infos if info.info.get("Rss", 0) >= args.rss]
+
     if args.writable:
         infos = [info for info in infos if info.writable]
 
+    if args.executable:
+        infos = [info for info in infos if info.executable]
+
     if args.pathname is not None:
         infos = [info for info in infos if info.pathname == args.pathname]
 
     return infos
 
 
-class MemoryRegion:
+def region_mask(regions: Sequence['MemoryRegion'], addrs: npt.NDArray[np.uint64]) -> npt.NDArray[np.bool_]:
+    """Return a mask of the addresses that fall into one of 'regions'"""
+    if len(regions) == 0:
+        return np.zeros(len(addrs), dtype=np.bool_)
+
+    if isinstance(regions, RegionTable):
+        # already sorted, as they come from /proc/$PID/maps
+        mask: npt.NDArray[np.bool_] = regions.locate(addrs) >= 0
+        return mask
+
+    regions = sorted(regions, key=lambda region: region.addr_beg)
+    begs = np.array([region.addr_beg for region in regions], dtype=np.uint64)
+    ends = np.array([region.addr_end for region in regions], dtype=np.uint64)
+    idx = np.searchsorted(begs, addrs, side="right") - 1
+    mask = (idx >= 0) & (addrs < ends[np.maximum(idx, 0)])
+    return mask
 
-    # address, perms, offset, dev, inode, pathname
-    maps_re = re.compile(
-        r'([0-9a-f]+)-([0-9a-f]+) ([r-])([w-])([x-])([ps]) ([0-9a-f]+) ([0-9a-f]+:[0-9a-f]+) (\d+) *(.*)\n',
-        re.ASCII)
-    info_re = re.compile(r'^([A-Za-z_]+): *(\d+) kB$', re.ASCII)
+
+class MemoryRegion:
 
     PAGE_RAM = (1 << 63)  # page is present in RAM
     PAGE_SWAP = (1 << 62)  # page is in swap space
@@ -73,101 +97,8 @@ class MemoryRegion:
     FRAME_MASK = 0x3fffffffffffff
 
     @staticmethod
-    def regions_from_pid(pid: int) -> list['MemoryRegion']:
-        maps_path = os.path.join("/proc/", str(pid), "smaps")
-        # pagemap_path = os.path.join("/proc/{}/pagemap".format(pid))
-        return MemoryRegion.regions_from_file(maps_path)
-
-    @staticmethod
-    def regions_from_file(maps_path: str) -> list['MemoryRegion']:
-        infos: list['MemoryRegion'] = []
-        # with open(pagemap_path, 'rb', buffering=0) as pagemap_io,
-        with open(maps_path, 'r') as fin:
-            while True:
-                info = MemoryRegion.from_smaps_io(fin)
-                if info is not None:
-                    # info._process_pagemap(pagemap_io)
-                    infos.append(info)
-                else:
-                    break
-
-        return infos
-
-    def _process_pagemap(self, io: IO[str]) -> None:
-        assert False, "work in progress"
-
-        # io.seek(self.addr_beg // 8)
-        length = (self.addr_end - self.addr_beg) // 4096 * 8  # type: ignore[unreachable]
-        io.seek(self.addr_beg // 4096 * 8)
-        print("PAGEMAP {} {}".format(length, self))
-        buf = io.read(length)
-        for b in chunk_iter(buf, 8):
-            v = struct.unpack("Q{}".format(len(buf) // 8)[0], b)[0]
-            print("    {} {} {} {}".format(
-                "RAM" if (v & MemoryRegion.PAGE_RAM) else " - ",
-                "SWP" if (v & MemoryRegion.PAGE_SWAP) else " - ",
-                "FIL" if (v & MemoryRegion.PAGE_FILE) else " - ",
-                (v & MemoryRegion.FRAME_MASK)
-            ))
-
-    @staticmethod
-    def from_smaps_io(fin: IO[str]) -> Optional['MemoryRegion']:
-        line = fin.readline()
-        if line == '':
-            return None
-
-        region = MemoryRegion.from_string(line)
-
-        while True:
-            line = fin.readline()
-            assert line != ''
-            if line.startswith("THPeligible:"):
-                pass
-            elif line.startswith("VmFlags:"):
-                break
-            else:
-                region._add_info_from_string(line)
-        region._add_vmflags_from_string(line)
-
-        return region
-
-    def _add_info_from_string(self, text: str) -> None:
-        """Parse additional info from /proc/$PID/smaps"""
-        match = MemoryRegion.info_re.match(text)
-        if match is None:
-            logging.warning(f"failed to parse: {text!r}, ignoring")
-            return
-
-        name = match.group(1)
-        kb_count = int(match.group(2))
-        self.info[name] = kb_count * 1024
-
-    def _add_vmflags_from_string(self, text: str) -> None:
-        assert text.startswith("VmFlags:")
-        self.vmflags = text[8:].split()
-
-    @staticmethod
-    def from_string(text: str) -> 'MemoryRegion':
-        match = MemoryRegion.maps_re.match(text)
-        if not match:
-            raise Exception("parse error on line:\n{}".format(text))
-
-        return MemoryRegion._from_match(match)
-
-    @staticmethod
-    def _from_match(match: re.Match[str]) -> 'MemoryRegion':
-        """Create a MemoryRegion object from a string in the format found in /proc/$PID/maps"""
-        addr_beg, addr_end, r, w, x, p, offset, dev, inode, pathname = match.groups()
-        return MemoryRegion(addr_beg=int(addr_beg, 16),
-                            addr_end=int(addr_end, 16),
-                            readable=(r == "r"),
-                            writable=(w == "w"),
-                            executable=(x == "x"),
-                            private=(p == "p"),
-                            offset=int(offset, 16),
-                            dev=dev,
-                            inode=int(inode),
-                            pathname=pathname)
+    def regions_from_pid(pid: int) -> 'RegionTable':
+        return RegionTable.from_pid(pid)
 
     def __init__(self, addr_beg: int, addr_end: int,
                  readable: bool, writable: bool, executable: bool, private: bool,
@@ -183,8 +114,71 @@ class MemoryRegion:
         self.inode = inode
         self.pathname = pathname
 
-        self.info: dict[str, int] = {}
-        self.vmflags = []
+        self._info: Optional[dict[str, int]] = {}
+        self._vmflags: Optional[list[str]] = []
+        self._smaps_loader: Optional[RowSmapsLoader] = None
+
+    def _load_smaps(self) -> None:
+        if self._smaps_loader is not None:
+            self._smaps_loader.load()
+
+    def _smaps_loaded(self) -> bool:
+        return self._smaps_loader is None or self._smaps_loader.loaded
+
+    @property
+    def info(self) -> dict[str, int]:
+        """The counters from /proc/$PID/smaps, such as 'Rss' or 'Swap', in bytes"""
+        self._load_smaps()
+        assert self._info is not None
+        return self._info
+
+    @info.setter
+    def info(self, value: dict[str, int]) -> None:
+        self._info = value
+
+    @property
+    def vmflags(self) -> list[str]:
+        self._load_smaps()
+        assert self._vmflags is not None
+        return self._vmflags
+
+    @vmflags.setter
+    def vmflags(self, value: list[str]) -> None:
+        self._vmflags = value
+
+    @staticmethod
+    def from_json(js: dict[str, Any]) -> 'MemoryRegion':
+        region = MemoryRegion(addr_beg=js["addr_beg"],
+                              addr_end=js["addr_end"],
+                              readable="r" in js["perms"],
+                              writable="w" in js["perms"],
+                              executable="x" in js["perms"],
+                              private="p" in js["perms"],
+                              offset=js["offset"],
+                              dev=js["dev"],
+                              inode=js["inode"],
+                              pathname=js["pathname"])
+        region.info = dict(js.get("info", {}))
+        region.vmflags = list(js.get("vmflags", []))
+        return region
+
+    def to_json(self) -> dict[str, Any]:
+        js: dict[str, Any] = {
+            "addr_beg": self.addr_beg,
+            "addr_end": self.addr_end,
+            "perms": self.perms(),
+            "offset": self.offset,
+            "dev": self.dev,
+            "inode": self.inode,
+            "pathname": self.pathname,
+        }
+
+        # don't make the kernel generate smaps just for this
+        if self._smaps_loaded():
+            js["info"] = self.info
+            js["vmflags"] = self.vmflags
+
+        return js
 
     def length(self) -> int:
         return self.addr_end - self.addr_beg
@@ -204,4 +198,290 @@ class MemoryRegion:
             self.pathname)
 
 
+class RegionTable(Sequence[MemoryRegion]):
+    """The regions of a process stored column by column
+
+    Addresses, offsets and inodes are NumPy columns, permissions are
+    bits in 'flags' and devices and pathnames are indices into lists
+    of interned strings. Filtering evaluates masks over the columns,
+    and per pathname instead of per region. The smaps counters are
+    loaded into columns of their own when first needed. Indexing with
+    an integer returns the row as a MemoryRegion.
+    """
+
+    READABLE = 1
+    WRITABLE = 2
+    EXECUTABLE = 4
+    PRIVATE = 8
+
+    @staticmethod
+    def from_pid(pid: int) -> 'RegionTable':
+        procdir = os.path.join("/proc/", str(pid))
+        return RegionTable.from_maps_file(os.path.join(procdir, "maps"), os.path.join(procdir, "smaps"))
+
+    @staticmethod
+    def from_maps_file(maps_path: str, smaps_path: Optional[str] = None) -> 'RegionTable':
+        with open(maps_path, "r") as fin:
+            return RegionTable.from_maps_lines(fin, smaps_path)
+
+    @staticmethod
+    def from_maps_lines(lines: Iterator[str], smaps_path: Optional[str] = None) -> 'RegionTable':
+        addr_beg: list[int] = []
+        addr_end: list[int] = []
+        flags: list[int] = []
+        offset: list[int] = []
+        inode: list[int] = []
+        dev_idx: list[int] = []
+        path_idx: list[int] = []
+
+        devs: dict[str, int] = {}
+        pathnames: dict[str, int] = {}
+        for line in lines:
+            fields = line.rstrip("\n").split(maxsplit=5)
+            if len(fields) < 5:
+                raise Exception("parse error on line:\n{}".format(line))
+
+            beg, _, end = fields[0].partition("-")
+            perms = fields[1]
+            addr_beg.append(int(beg, 16))
+            addr_end.append(int(end, 16))
+            flags.append((RegionTable.READABLE if perms[0] == "r" else 0) |
+                         (RegionTable.WRITABLE if perms[1] == "w" else 0) |
+                         (RegionTable.EXECUTABLE if perms[2] == "x" else 0) |
+                         (RegionTable.PRIVATE if perms[3] == "p" else 0))
+            offset.append(int(fields[2], 16))
+            dev_idx.append(devs.setdefault(fields[3], len(devs)))
+            inode.append(int(fields[4]))
+            path_idx.append(pathnames.setdefault(fields[5] if len(fields) > 5 else "", len(pathnames)))
+
+        return RegionTable(np.array(addr_beg, dtype=np.uint64),
+                           np.array(addr_end, dtype=np.uint64),
+                           np.array(flags, dtype=np.uint8),
+                           np.array(offset, dtype=np.uint64),
+                           np.array(inode, dtype=np.uint64),
+                           np.array(dev_idx, dtype=np.uint32),
+                           [sys.intern(dev) for dev in devs],
+                           np.array(path_idx, dtype=np.uint32),
+                           [sys.intern(pathname) for pathname in pathnames],
+                           smaps_path)
+
+    def __init__(self, addr_beg: npt.NDArray[np.uint64], addr_end: npt.NDArray[np.uint64],
+                 flags: npt.NDArray[np.uint8], offset: npt.NDArray[np.uint64], inode: npt.NDArray[np.uint64],
+                 dev_idx: npt.NDArray[np.uint32], devs: list[str],
+                 path_idx: npt.NDArray[np.uint32], pathnames: list[str],
+                 smaps_path: Optional[str] = None) -> None:
+        self.addr_beg = addr_beg
+        self.addr_end = addr_end
+        self.flags = flags
+        self.offset = offset
+        self.inode = inode
+        self.dev_idx = dev_idx
+        self.devs = devs
+        self.path_idx = path_idx
+        self.pathnames = pathnames
+
+        self.smaps_path = smaps_path
+        self._counters: Optional[dict[str, npt.NDArray[np.int64]]] = None
+        self._vmflags: Optional[list[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.addr_beg)
+
+    @overload
+    def __getitem__(self, idx: int) -> MemoryRegion:
+        ...
+
+    @overload
+    def __getitem__(self, idx: Union[slice, npt.NDArray[Any]]) -> 'RegionTable':
+        ...
+
+    def __getitem__(self, idx: Union[int, slice, npt.NDArray[Any]]) -> Union[MemoryRegion, 'RegionTable']:
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += len(self)
+            if not 0 <= idx < len(self):
+                raise IndexError("region index out of range")
+            return self.row(int(idx))
+
+        table = RegionTable(self.addr_beg[idx], self.addr_end[idx], self.flags[idx],
+                            self.offset[idx], self.inode[idx],
+                            self.dev_idx[idx], self.devs,
+                            self.path_idx[idx], self.pathnames,
+                            self.smaps_path)
+        if self._counters is not None and self._vmflags is not None:
+            table._counters = {key: column[idx] for key, column in self._counters.items()}
+            table._vmflags = np.array(self._vmflags, dtype=object)[idx].tolist()
+        return table
+
+    def __iter__(self) -> Iterator[MemoryRegion]:
+        for idx in range(len(self)):
+            yield self.row(idx)
+
+    def row(self, idx: int) -> MemoryRegion:
+        """Return row 'idx' as a MemoryRegion, its smaps details are
+        taken from the table once they are needed"""
+        flags = int(self.flags[idx])
+        region = MemoryRegion(addr_beg=int(self.addr_beg[idx]),
+                              addr_end=int(self.addr_end[idx]),
+                              readable=bool(flags & RegionTable.READABLE),
+                              writable=bool(flags & RegionTable.WRITABLE),
+                              executable=bool(flags & RegionTable.EXECUTABLE),
+                              private=bool(flags & RegionTable.PRIVATE),
+                              offset=int(self.offset[idx]),
+                              dev=self.devs[int(self.dev_idx[idx])],
+                              inode=int(self.inode[idx]),
+                              pathname=self.pathnames[int(self.path_idx[idx])])
+        region._info = None
+        region._vmflags = None
+        region._smaps_loader = RowSmapsLoader(self, idx, region)
+        return region
+
+    def locate(self, addrs: npt.NDArray[np.uint64]) -> npt.NDArray[np.intp]:
+        """Return the index of the region containing each address, -1
+        for unmapped ones, with a binary search over the sorted starts"""
+        addrs = np.asarray(addrs, dtype=np.uint64)
+        if len(self) == 0:
+            return np.full(len(addrs), -1, dtype=np.intp)
+        idx = np.searchsorted(self.addr_beg, addrs, side="right") - 1
+        result: npt.NDArray[np.intp] = np.where((idx >= 0) & (addrs < self.addr_end[np.maximum(idx, 0)]), idx, -1)
+        return result
+
+    def index_of(self, addr: int) -> Optional[int]:
+        """Return the index of the region containing 'addr'"""
+        idx = int(self.locate(np.array([addr], dtype=np.uint64))[0])
+        return idx if idx >= 0 else None
+
+    def annotate(self, addr: int) -> str:
+        """Describe 'addr' as 'pathname+offset', the offset is relative
+        to the start of the file for file mappings and to the start of
+        the region otherwise"""
+        idx = self.index_of(addr)
+        if idx is None:
+            return "unmapped"
+
+        offset = addr - int(self.addr_beg[idx])
+        if self.inode[idx] != 0:
+            offset += int(self.offset[idx])
+        pathname = self.pathnames[int(self.path_idx[idx])] or "[anon]"
+        return "{}+0x{:x}".format(pathname, offset)
+
+    def split_range(self, start: int, end: int) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+        """Split [start, end) at the region boundaries, returns the
+        mapped pieces and the unmapped gaps between them"""
+        first = int(np.searchsorted(self.addr_end, np.uint64(start), side="right"))
+        last = int(np.searchsorted(self.addr_beg, np.uint64(end), side="left"))
+
+        pieces: list[tuple[int, int]] = []
+        gaps: list[tuple[int, int]] = []
+        pos = start
+        for beg, stop in zip(self.addr_beg[first:last].tolist(), self.addr_end[first:last].tolist()):
+            beg = max(beg, start)
+            stop = min(stop, end)
+            if pos < beg:
+                gaps.append((pos, beg))
+            pieces.append((beg, stop))
+            pos = stop
+        if pos < end:
+            gaps.append((pos, end))
+        return pieces, gaps
+
+    @property
+    def smaps_loaded(self) -> bool:
+        return self._counters is not None or self.smaps_path is None
+
+    def counters(self) -> dict[str, npt.NDArray[np.int64]]:
+        """Return the smaps counters as columns of bytes, loading them on first use"""
+        if self._counters is None:
+            self._load_smaps()
+        assert self._counters is not None
+        return self._counters
+
+    def vmflags(self) -> list[str]:
+        """Return the space separated VmFlags of every region"""
+        if self._vmflags is None:
+            self._load_smaps()
+        assert self._vmflags is not None
+        return self._vmflags
+
+    def _load_smaps(self) -> None:
+        counters: dict[str, npt.NDArray[np.int64]] = {}
+        vmflags = [""] * len(self)
+        if self.smaps_path is None:
+            self._counters, self._vmflags = counters, vmflags
+            return
+
+        row = -1
+        with open(self.smaps_path, "r") as fin:
+            for line in fin:
+                key, sep, value = line.partition(":")
+                if not sep or " " in key:
+                    # a header line, which looks like the lines in /proc/$PID/maps
+                    beg = int(line[:line.index("-")], 16)
+                    row = int(np.searchsorted(self.addr_beg, beg))
+                    if row >= len(self) or int(self.addr_beg[row]) != beg:
+                        # the region wasn't mapped yet when maps was read
+                        row = -1
+                elif row < 0:
+                    pass
+                elif key == "VmFlags":
+                    vmflags[row] = sys.intern(value.strip())
+                elif value.endswith("kB\n"):
+                    column = counters.get(key)
+                    if column is None:
+                        column = counters[key] = np.zeros(len(self), dtype=np.int64)
+                    column[row] = int(value[:-3]) * 1024
+
+        self._counters, self._vmflags = counters, vmflags
+
+    def pathname_mask(self, pathnames: list[str]) -> npt.NDArray[np.bool_]:
+        """Return a mask of the regions whose pathname is in 'pathnames'"""
+        selected = [idx for idx, pathname in enumerate(self.pathnames) if pathname in pathnames]
+        mask: npt.NDArray[np.bool_] = np.isin(self.path_idx, selected)
+        return mask
+
+    def filter(self, args: argparse.Namespace) -> 'RegionTable':
+        """Vectorized version of filter_memory_maps()"""
+        mask = np.ones(len(self), dtype=np.bool_)
+
+        if not args.no_default_filter:
+            mask &= ~self.pathname_mask(DEFAULT_FILTERED_PATHNAMES)
+
+        if args.size is not None:
+            mask &= (self.addr_end - self.addr_beg) >= args.size
+
+        if args.rss is not None:
+            rss = self.counters().get("Rss")
+            mask &= rss >= args.rss if rss is not None else False
+
+        if args.writable:
+            mask &= (self.flags & RegionTable.WRITABLE) != 0
+
+        if args.executable:
+            mask &= (self.flags & RegionTable.EXECUTABLE) != 0
+
+        if args.pathname is not None:
+            mask &= self.pathname_mask([args.pathname])
+
+        return self[np.flatnonzero(mask)]
+
+
+class RowSmapsLoader:
+    """Fills in the smaps details of a row taken from a RegionTable,
+    from the columns of the table"""
+
+    def __init__(self, table: RegionTable, idx: int, region: MemoryRegion) -> None:
+        self.table = table
+        self.idx = idx
+        self.region = region
+
+    @property
+    def loaded(self) -> bool:
+        return self.table.smaps_loaded
+
+    def load(self) -> None:
+        if self.region._info is None:
+            self.region._info = {key: int(column[self.idx]) for key, column in self.table.counters().items()}
+            self.region._vmflags = self.table.vmflags()[self.idx].split()
+
+
 # EOF #
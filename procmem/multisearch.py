@@ -0,0 +1,209 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Union
+
+import re
+
+import numpy as np
+
+from procmem.typedscan import TypedScan
+
+
+def search(needle: bytes, haystack: Union[bytes, bytearray]) -> list[int]:
+    results: list[int] = []
+
+    cur = 0
+    while True:
+        i = haystack.find(needle, cur)
+        if i != -1:
+            results.append(i)
+            cur = i + 1
+        else:
+            break
+
+    return results
+
+
+class NeedleSet:
+    """Search for many needles in a single pass over the haystack.
+
+    Every position of the haystack is checked against the needle
+    prefixes with NumPy: first with a lookup table indexed by the
+    first two bytes, then the remaining candidates with a binary
+    search over the prefixes of up to four bytes. Only the positions
+    that survive both get compared against the full needles.
+    """
+
+    # matches of different needles may overlap each other
+    overlapping = True
+
+    def __init__(self, needles: list[bytes]) -> None:
+        if not needles or not all(needles):
+            raise ValueError("needles must not be empty")
+
+        self.needles = needles
+        self.max_length = max(len(needle) for needle in needles)
+        self.prefix_length = min(4, min(len(needle) for needle in needles))
+
+        # needle indices by prefix, longest needle first
+        self._by_prefix: dict[bytes, list[int]] = {}
+        for idx in sorted(range(len(needles)), key=lambda i: -len(needles[i])):
+            self._by_prefix.setdefault(needles[idx][:self.prefix_length], []).append(idx)
+
+        self._table = np.zeros(65536 if self.prefix_length >= 2 else 256, dtype=np.bool_)
+        for prefix in self._by_prefix:
+            self._table[int.from_bytes(prefix[:2], "little")] = True
+
+        self._keys = np.array(sorted(int.from_bytes(prefix, "little") for prefix in self._by_prefix),
+                              dtype=np.uint32)
+
+    def __len__(self) -> int:
+        return len(self.needles)
+
+    def find(self, haystack: Union[bytes, bytearray], addr: int = 0) -> list[tuple[int, int, int]]:
+        """Return (offset, length, needle index) tuples for all
+        occurrences of all needles, ordered by offset and longest
+        needle first."""
+        if len(self.needles) == 1:
+            length = len(self.needles[0])
+            return [(offset, length, 0) for offset in search(self.needles[0], haystack)]
+
+        count = len(haystack) - self.prefix_length + 1
+        if count <= 0:
+            return []
+
+        data = np.frombuffer(haystack, dtype=np.uint8)
+        if self.prefix_length >= 2:
+            key16 = data[:count].astype(np.uint16) | (data[1:count + 1].astype(np.uint16) << 8)
+            candidates = np.flatnonzero(self._table[key16])
+        else:
+            candidates = np.flatnonzero(self._table[data[:count]])
+
+        if self.prefix_length > 2 and len(candidates) > 0:
+            keys = np.zeros(len(candidates), dtype=np.uint32)
+            for i in range(self.prefix_length):
+                keys |= data[candidates + i].astype(np.uint32) << np.uint32(8 * i)
+            idx = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+            candidates = candidates[self._keys[idx] == keys]
+
+        results: list[tuple[int, int, int]] = []
+        for offset in candidates.tolist():
+            for needle_idx in self._by_prefix[bytes(haystack[offset:offset + self.prefix_length])]:
+                needle = self.needles[needle_idx]
+                if haystack.startswith(needle, offset):
+                    results.append((offset, len(needle), needle_idx))
+        return results
+
+
+class RegexSearch:
+    """Search for a bytes regular expression. Matches are limited to
+    'max_length' bytes, as that is all that is guaranteed to be
+    visible when the haystack is split into overlapping chunks,
+    longer matches are cut short at chunk boundaries."""
+
+    # like re.finditer(), matches never overlap each other
+    overlapping = False
+
+    def __init__(self, pattern: bytes, max_length: int) -> None:
+        if max_length < 1:
+            raise ValueError("max_length must be positive")
+
+        self.regex = re.compile(pattern, re.DOTALL)
+        self.max_length = max_length
+
+    def __len__(self) -> int:
+        return 1
+
+    def find(self, haystack: Union[bytes, bytearray], addr: int = 0) -> list[tuple[int, int, int]]:
+        """Return (offset, length, 0) tuples for all non-empty matches"""
+        return [(match.start(), match.end() - match.start(), 0)
+                for match in self.regex.finditer(haystack)
+                if match.end() != match.start()]
+
+
+def longest_fixed_run(mask: bytes) -> tuple[int, int]:
+    """Return the [beg, end) range of the longest run of 0xff in 'mask'"""
+    best = (0, 0)
+    beg = 0
+    for i, m in enumerate(mask + b"\x00"):
+        if m != 0xff:
+            if i - beg > best[1] - best[0]:
+                best = (beg, i)
+            beg = i + 1
+    return best
+
+
+class PatternSet:
+    """Search for byte patterns with wildcards, given as (value, mask)
+    tuples as produced by pack.text2pattern().
+
+    The longest run of fixed bytes in each pattern serves as anchor,
+    all anchors are located in one pass with a NeedleSet and only the
+    candidates found that way get compared against the full masked
+    pattern.
+    """
+
+    overlapping = True
+
+    def __init__(self, patterns: list[tuple[bytes, bytes]]) -> None:
+        if not patterns:
+            raise ValueError("patterns must not be empty")
+
+        self.patterns = patterns
+        self.max_length = max(len(value) for value, _ in patterns)
+
+        anchors: list[bytes] = []
+        self._anchor_offsets: list[int] = []
+        for value, mask in patterns:
+            beg, end = longest_fixed_run(mask)
+            if beg == end:
+                raise ValueError("pattern has no fixed bytes: {}".format(value.hex(" ")))
+            anchors.append(value[beg:end])
+            self._anchor_offsets.append(beg)
+        self._anchors = NeedleSet(anchors)
+
+        # masked compares are done on whole pattern sized integers
+        self._values = [int.from_bytes(value, "big") for value, _ in patterns]
+        self._masks = [int.from_bytes(mask, "big") for _, mask in patterns]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def find(self, haystack: Union[bytes, bytearray], addr: int = 0) -> list[tuple[int, int, int]]:
+        """Return (offset, length, pattern index) tuples for all matches
+        ordered by offset and longest pattern first."""
+        results: list[tuple[int, int, int]] = []
+        for anchor_offset, _, idx in self._anchors.find(haystack):
+            offset = anchor_offset - self._anchor_offsets[idx]
+            length = len(self.patterns[idx][0])
+            if offset < 0 or offset + length > len(haystack):
+                continue
+
+            if int.from_bytes(haystack[offset:offset + length], "big") & self._masks[idx] == self._values[idx]:
+                results.append((offset, length, idx))
+
+        results.sort(key=lambda m: (m[0], -m[1]))
+        return results
+
+
+# Anything that can be used to search through memory chunks, the 'addr'
+# argument of find() is only used by matchers that care about alignment
+Matcher = Union[NeedleSet, RegexSearch, PatternSet, TypedScan]
+
+
+# EOF #
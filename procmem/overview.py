@@ -0,0 +1,76 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Optional, Sequence
+
+import logging
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion, RegionTable
+from procmem.png import COLOR_RGB, DEFAULT_PNG_WIDTH, PngWriter
+from procmem.stats import PageStats
+
+
+# Color of pages that are not resident or could not be read
+UNREAD_COLOR = (48, 48, 48)
+
+
+def page_colors(chunk: Any, page_size: int, regions: Optional[RegionTable] = None) -> npt.NDArray[np.uint8]:
+    """Summarize every page of 'chunk' as an RGB pixel: red is the
+    share of aligned 64bit words pointing into 'regions', green the
+    byte entropy and blue the share of non-zero bytes. Zero pages
+    come out black."""
+    stats = PageStats(chunk, page_size, regions)
+    colors = np.stack([stats.pointer(), stats.entropy(), 1.0 - stats.zero()], axis=1)
+    result: npt.NDArray[np.uint8] = np.round(np.clip(colors, 0.0, 1.0) * 255).astype(np.uint8)
+    return result
+
+
+def write_overview(mem: Memory, regions: Sequence[MemoryRegion], filename: str,
+                   width: int = DEFAULT_PNG_WIDTH, page_size: int = 4096,
+                   resident_only: bool = False) -> int:
+    """Write an image of 'regions' with one pixel per page, every
+    region starts on a new row. Returns the number of pages read."""
+    rows = [(region.length() // page_size + width - 1) // width for region in regions]
+    all_regions = mem.regions()
+    unread = np.array(UNREAD_COLOR, dtype=np.uint8)
+
+    pages_read = 0
+    with open(filename, "wb") as fout, PngWriter(fout, width, max(1, sum(rows)), COLOR_RGB) as png:
+        for region, region_rows in zip(regions, rows):
+            logging.info("%s: row %d", region, png.rows)
+            pos = region.addr_beg
+            try:
+                for beg, end in mem.ranges(region.addr_beg, region.addr_end, resident_only):
+                    for addr, chunk in mem.chunks(beg, end):
+                        # pages skipped or cut short are marked as unread
+                        png.write(np.tile(unread, (addr - pos) // page_size).tobytes())
+                        png.write(page_colors(chunk, page_size, all_regions).tobytes())
+                        pages_read += len(chunk) // page_size
+                        pos = addr + len(chunk) // page_size * page_size
+            except (OSError, OverflowError) as err:
+                logging.warning("%s: failed to read: %s", region, err)
+
+            png.write(np.tile(unread, (region.addr_end - pos) // page_size).tobytes())
+            png.write(bytes(region_rows * width * 3 - region.length() // page_size * 3))
+    return pages_read
+
+
+# EOF #
@@ -15,10 +15,12 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import Optional
+from typing import Any, Optional
 
 import struct
 
+import numpy as np
+
 
 INT_DEFS = [
     ("b", ["int8", "i8"]),
@@ -40,6 +42,10 @@ FLOAT_DEFS = [
 ]
 
 
+# Byte patterns with wildcards, see text2pattern()
+PATTERN_TYPES = ["bytes-pattern", "bp"]
+
+
 def find_def(ctype: str, defs: list[tuple[str, list[str]]]) -> Optional[str]:
     for d, arr in defs:
         if ctype in arr:
@@ -47,6 +53,101 @@ def find_def(ctype: str, defs: list[tuple[str, list[str]]]) -> Optional[str]:
     return None
 
 
+def is_ctype(ctype: str) -> bool:
+    """Check if 'ctype' is a type understood by text2bytes()"""
+    if ctype in ["bytes", "b", "string", "s", "string0", "s0"] + PATTERN_TYPES:
+        return True
+
+    if ctype[:1] in ["<", ">", "=", "@", "!"]:
+        ctype = ctype[1:]
+
+    return find_def(ctype, INT_DEFS) is not None or find_def(ctype, FLOAT_DEFS) is not None
+
+
+def split_type_prefix(text: str, ctype: str) -> tuple[str, str]:
+    """Split a 'TYPE:' prefix overriding 'ctype' off 'text', e.g.
+    'int32:100' or 'bytes:de ad', returns the (text, ctype) tuple"""
+    prefix, sep, value = text.partition(":")
+    if sep and is_ctype(prefix):
+        return value, prefix
+    else:
+        return text, ctype
+
+
+def typed_text2bytes(text: str, ctype: str, prefix: bool = True) -> bytes:
+    """Like text2bytes(), but if 'prefix' is set, 'text' can start
+    with a 'TYPE:' prefix that overrides 'ctype'. Only needles read
+    from a file should allow that, so that arguments given on the
+    command line are always taken literally."""
+    if prefix:
+        text, ctype = split_type_prefix(text, ctype)
+    return text2bytes(text, ctype)
+
+
+def ctype2dtype(ctype: str) -> np.dtype[Any]:
+    """Return the NumPy dtype for an integer or float 'ctype', sizes
+    follow the struct module just like text2bytes()"""
+    endian = ""
+    if ctype[:1] in ["<", ">", "=", "@", "!"]:
+        endian = ctype[0]
+        ctype = ctype[1:]
+
+    byteorder = {"": "=", "@": "=", "=": "=", "<": "<", ">": ">", "!": ">"}[endian]
+
+    int_type = find_def(ctype, INT_DEFS)
+    if int_type is not None:
+        kind = "u" if int_type.isupper() else "i"
+        return np.dtype("{}{}{}".format(byteorder, kind, struct.calcsize(endian + int_type)))
+
+    float_type = find_def(ctype, FLOAT_DEFS)
+    if float_type is not None:
+        return np.dtype("{}f{}".format(byteorder, struct.calcsize(endian + float_type)))
+
+    raise RuntimeError(f"not a numeric ctype: '{ctype}'")
+
+
+def text2pattern(text: str) -> tuple[bytes, bytes]:
+    """Convert a byte pattern like '48 8B ?? ?? 89 ?5' into a (value,
+    mask) tuple of bytes. A '?' is a wildcard for a single hex digit,
+    a lone '?' for a whole byte. Wildcard bits are zero in both value
+    and mask."""
+    value = bytearray()
+    mask = bytearray()
+    for token in text.split():
+        if token == "?":
+            token = "??"
+        if len(token) % 2 != 0:
+            raise RuntimeError(f"invalid byte pattern: '{text}'")
+
+        for i in range(0, len(token), 2):
+            v = 0
+            m = 0
+            for c in token[i:i + 2]:
+                v <<= 4
+                m <<= 4
+                if c != "?":
+                    v |= int(c, 16)
+                    m |= 0xf
+            value.append(v)
+            mask.append(m)
+
+    return bytes(value), bytes(mask)
+
+
+def typed_text2pattern(text: str, ctype: str, prefix: bool = True) -> tuple[bytes, bytes]:
+    """Like typed_text2bytes(), but returns a (value, mask) tuple as
+    text2pattern() does, for types other than 'bytes-pattern' all
+    bits of the mask are set."""
+    if prefix:
+        text, ctype = split_type_prefix(text, ctype)
+
+    if ctype in PATTERN_TYPES:
+        return text2pattern(text)
+    else:
+        data = text2bytes(text, ctype)
+        return data, b"\xff" * len(data)
+
+
 def text2bytes(text: str, ctype: str) -> bytes:
     if ctype == "bytes" or ctype == "b":
         return bytes.fromhex(text)
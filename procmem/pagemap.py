@@ -0,0 +1,109 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import BinaryIO, Iterator
+
+import ctypes
+import mmap
+import os
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory_region import MemoryRegion
+
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Number of pagemap entries read at once, 512KiB worth of entries
+# covering 256MiB of address space
+PAGEMAP_BLOCK_SIZE = 64 * 1024
+
+
+def read_pagemap(fin: BinaryIO, start: int, end: int) -> npt.NDArray[np.uint64]:
+    """Read the /proc/$PID/pagemap entries for all pages touching the
+    range [start, end), one 64bit entry per page."""
+    first_page = start // PAGE_SIZE
+    last_page = (end + PAGE_SIZE - 1) // PAGE_SIZE
+    fin.seek(first_page * 8)
+    data = fin.read((last_page - first_page) * 8)
+    return np.frombuffer(data, dtype=np.uint64)
+
+
+def page_runs(entries: npt.NDArray[np.uint64], mask: int) -> list[tuple[int, int]]:
+    """Return the [beg, end) index ranges of consecutive entries that
+    have any of the bits in 'mask' set."""
+    selected = (entries & np.uint64(mask)) != 0
+    # +1 where a run starts, -1 where a run ends
+    edges = np.diff(selected.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    begs = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return list(zip(begs.tolist(), ends.tolist()))
+
+
+def resident_ranges(fin: BinaryIO, start: int, end: int,
+                    mask: int = MemoryRegion.PAGE_RAM) -> Iterator[tuple[int, int]]:
+    """Iterate over the [beg, end) address ranges within [start, end)
+    whose pages have any of the bits in 'mask' set in the pagemap,
+    by default the pages that are present in RAM. Pages that were
+    never touched or got swapped out are skipped."""
+    pending_beg = None
+    pending_end = None
+
+    block_beg = start
+    while block_beg < end:
+        block_end = min(end, (block_beg // PAGE_SIZE + PAGEMAP_BLOCK_SIZE) * PAGE_SIZE)
+        entries = read_pagemap(fin, block_beg, block_end)
+        page_base = block_beg // PAGE_SIZE * PAGE_SIZE
+
+        for beg_idx, end_idx in page_runs(entries, mask):
+            beg = max(block_beg, page_base + beg_idx * PAGE_SIZE)
+            run_end = min(block_end, page_base + end_idx * PAGE_SIZE)
+
+            # merge runs that continue across block boundaries
+            if pending_end == beg:
+                pending_end = run_end
+            else:
+                if pending_beg is not None and pending_end is not None:
+                    yield pending_beg, pending_end
+                pending_beg, pending_end = beg, run_end
+
+        block_beg = block_end
+
+    if pending_beg is not None and pending_end is not None:
+        yield pending_beg, pending_end
+
+
+def soft_dirty_supported() -> bool:
+    """Check if the kernel tracks soft-dirty pages, which requires
+    CONFIG_MEM_SOFT_DIRTY, by writing to a page of our own process"""
+    with mmap.mmap(-1, PAGE_SIZE) as buf:
+        buf[0] = 1
+        with open("/proc/self/clear_refs", "w") as fout:
+            fout.write("4")
+        buf[0] = 2
+
+        obj = ctypes.c_char.from_buffer(buf)
+        addr = ctypes.addressof(obj)
+        del obj
+
+        with open("/proc/self/pagemap", "rb", buffering=0) as fin:
+            entries = read_pagemap(fin, addr, addr + PAGE_SIZE)
+        return bool(entries[0] & np.uint64(MemoryRegion.PAGE_SOFT_DIRTY))
+
+
+# EOF #
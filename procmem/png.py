@@ -0,0 +1,155 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, BinaryIO
+
+import struct
+import zlib
+
+import numpy as np
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+COLOR_GRAY = 0
+COLOR_RGB = 2
+
+DEFAULT_PNG_WIDTH = 1024
+
+# Amount of compressed data collected before an IDAT chunk is written
+IDAT_SIZE = 1024 * 1024
+
+
+class PngWriter:
+    """Encodes a PNG image row by row, so that images of any height can
+    be written without holding them in memory. The size must be known
+    up front, rows that are never written are filled with zeroes."""
+
+    @staticmethod
+    def open(filename: str, width: int, height: int, color_type: int = COLOR_GRAY, level: int = 6) -> 'PngWriter':
+        """Create a writer for 'filename', which is closed along with it"""
+        png = PngWriter(open(filename, "wb"), width, height, color_type, level)
+        png._owns_file = True
+        return png
+
+    def __init__(self, fout: BinaryIO, width: int, height: int,
+                 color_type: int = COLOR_GRAY, level: int = 6) -> None:
+        if width <= 0 or height <= 0:
+            raise ValueError("invalid image size: {}x{}".format(width, height))
+
+        self.fout = fout
+        self.width = width
+        self.height = height
+        self.channels = 3 if color_type == COLOR_RGB else 1
+        self.row_bytes = width * self.channels
+
+        self.rows = 0
+        self.closed = False
+        self._owns_file = False
+        self._pending = bytearray()
+        self._compressed = bytearray()
+        self._compressor = zlib.compressobj(level)
+
+        self.fout.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+
+    def __enter__(self) -> 'PngWriter':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _write_chunk(self, kind: bytes, data: bytes) -> None:
+        self.fout.write(struct.pack(">I", len(data)))
+        self.fout.write(kind)
+        self.fout.write(data)
+        self.fout.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def _flush_idat(self, force: bool = False) -> None:
+        if len(self._compressed) >= IDAT_SIZE or (force and self._compressed):
+            self._write_chunk(b"IDAT", bytes(self._compressed))
+            self._compressed.clear()
+
+    @property
+    def position(self) -> int:
+        """Number of pixel bytes written so far"""
+        return self.rows * self.row_bytes + len(self._pending)
+
+    def write(self, data: Any) -> None:
+        """Append pixel data, rows may be split across calls"""
+        if self._pending:
+            self._pending += data
+            data = self._pending
+        view = np.frombuffer(data, dtype=np.uint8)
+
+        count = min(len(view) // self.row_bytes, self.height - self.rows)
+        if count > 0:
+            # every row is prefixed with filter type 0, no filtering
+            rows = np.zeros((count, self.row_bytes + 1), dtype=np.uint8)
+            rows[:, 1:] = view[:count * self.row_bytes].reshape(count, self.row_bytes)
+            self._compressed += self._compressor.compress(rows.tobytes())
+            self._flush_idat()
+            self.rows += count
+
+        rest = view[count * self.row_bytes:] if self.rows < self.height else view[:0]
+        self._pending = bytearray(rest.tobytes())
+
+    def skip(self, length: int) -> None:
+        """Append 'length' zero bytes of pixel data, the gap is encoded
+        in row batches instead of being allocated as a whole"""
+        if length <= 0:
+            return
+
+        if self._pending:
+            count = min(length, self.row_bytes - len(self._pending))
+            self.write(bytes(count))
+            length -= count
+
+        count = min(length // self.row_bytes, self.height - self.rows)
+        self._write_zero_rows(count)
+        length -= count * self.row_bytes
+
+        if self.rows < self.height:
+            self.write(bytes(length))
+
+    def _write_zero_rows(self, count: int) -> None:
+        empty_row = bytes(self.row_bytes + 1)
+        while count > 0:
+            batch = min(count, max(1, IDAT_SIZE // len(empty_row)))
+            self._compressed += self._compressor.compress(empty_row * batch)
+            self._flush_idat()
+            self.rows += batch
+            count -= batch
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        # the incomplete last row and missing rows are zero filled
+        if self._pending:
+            self.write(bytes(self.row_bytes - len(self._pending)))
+        self._write_zero_rows(self.height - self.rows)
+
+        self._compressed += self._compressor.flush()
+        self._flush_idat(force=True)
+        self._write_chunk(b"IEND", b"")
+        self.closed = True
+        if self._owns_file:
+            self.fout.close()
+
+
+# EOF #
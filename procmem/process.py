@@ -0,0 +1,369 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+import json
+import logging
+import os
+import re
+import signal
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import bytefmt
+
+
+# Number of threads reading /proc in sample(), the reads spend most of
+# their time in the kernel, so threads are enough
+DEFAULT_SAMPLE_JOBS = 16
+
+# Seconds for which ProcessCache trusts the recorded process names
+DEFAULT_CACHE_TTL = 10.0
+
+# The kernel truncates comm to 15 characters
+COMM_LENGTH = 15
+
+# Seconds stopped() waits for all threads of a process to stop
+STOP_TIMEOUT = 1.0
+
+T = TypeVar('T')
+
+
+def list_pids() -> list[int]:
+    return sorted(int(name) for name in os.listdir("/proc") if name.isdigit())
+
+
+def read_comm(pid: int) -> str:
+    with open(os.path.join("/proc", str(pid), "comm"), "r") as fin:
+        return fin.read().rstrip("\n")
+
+
+def read_stat(pid: int) -> tuple[str, int]:
+    """Return the name and the start time of a process from
+    /proc/$PID/stat, the start time tells apart processes that reused
+    the same pid"""
+    with open(os.path.join("/proc", str(pid), "stat"), "r") as fin:
+        content = fin.read()
+    # the name can contain spaces and parentheses itself
+    name_beg = content.index("(")
+    name_end = content.rindex(")")
+    fields = content[name_end + 2:].split()
+    return content[name_beg + 1:name_end], int(fields[19])
+
+
+def read_task_states(pid: int) -> list[str]:
+    """Return the state letter of every thread of a process, 'T' for
+    stopped ones"""
+    states = []
+    taskdir = os.path.join("/proc", str(pid), "task")
+    for tid in os.listdir(taskdir):
+        try:
+            with open(os.path.join(taskdir, tid, "stat"), "r") as fin:
+                content = fin.read()
+        except OSError:
+            # the thread exited in the meantime
+            continue
+        states.append(content[content.rindex(")") + 2])
+    return states
+
+
+@contextmanager
+def stopped(pid: int, timeout: float = STOP_TIMEOUT) -> Iterator[None]:
+    """Stop all threads of process 'pid' with SIGSTOP and continue it
+    when leaving the context. A process that is already stopped stays
+    stopped, a process can't stop itself."""
+    if pid == os.getpid():
+        yield
+        return
+
+    def all_stopped() -> bool:
+        return all(state in "TtZX" for state in read_task_states(pid))
+
+    if all_stopped():
+        yield
+        return
+
+    os.kill(pid, signal.SIGSTOP)
+    try:
+        # the signal is delivered to every thread asynchronously
+        deadline = time.monotonic() + timeout
+        while not all_stopped():
+            if time.monotonic() > deadline:
+                logging.warning("process %d did not stop within %s seconds", pid, timeout)
+                break
+            time.sleep(0.001)
+        yield
+    finally:
+        os.kill(pid, signal.SIGCONT)
+
+
+def read_cmdline(pid: int) -> list[str]:
+    with open(os.path.join("/proc", str(pid), "cmdline"), "rb") as fin:
+        content = fin.read()
+    return [arg.decode(errors="replace") for arg in content.split(b"\0")[:-1]]
+
+
+class ProcessInfo:
+    """A process found in /proc, the command line is only read when needed"""
+
+    def __init__(self, pid: int, name: str, start_time: int) -> None:
+        self.pid = pid
+        self.name = name
+        self.start_time = start_time
+        self._cmdline: Optional[list[str]] = None
+
+    @property
+    def cmdline(self) -> list[str]:
+        if self._cmdline is None:
+            try:
+                self._cmdline = read_cmdline(self.pid)
+            except OSError:
+                self._cmdline = []
+        return self._cmdline
+
+    def full_name(self) -> str:
+        """Return the name, completed from the command line when the
+        kernel truncated it"""
+        if len(self.name) >= COMM_LENGTH and self.cmdline:
+            basename = os.path.basename(self.cmdline[0])
+            if basename.startswith(self.name):
+                return basename
+        return self.name
+
+
+def scan_processes() -> list[ProcessInfo]:
+    """Return all processes, reading a single file per process"""
+    result = []
+    for pid in list_pids():
+        try:
+            name, start_time = read_stat(pid)
+        except (OSError, ValueError):
+            # the process exited in the meantime
+            continue
+        result.append(ProcessInfo(pid, name, start_time))
+    return result
+
+
+class ProcessMatcher:
+    """Selects processes by their exact name, by a regular expression
+    over the name or by a regular expression over the command line"""
+
+    def __init__(self, pattern: str, regex: bool = False, cmdline: bool = False) -> None:
+        self.pattern = pattern
+        self.cmdline = cmdline
+        self.regex = re.compile(pattern) if regex or cmdline else None
+
+    def match(self, process: ProcessInfo) -> bool:
+        if self.cmdline:
+            assert self.regex is not None
+            return self.regex.search(" ".join(process.cmdline)) is not None
+        elif self.regex is not None:
+            return self.regex.search(process.full_name()) is not None
+        else:
+            return process.full_name() == self.pattern
+
+
+def _is_private_stat(st: os.stat_result, dir_mode: bool = False) -> bool:
+    kind = stat.S_ISDIR if dir_mode else stat.S_ISREG
+    return kind(st.st_mode) and st.st_uid == os.getuid() and st.st_mode & 0o077 == 0
+
+
+def _is_private(path: str, dir_mode: bool = False) -> bool:
+    """Return True if 'path' isn't a symlink and is owned and only
+    accessible by the current user"""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return _is_private_stat(st, dir_mode)
+
+
+class ProcessCache:
+    """Remembers the pid, start time and name of all processes for a
+    short time, so that looking up a process by name again doesn't
+    need a scan of /proc. Cached hits are verified by their start
+    time, but processes started after the cache was written are only
+    found once it expired.
+
+    The cache decides which process gets written to, so it is only
+    kept in a directory private to the user and only trusted when it
+    is owned by the user and not accessible by anybody else."""
+
+    @staticmethod
+    def default_path() -> Optional[str]:
+        """Return the cache file in $XDG_RUNTIME_DIR or in a private
+        directory in /tmp, None if neither can be used safely"""
+        directory = os.environ.get("XDG_RUNTIME_DIR")
+        if not directory:
+            directory = os.path.join(tempfile.gettempdir(), "procmem-{}".format(os.getuid()))
+            try:
+                os.mkdir(directory, 0o700)
+            except FileExistsError:
+                pass
+            except OSError:
+                return None
+
+        if not _is_private(directory, dir_mode=True):
+            return None
+        return os.path.join(directory, "procmem-{}-processes.json".format(os.getuid()))
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_CACHE_TTL) -> None:
+        self.path = path if path is not None else ProcessCache.default_path()
+        self.ttl = ttl
+
+    def load(self) -> Optional[list[ProcessInfo]]:
+        """Return the cached processes or None if the cache expired or
+        can't be trusted"""
+        if self.path is None:
+            return None
+
+        try:
+            fd = os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return None
+
+        try:
+            with os.fdopen(fd, "r") as fin:
+                if not _is_private_stat(os.fstat(fin.fileno())):
+                    return None
+                js = json.load(fin)
+        except (OSError, ValueError):
+            return None
+
+        if not 0 <= time.time() - js["time"] < self.ttl:
+            return None
+        return [ProcessInfo(pid, name, start_time) for pid, start_time, name in js["processes"]]
+
+    def save(self, processes: list[ProcessInfo]) -> None:
+        if self.path is None:
+            return
+
+        js: dict[str, Any] = {
+            "time": time.time(),
+            "processes": [[process.pid, process.start_time, process.name] for process in processes],
+        }
+        # written to a new temporary file first, so concurrent readers
+        # never see a partial cache, O_EXCL and O_NOFOLLOW keep it from
+        # being redirected somewhere else
+        tmp_path = "{}.{}".format(self.path, os.getpid())
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600)
+        try:
+            with os.fdopen(fd, "w") as fout:
+                json.dump(js, fout)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def find_processes(matcher: ProcessMatcher, cache: Optional[ProcessCache] = None) -> list[int]:
+    """Return the pids of all processes selected by 'matcher'
+
+    A lookup that finds nothing current in the cache falls back to a
+    scan of /proc, the process might have been started after the cache
+    was written, so the scan replaces the cache."""
+    if cache is not None and not matcher.cmdline:
+        processes = cache.load()
+        if processes is not None:
+            result = []
+            for process in processes:
+                if matcher.match(process):
+                    try:
+                        if read_stat(process.pid)[1] == process.start_time:
+                            result.append(process.pid)
+                    except (OSError, ValueError):
+                        pass
+            if result:
+                return result
+
+    processes = scan_processes()
+    if cache is not None:
+        try:
+            cache.save(processes)
+        except OSError:
+            pass
+    return [process.pid for process in processes if matcher.match(process)]
+
+
+def read_statm(pid: int) -> list[int]:
+    """Return the fields of /proc/$PID/statm, all counted in pages"""
+    with open(os.path.join("/proc", str(pid), "statm"), "r") as fin:
+        return [int(x) for x in fin.read().split()]
+
+
+def read_smaps_rollup(pid: int) -> dict[str, int]:
+    """Return the counters of /proc/$PID/smaps_rollup in bytes, which
+    are the smaps counters summed over all regions, but much cheaper
+    for the kernel to produce"""
+    result: dict[str, int] = {}
+    with open(os.path.join("/proc", str(pid), "smaps_rollup"), "r") as fin:
+        # the first line is a pseudo region header covering the whole address space
+        fin.readline()
+        for line in fin:
+            key, _, value = line.partition(":")
+            value = value.strip()
+            if value.endswith(" kB"):
+                result[key] = int(value[:-3]) * 1024
+    return result
+
+
+def select_pids(pattern: Optional[str] = None, pids: Optional[list[int]] = None) -> list[int]:
+    """Return the given 'pids' and all processes whose name matches
+    the regular expression 'pattern'"""
+    result = set(pids or [])
+    if pattern is not None:
+        result.update(find_processes(ProcessMatcher(pattern, regex=True)))
+    return sorted(result)
+
+
+def sample(pids: list[int], func: Callable[[int], T],
+           jobs: int = DEFAULT_SAMPLE_JOBS) -> list[tuple[int, T]]:
+    """Call 'func' for all 'pids' concurrently and return the (pid,
+    result) pairs in order, processes that exited or can't be accessed
+    are left out"""
+    def call(pid: int) -> Optional[tuple[int, T]]:
+        try:
+            return pid, func(pid)
+        except (OSError, ValueError):
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return [result for result in executor.map(call, pids) if result is not None]
+
+
+def print_process_table(headers: list[str], rows: list[tuple[int, tuple[str, list[int]]]]) -> None:
+    """Print one line of byte counts per process followed by their total"""
+    print("{:>8}  {:16}".format("PID", "NAME") + "".join("  {:>10}".format(header) for header in headers))
+    totals = [0] * len(headers)
+    for pid, (name, values) in rows:
+        print("{:>8}  {:16}".format(pid, name[:16]) +
+              "".join("  {:>10}".format(bytefmt.humanize(value, style="binary")) for value in values))
+        totals = [total + value for total, value in zip(totals, values)]
+    print("-" * (26 + 12 * len(headers)))
+    print("{:>8}  {:16}".format(len(rows), "TOTAL") +
+          "".join("  {:>10}".format(bytefmt.humanize(total, style="binary")) for total in totals))
+
+
+# EOF #
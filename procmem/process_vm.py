@@ -0,0 +1,75 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Sequence, Union
+
+import ctypes
+import ctypes.util
+import os
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_process_vm_readv = _libc.process_vm_readv
+_process_vm_readv.restype = ctypes.c_ssize_t
+_process_vm_readv.argtypes = [ctypes.c_int,
+                              ctypes.POINTER(iovec), ctypes.c_ulong,
+                              ctypes.POINTER(iovec), ctypes.c_ulong,
+                              ctypes.c_ulong]
+
+# Maximum number of iovec elements the kernel accepts per call
+IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+
+def process_vm_readv(pid: int, requests: Sequence[tuple[int, Union[bytearray, memoryview]]]) -> int:
+    """Read the remote address ranges of 'requests', a list of
+    (address, buffer) tuples, with a single process_vm_readv() call
+    and return the total number of bytes read.
+
+    On a partial read the buffers are filled in order and the return
+    value tells how far the kernel got. At most IOV_MAX requests can
+    be passed at once.
+    """
+
+    assert len(requests) <= IOV_MAX
+
+    local_iov = (iovec * len(requests))()
+    remote_iov = (iovec * len(requests))()
+    # keep the ctypes views alive until the call is done
+    views: list[Any] = []
+    for i, (addr, buf) in enumerate(requests):
+        view = (ctypes.c_char * len(buf)).from_buffer(buf)
+        views.append(view)
+        local_iov[i].iov_base = ctypes.addressof(view)
+        local_iov[i].iov_len = len(buf)
+        remote_iov[i].iov_base = addr
+        remote_iov[i].iov_len = len(buf)
+
+    result = _process_vm_readv(pid, local_iov, len(requests), remote_iov, len(requests), 0)
+    del views
+    if result < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    return int(result)
+
+
+# EOF #
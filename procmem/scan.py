@@ -0,0 +1,93 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Callable, Iterable, Iterator, Optional
+
+import functools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Bytes of memory each worker reads and scans per task
+PARALLEL_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Function returning (offset, length, pattern index) for all matches in
+# a buffer, the second argument is the address of the buffer
+FindFunc = Callable[[bytes, int], list[tuple[int, int, int]]]
+
+
+# /proc/$PID/mem file descriptor of the current worker process
+_mem_fd: Optional[int] = None
+
+
+def _init_worker(pid: int) -> None:
+    global _mem_fd
+    _mem_fd = os.open(os.path.join("/proc", str(pid), "mem"), os.O_RDONLY)
+
+
+def _scan_chunk(find: FindFunc, start: int, end: int, stop: int) -> list[tuple[int, int, int]]:
+    """Read [start, stop) and return (address, length, pattern index)
+    for all matches that start before 'end', the bytes after it only
+    serve as overlap."""
+    assert _mem_fd is not None
+    try:
+        data = os.pread(_mem_fd, stop - start, start)
+    except (OSError, OverflowError) as err:
+        logging.warning("failed to read %016x-%016x: %s", start, stop, err)
+        return []
+
+    return [(start + offset, length, idx) for offset, length, idx in find(data, start) if offset < end - start]
+
+
+def split_ranges(ranges: Iterable[tuple[int, int]], chunk_size: int,
+                 overlap: int) -> list[tuple[int, int, int]]:
+    """Split [beg, end) ranges into (start, end, stop) chunks, where
+    [start, end) is the part of the range owned by the chunk and
+    [end, stop) up to 'overlap' bytes shared with the next chunk."""
+    chunks: list[tuple[int, int, int]] = []
+    for beg, end in ranges:
+        for start in range(beg, end, chunk_size):
+            chunk_end = min(end, start + chunk_size)
+            chunks.append((start, chunk_end, min(end, chunk_end + overlap)))
+    return chunks
+
+
+def parallel_scan(pid: int, ranges: Iterable[tuple[int, int]], find: FindFunc, overlap: int,
+                  jobs: Optional[int] = None,
+                  chunk_size: int = PARALLEL_CHUNK_SIZE) -> Iterator[tuple[int, int, int]]:
+    """Scan the memory ranges of process 'pid' with 'find' spread over
+    'jobs' worker processes, each reading through its own file
+    descriptor. 'overlap' must be at least the maximum match length
+    minus one. (address, length, pattern index) tuples are yielded in
+    address order.
+
+    'find' must be picklable, e.g. a module level function, a
+    functools.partial() of one or a method like NeedleSet.find.
+    """
+
+    chunks = split_ranges(ranges, chunk_size, overlap)
+    if not chunks:
+        return
+
+    starts, ends, stops = zip(*chunks)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(pid,)) as executor:
+        for matches in executor.map(functools.partial(_scan_chunk, find), starts, ends, stops):
+            yield from matches
+
+
+# EOF #
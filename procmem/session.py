@@ -0,0 +1,166 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, BinaryIO, Iterator, Optional
+
+import json
+import os
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.pack import ctype2dtype
+
+
+# Number of candidates buffered in memory before they are written out
+SPILL_THRESHOLD = 1024 * 1024
+
+# Number of candidates processed at once by ScanSession.candidates()
+CANDIDATE_BLOCK_SIZE = 64 * 1024
+
+
+class CandidateWriter:
+    """Collects the (address, value) candidates of a scan, batches
+    are kept in memory until they exceed SPILL_THRESHOLD entries and
+    are then appended to the files backing the session."""
+
+    def __init__(self, addr_file: str, value_file: str, dtype: np.dtype[Any]) -> None:
+        self.dtype = dtype
+        self.count = 0
+
+        self._addr_fp: BinaryIO = open(addr_file, "wb")
+        self._value_fp: BinaryIO = open(value_file, "wb")
+        self._addrs: list[npt.NDArray[np.uint64]] = []
+        self._values: list[npt.NDArray[Any]] = []
+        self._pending = 0
+
+    def append(self, addrs: npt.NDArray[Any], values: npt.NDArray[Any]) -> None:
+        """Add candidates, 'addrs' must be sorted and come after all
+        previously added addresses"""
+        assert len(addrs) == len(values)
+        if len(addrs) == 0:
+            return
+
+        self._addrs.append(addrs.astype(np.uint64))
+        self._values.append(values.astype(self.dtype))
+        self._pending += len(addrs)
+        self.count += len(addrs)
+
+        if self._pending >= SPILL_THRESHOLD:
+            self.flush()
+
+    def flush(self) -> None:
+        for addrs in self._addrs:
+            addrs.tofile(self._addr_fp)
+        for values in self._values:
+            values.tofile(self._value_fp)
+
+        self._addrs = []
+        self._values = []
+        self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._addr_fp.close()
+        self._value_fp.close()
+
+
+class ScanSession:
+    """A set of candidate addresses along with the value they had at
+    the last scan, stored in the directory 'path'.
+
+    Addresses and values are kept as raw arrays in the files
+    'addresses' and 'values' and are memory mapped on access, so that
+    sessions with more candidates than fit in RAM can be narrowed
+    down."""
+
+    def __init__(self, path: str, pid: int, ctype: str, alignment: int,
+                 count: int = 0, generation: int = 0) -> None:
+        self.path = path
+        self.pid = pid
+        self.ctype = ctype
+        self.alignment = alignment
+        self.count = count
+        self.generation = generation
+
+        self.dtype = ctype2dtype(ctype)
+
+    @staticmethod
+    def create(path: str, pid: int, ctype: str, alignment: int) -> 'ScanSession':
+        os.makedirs(path, exist_ok=True)
+        session = ScanSession(path, pid, ctype, alignment)
+        for filename in [session.addr_file, session.value_file]:
+            open(filename, "wb").close()
+        session.save()
+        return session
+
+    @staticmethod
+    def load(path: str) -> 'ScanSession':
+        with open(os.path.join(path, "session.json"), "r") as fin:
+            js = json.load(fin)
+        return ScanSession(path, js["pid"], js["type"], js["alignment"], js["count"], js["generation"])
+
+    def save(self) -> None:
+        js = {
+            "pid": self.pid,
+            "type": self.ctype,
+            "alignment": self.alignment,
+            "count": self.count,
+            "generation": self.generation,
+        }
+        tmpfile = os.path.join(self.path, "session.json.tmp")
+        with open(tmpfile, "w") as fout:
+            json.dump(js, fout, indent=2)
+        os.replace(tmpfile, os.path.join(self.path, "session.json"))
+
+    @property
+    def addr_file(self) -> str:
+        return os.path.join(self.path, "addresses")
+
+    @property
+    def value_file(self) -> str:
+        return os.path.join(self.path, "values")
+
+    def writer(self) -> CandidateWriter:
+        """Return a writer for the next generation of candidates, it
+        only replaces the current ones once passed to commit()"""
+        return CandidateWriter(self.addr_file + ".new", self.value_file + ".new", self.dtype)
+
+    def commit(self, writer: CandidateWriter) -> None:
+        writer.close()
+        os.replace(self.addr_file + ".new", self.addr_file)
+        os.replace(self.value_file + ".new", self.value_file)
+        self.count = writer.count
+        self.generation += 1
+        self.save()
+
+    def candidates(self, block_size: int = CANDIDATE_BLOCK_SIZE,
+                   limit: Optional[int] = None) -> Iterator[tuple[npt.NDArray[np.uint64], npt.NDArray[Any]]]:
+        """Yield the (addresses, values) candidates in blocks of at
+        most 'block_size' entries"""
+        count = self.count if limit is None else min(limit, self.count)
+        if count == 0:
+            return
+
+        addrs = np.memmap(self.addr_file, dtype=np.uint64, mode="r", shape=(self.count,))
+        values = np.memmap(self.value_file, dtype=self.dtype, mode="r", shape=(self.count,))
+        for i in range(0, count, block_size):
+            j = min(count, i + block_size)
+            yield np.asarray(addrs[i:j]), np.asarray(values[i:j])
+
+
+# EOF #
@@ -0,0 +1,475 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, BinaryIO, Iterable, Optional, Sequence
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion, region_mask
+from procmem.pagemap import PAGE_SIZE
+from procmem.process import stopped
+
+
+# Compact snapshots of the memory of a process
+#
+# A snapshot file looks like this:
+#
+#     MAGIC
+#     compressed blocks of BLOCK_PAGES unique pages each
+#     page_addrs     uint64[pages]     sorted address of every captured page
+#     page_refs      int64[pages]      index of the unique page, ZERO_PAGE for zero pages
+#     page_digests   uint8[pages, 16]  blake2b digest of the page content
+#     block_offsets  uint64[blocks+1]  file offset of every block and the end of the last one
+#     index_addrs    uint64[index]     page_addrs merged with the pages inherited from the parents
+#     index_refs     int64[index]      page_refs of the merged pages in the layer they are stored in
+#     index_layers   uint32[index]     layer of the merged pages, 0 for this file, 1 for the parent, ...
+#     index_digests  uint8[index, 16]  page_digests of the merged pages
+#     footer         JSON with the regions, sizes, the offsets of the arrays and the parent files
+#     trailer        footer offset, footer length, MAGIC
+#
+# Pages with identical content are only stored once and zero pages not
+# at all. The arrays are memory mapped on open, so that lookups by
+# address are a binary search over page_addrs without reading the whole
+# index.
+#
+# A layer of an incremental series only stores the pages that changed
+# since its parent, the index_ arrays are only written for those. They
+# cover the pages of all layers, so that opening a layer never has to
+# open its parents, those are only opened when a page stored in them is
+# read. A snapshot without a parent uses its page_ arrays as index.
+MAGIC = b"PMSNAP01"
+TRAILER = struct.Struct("<QQ8s")
+
+# Number of unique pages compressed together
+BLOCK_PAGES = 16
+
+# zlib level used for the blocks, memory compresses well even at the fastest level
+DEFAULT_COMPRESSION_LEVEL = 1
+
+# Number of decompressed blocks kept around by Snapshot
+BLOCK_CACHE_SIZE = 16
+
+# page_refs value of pages that contain only zeros
+ZERO_PAGE = -1
+
+DIGEST_SIZE = 16
+
+
+def page_digest(page: Any) -> bytes:
+    return hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest()
+
+
+def split_pages(data: Any, page_size: int) -> tuple[npt.NDArray[np.uint8], npt.NDArray[np.bool_]]:
+    """View 'data' as an array of whole pages and return it along with
+    a mask of the pages that contain anything but zeros"""
+    count = len(data) // page_size
+    pages = np.frombuffer(data, dtype=np.uint8, count=count * page_size).reshape(count, page_size)
+    nonzero: npt.NDArray[np.bool_]
+    if page_size % 8 == 0:
+        nonzero = np.count_nonzero(pages.view(np.uint64), axis=1) > 0
+    else:
+        nonzero = np.count_nonzero(pages, axis=1) > 0
+    return pages, nonzero
+
+
+def page_digests(data: Any, page_size: int) -> npt.NDArray[np.uint8]:
+    """Return the digests of all whole pages in 'data', zero pages
+    aren't hashed"""
+    pages, nonzero = split_pages(data, page_size)
+    digests = np.tile(np.frombuffer(page_digest(bytes(page_size)), dtype=np.uint8), (len(pages), 1))
+    for i in np.flatnonzero(nonzero).tolist():
+        digests[i] = np.frombuffer(page_digest(pages[i]), dtype=np.uint8)
+    return digests
+
+
+class SnapshotWriter:
+    """Writes a snapshot, pages have to be added in ascending address
+    order and only once"""
+
+    def __init__(self, filename: str, regions: Sequence[MemoryRegion],
+                 level: int = DEFAULT_COMPRESSION_LEVEL, page_size: int = PAGE_SIZE,
+                 meta: Optional[dict[str, Any]] = None) -> None:
+        self.filename = filename
+        self.regions = regions
+        self.level = level
+        self.page_size = page_size
+        self.meta = meta or {}
+
+        self.zero_digest = page_digest(bytes(page_size))
+        self._fout: BinaryIO = open(filename, "wb")
+        self._fout.write(MAGIC)
+
+        self._unique: dict[bytes, int] = {}
+        self._block = bytearray()
+        self._block_offsets: list[int] = [self._fout.tell()]
+
+        self._page_addrs: list[npt.NDArray[np.uint64]] = []
+        self._page_refs: list[npt.NDArray[np.int64]] = []
+        self._page_digests: list[npt.NDArray[np.uint8]] = []
+        self._last_addr = -1
+
+        self.zero_pages = 0
+        self.duplicate_pages = 0
+
+    def __enter__(self) -> 'SnapshotWriter':
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def unique_pages(self) -> int:
+        return len(self._unique)
+
+    @property
+    def pages(self) -> int:
+        return sum(len(addrs) for addrs in self._page_addrs)
+
+    def add(self, addr: int, data: Any) -> None:
+        """Add the pages of 'data' located at the page aligned 'addr',
+        a trailing partial page is ignored"""
+        assert addr % self.page_size == 0
+        assert addr > self._last_addr
+
+        pages, nonzero = split_pages(data, self.page_size)
+        count = len(pages)
+        if count == 0:
+            return
+
+        refs = np.full(count, ZERO_PAGE, dtype=np.int64)
+        digests = np.tile(np.frombuffer(self.zero_digest, dtype=np.uint8), (count, 1))
+        for i in np.flatnonzero(nonzero).tolist():
+            digest = page_digest(pages[i])
+            digests[i] = np.frombuffer(digest, dtype=np.uint8)
+            ref = self._unique.get(digest)
+            if ref is None:
+                ref = self._add_unique(digest, pages[i])
+            else:
+                self.duplicate_pages += 1
+            refs[i] = ref
+
+        self.zero_pages += count - int(np.count_nonzero(nonzero))
+        self._page_addrs.append(addr + np.arange(count, dtype=np.uint64) * self.page_size)
+        self._page_refs.append(refs)
+        self._page_digests.append(digests)
+        self._last_addr = addr + (count - 1) * self.page_size
+
+    def _add_unique(self, digest: bytes, page: npt.NDArray[np.uint8]) -> int:
+        ref = len(self._unique)
+        self._unique[digest] = ref
+        self._block += page.tobytes()
+        if len(self._block) >= BLOCK_PAGES * self.page_size:
+            self._flush_block()
+        return ref
+
+    def _flush_block(self) -> None:
+        if self._block:
+            self._fout.write(zlib.compress(self._block, self.level))
+            self._block_offsets.append(self._fout.tell())
+            self._block = bytearray()
+
+    def _write_array(self, arr: npt.NDArray[Any]) -> int:
+        # keep the arrays aligned, so they can be mapped directly
+        self._fout.write(bytes(-self._fout.tell() % 8))
+        offset = self._fout.tell()
+        self._fout.write(arr.tobytes())
+        return offset
+
+    def _merge_parent(self, page_addrs: npt.NDArray[np.uint64], page_refs: npt.NDArray[np.int64],
+                      page_digests: npt.NDArray[np.uint8]) -> tuple[dict[str, npt.NDArray[Any]], list[str]]:
+        """Merge our pages with those inherited from the parent and
+        return the index arrays along with the files of all parents"""
+        directory = os.path.dirname(self.filename)
+        with Snapshot.open(os.path.join(directory, self.meta["parent"])) as parent:
+            # pages of the parent that are still mapped and weren't written to since
+            inherited = np.flatnonzero(region_mask(self.regions, parent.page_addrs) &
+                                       ~np.isin(parent.page_addrs, page_addrs, assume_unique=True))
+
+            addrs = np.concatenate((parent.page_addrs[inherited], page_addrs))
+            order = np.argsort(addrs, kind="stable")
+            index: dict[str, npt.NDArray[Any]] = {
+                "index_addrs": addrs[order],
+                "index_refs": np.concatenate((parent.page_refs[inherited], page_refs))[order],
+                "index_layers": np.concatenate((parent.page_layers[inherited] + 1,
+                                                np.zeros(len(page_addrs), dtype=np.uint32)))[order],
+                "index_digests": np.concatenate((parent.page_digests[inherited], page_digests))[order],
+            }
+            if os.path.dirname(self.meta["parent"]) == "":
+                # the usual case of a series kept in one directory
+                layers = [self.meta["parent"]] + parent.footer["layers"]
+            else:
+                layers = [self.meta["parent"]] + [os.path.relpath(filename, directory or ".")
+                                                  for filename in parent.layer_files]
+        return index, layers
+
+    def abort(self) -> None:
+        """Close the file without the page index and the trailer, which
+        marks it as incomplete"""
+        self._fout.close()
+
+    def close(self) -> None:
+        if self._fout.closed:
+            return
+
+        self._flush_block()
+
+        page_addrs = np.concatenate(self._page_addrs) if self._page_addrs else np.zeros(0, dtype=np.uint64)
+        page_refs = np.concatenate(self._page_refs) if self._page_refs else np.zeros(0, dtype=np.int64)
+        page_digests = (np.concatenate(self._page_digests) if self._page_digests
+                        else np.zeros((0, DIGEST_SIZE), dtype=np.uint8))
+
+        arrays = {
+            "page_addrs": self._write_array(page_addrs),
+            "page_refs": self._write_array(page_refs),
+            "page_digests": self._write_array(page_digests),
+            "block_offsets": self._write_array(np.array(self._block_offsets, dtype=np.uint64)),
+        }
+
+        index_pages = len(page_addrs)
+        layers: list[str] = []
+        if self.meta.get("parent") is not None:
+            index, layers = self._merge_parent(page_addrs, page_refs, page_digests)
+            index_pages = len(index["index_addrs"])
+            for name, arr in index.items():
+                arrays[name] = self._write_array(arr)
+
+        footer = dict(self.meta)
+        footer.update({
+            "version": 2,
+            "time": time.time(),
+            "page_size": self.page_size,
+            "block_pages": BLOCK_PAGES,
+            "compression": "zlib",
+            "pages": len(page_addrs),
+            "unique_pages": self.unique_pages,
+            "blocks": len(self._block_offsets) - 1,
+            "index_pages": index_pages,
+            "layers": layers,
+            "regions": [region.to_json() for region in self.regions],
+            "arrays": arrays,
+        })
+
+        footer_data = json.dumps(footer).encode()
+        footer_offset = self._fout.tell()
+        self._fout.write(footer_data)
+        self._fout.write(TRAILER.pack(footer_offset, len(footer_data), MAGIC))
+        self._fout.close()
+
+
+class Snapshot:
+    """Read access to a snapshot written by SnapshotWriter
+
+    A snapshot with a 'parent' only contains the pages that changed
+    since the parent was taken, all other pages of its regions are
+    read from the parent files. page_addrs and page_digests cover the
+    pages of all layers, the parent files are only opened when one of
+    their pages is read."""
+
+    @staticmethod
+    def open(filename: str) -> 'Snapshot':
+        return Snapshot(filename)
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._fin: BinaryIO = open(filename, "rb")
+        try:
+            self.footer: dict[str, Any] = self._read_footer()
+        except BaseException:
+            self._fin.close()
+            raise
+
+        self.page_size: int = self.footer["page_size"]
+        self.block_pages: int = self.footer["block_pages"]
+        self.regions = [MemoryRegion.from_json(js) for js in self.footer["regions"]]
+
+        arrays = self.footer["arrays"]
+        pages = self.footer["pages"]
+        self.block_offsets = self._map_array(arrays["block_offsets"], np.dtype(np.uint64),
+                                             (self.footer["blocks"] + 1,))
+
+        directory = os.path.dirname(filename)
+        self.layer_files = [os.path.join(directory, name) for name in self.footer.get("layers", [])]
+        self._layers: dict[int, Snapshot] = {}
+
+        self.page_addrs: npt.NDArray[np.uint64]
+        self.page_refs: npt.NDArray[np.int64]
+        self.page_layers: npt.NDArray[np.uint32]
+        self.page_digests: npt.NDArray[np.uint8]
+        if "index_addrs" in arrays:
+            index_pages = self.footer["index_pages"]
+            self.page_addrs = self._map_array(arrays["index_addrs"], np.dtype(np.uint64), (index_pages,))
+            self.page_refs = self._map_array(arrays["index_refs"], np.dtype(np.int64), (index_pages,))
+            self.page_layers = self._map_array(arrays["index_layers"], np.dtype(np.uint32), (index_pages,))
+            self.page_digests = self._map_array(arrays["index_digests"], np.dtype(np.uint8),
+                                                (index_pages, DIGEST_SIZE))
+        elif self.footer.get("parent") is None:
+            self.page_addrs = self._map_array(arrays["page_addrs"], np.dtype(np.uint64), (pages,))
+            self.page_refs = self._map_array(arrays["page_refs"], np.dtype(np.int64), (pages,))
+            self.page_layers = np.zeros(pages, dtype=np.uint32)
+            self.page_digests = self._map_array(arrays["page_digests"], np.dtype(np.uint8), (pages, DIGEST_SIZE))
+        else:
+            self._fin.close()
+            raise Exception("{}: layer without a page index, written by an older procmem".format(filename))
+
+        self._block_cache: OrderedDict[int, bytes] = OrderedDict()
+
+    def _read_footer(self) -> dict[str, Any]:
+        if self._fin.read(len(MAGIC)) != MAGIC:
+            raise Exception("{}: not a procmem snapshot".format(self.filename))
+
+        if os.fstat(self._fin.fileno()).st_size < len(MAGIC) + TRAILER.size:
+            raise Exception("{}: truncated or incomplete snapshot".format(self.filename))
+        self._fin.seek(-TRAILER.size, 2)
+        footer_offset, footer_length, magic = TRAILER.unpack(self._fin.read(TRAILER.size))
+        if magic != MAGIC:
+            raise Exception("{}: truncated or incomplete snapshot".format(self.filename))
+        self._fin.seek(footer_offset)
+        footer: dict[str, Any] = json.loads(self._fin.read(footer_length))
+        return footer
+
+    def _map_array(self, offset: int, dtype: np.dtype[Any], shape: tuple[int, ...]) -> npt.NDArray[Any]:
+        if int(np.prod(shape)) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._fin.close()
+        for layer in self._layers.values():
+            layer.close()
+        self._layers.clear()
+
+    def layer(self, idx: int) -> 'Snapshot':
+        """Return the file of layer 'idx', 0 is this file, 1 its
+        parent and so on"""
+        if idx == 0:
+            return self
+
+        snap = self._layers.get(idx)
+        if snap is None:
+            snap = Snapshot.open(self.layer_files[idx - 1])
+            self._layers[idx] = snap
+        return snap
+
+    def find_page(self, addr: int) -> Optional[int]:
+        """Return the index of the page containing 'addr' or None if
+        the page wasn't captured"""
+        page_addr = addr - addr % self.page_size
+        idx = int(np.searchsorted(self.page_addrs, page_addr))
+        if idx < len(self.page_addrs) and int(self.page_addrs[idx]) == page_addr:
+            return idx
+        else:
+            return None
+
+    def _read_block(self, block_idx: int) -> bytes:
+        block = self._block_cache.get(block_idx)
+        if block is not None:
+            self._block_cache.move_to_end(block_idx)
+            return block
+
+        beg, end = int(self.block_offsets[block_idx]), int(self.block_offsets[block_idx + 1])
+        self._fin.seek(beg)
+        block = zlib.decompress(self._fin.read(end - beg))
+
+        self._block_cache[block_idx] = block
+        if len(self._block_cache) > BLOCK_CACHE_SIZE:
+            self._block_cache.popitem(last=False)
+        return block
+
+    def read_page(self, idx: int) -> bytes:
+        """Return the content of the page at index 'idx' of page_addrs"""
+        ref = int(self.page_refs[idx])
+        if ref == ZERO_PAGE:
+            return bytes(self.page_size)
+
+        layer = self.layer(int(self.page_layers[idx]))
+        block = layer._read_block(ref // layer.block_pages)
+        offset = (ref % layer.block_pages) * layer.page_size
+        return block[offset:offset + layer.page_size]
+
+    def read(self, start: int, end: int) -> bytes:
+        """Return the memory in [start, end), pages that weren't
+        captured read as zeros"""
+        result = bytearray()
+        addr = start
+        while addr < end:
+            page_addr = addr - addr % self.page_size
+            stop = min(end, page_addr + self.page_size)
+            idx = self.find_page(addr)
+            if idx is None:
+                result += bytes(stop - addr)
+            else:
+                result += self.read_page(idx)[addr - page_addr:stop - page_addr]
+            addr = stop
+        return bytes(result)
+
+
+def _add_ranges(mem: Memory, region: MemoryRegion, ranges: Iterable[tuple[int, int]],
+                writer: SnapshotWriter) -> None:
+    try:
+        for beg, end in ranges:
+            for addr, chunk in mem.chunks(beg, end):
+                writer.add(addr, chunk)
+    except (OSError, OverflowError) as err:
+        logging.warning("%012x-%012x %s: failed to read: %s",
+                        region.addr_beg, region.addr_end, region.pathname, err)
+
+
+def take_snapshot(mem: Memory, regions: Iterable[MemoryRegion], writer: SnapshotWriter,
+                  resident_only: bool = False) -> None:
+    """Add the content of 'regions' to 'writer'"""
+    for region in regions:
+        _add_ranges(mem, region, mem.ranges(region.addr_beg, region.addr_end, resident_only), writer)
+
+
+def take_delta_snapshot(mem: Memory, regions: Iterable[MemoryRegion], writer: SnapshotWriter) -> None:
+    """Add the pages of 'regions' written to since the last
+    Memory.clear_soft_dirty() to 'writer' and clear the soft-dirty
+    bits again for the next delta"""
+    # the process is stopped while the dirty pages are looked up and
+    # the bits are cleared, otherwise a page written after its lookup
+    # would lose its bit without being captured. The pages are read
+    # after the process continued, writes happening while they are
+    # read mark them dirty again, so they show up in the next delta.
+    with stopped(mem.pid):
+        dirty = [(region, list(mem.dirty_ranges(region.addr_beg, region.addr_end))) for region in regions]
+        mem.clear_soft_dirty()
+
+    for region, ranges in dirty:
+        _add_ranges(mem, region, ranges, writer)
+
+
+# EOF #
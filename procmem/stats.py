@@ -0,0 +1,181 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Optional, Sequence
+
+import logging
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion, RegionTable
+
+
+# Metrics available for sorting, 'size' is the number of bytes read
+METRICS = ["entropy", "zero", "pointer", "size"]
+
+
+class PageStats:
+    """Byte histograms and pointer counts of consecutive pages, all
+    pages are looked at in one bincount and one searchsorted"""
+
+    def __init__(self, chunk: Any, page_size: int, regions: Optional[RegionTable] = None) -> None:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        count = len(data) // page_size
+        pages = data[:count * page_size].reshape(count, page_size)
+
+        self.page_size = page_size
+        self.histograms = np.zeros((count, 256), dtype=np.int64)
+        self.pointers = np.zeros(count, dtype=np.int64)
+
+        # zero pages are common and need no further work
+        self.histograms[:, 0] = page_size
+        nonzero_idx = np.flatnonzero(np.count_nonzero(pages, axis=1))
+        if len(nonzero_idx) == 0:
+            return
+        pages = pages[nonzero_idx]
+
+        keys = np.arange(len(pages), dtype=np.int64)[:, None] * 256 + pages
+        self.histograms[nonzero_idx] = np.bincount(keys.reshape(-1), minlength=len(pages) * 256).reshape(-1, 256)
+
+        if regions is not None and page_size % 8 == 0:
+            words = pages.view(np.uint64)
+            word_idx = np.flatnonzero(words)
+            hits = word_idx[regions.locate(words.reshape(-1)[word_idx]) >= 0]
+            self.pointers[nonzero_idx] = np.bincount(hits // words.shape[1], minlength=len(pages))
+
+    def __len__(self) -> int:
+        return len(self.pointers)
+
+    def entropy(self) -> npt.NDArray[np.float64]:
+        """Shannon entropy of every page, 0.0 to 1.0 for 0 to 8 bits per byte"""
+        return histogram_entropy(self.histograms)
+
+    def zero(self) -> npt.NDArray[np.float64]:
+        result: npt.NDArray[np.float64] = self.histograms[:, 0] / self.page_size
+        return result
+
+    def pointer(self) -> npt.NDArray[np.float64]:
+        """Share of the aligned 64bit words pointing into a mapped region"""
+        result: npt.NDArray[np.float64] = self.pointers / (self.page_size // 8)
+        return result
+
+
+def histogram_entropy(histograms: npt.NDArray[np.int64]) -> npt.NDArray[np.float64]:
+    totals = np.maximum(histograms.sum(axis=-1, keepdims=True), 1)
+    probability = histograms / totals
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(histograms > 0, probability * np.log2(probability), 0.0)
+    result: npt.NDArray[np.float64] = -np.sum(terms, axis=-1) / 8.0
+    return result
+
+
+class RegionStats:
+    """The metrics of a whole region, accumulated chunk by chunk"""
+
+    def __init__(self, region: MemoryRegion) -> None:
+        self.region = region
+        self.histogram = np.zeros(256, dtype=np.int64)
+        self.pointers = 0
+        self.size = 0
+
+    def add(self, stats: PageStats) -> None:
+        self.histogram += stats.histograms.sum(axis=0)
+        self.pointers += int(stats.pointers.sum())
+        self.size += len(stats) * stats.page_size
+
+    def metric(self, name: str) -> float:
+        if name == "size":
+            return float(self.size)
+        elif self.size == 0:
+            return 0.0
+        elif name == "entropy":
+            return float(histogram_entropy(self.histogram))
+        elif name == "zero":
+            return float(self.histogram[0]) / self.size
+        elif name == "pointer":
+            return self.pointers / (self.size // 8)
+        else:
+            raise ValueError("unknown metric: {}".format(name))
+
+    def most_common(self, count: int = 1) -> list[tuple[int, float]]:
+        """Return the 'count' most frequent byte values and their share"""
+        order = np.argsort(-self.histogram, kind="stable")[:count]
+        return [(int(value), float(self.histogram[value]) / max(self.size, 1)) for value in order]
+
+    def to_json(self, histogram: bool = False) -> dict[str, Any]:
+        js: dict[str, Any] = {
+            "start": "{:x}".format(self.region.addr_beg),
+            "end": "{:x}".format(self.region.addr_end),
+            "pathname": self.region.pathname,
+        }
+        js.update({name: self.metric(name) for name in METRICS})
+        if histogram:
+            js["histogram"] = self.histogram.tolist()
+        return js
+
+
+class PageTable:
+    """Addresses and metrics of individual pages"""
+
+    def __init__(self) -> None:
+        self._addrs: list[npt.NDArray[np.uint64]] = []
+        self._metrics: dict[str, list[npt.NDArray[np.float32]]] = {name: [] for name in METRICS if name != "size"}
+
+    def add(self, addr: int, stats: PageStats) -> None:
+        self._addrs.append(addr + np.arange(len(stats), dtype=np.uint64) * np.uint64(stats.page_size))
+        self._metrics["entropy"].append(stats.entropy().astype(np.float32))
+        self._metrics["zero"].append(stats.zero().astype(np.float32))
+        self._metrics["pointer"].append(stats.pointer().astype(np.float32))
+
+    def sorted(self, metric: str, limit: Optional[int] = None) -> list[dict[str, Any]]:
+        """Return the pages with the highest 'metric' first"""
+        if not self._addrs:
+            return []
+        addrs = np.concatenate(self._addrs)
+        metrics = {name: np.concatenate(columns) for name, columns in self._metrics.items()}
+        order = np.argsort(-metrics[metric], kind="stable") if metric in metrics else np.arange(len(addrs))
+        order = order[:limit]
+
+        columns = {name: column[order].tolist() for name, column in metrics.items()}
+        return [dict(address=addr, **{name: column[idx] for name, column in columns.items()})
+                for idx, addr in enumerate(addrs[order].tolist())]
+
+
+def collect_stats(mem: Memory, regions: Sequence[MemoryRegion], page_size: int, resident_only: bool = False,
+                  pages: Optional[PageTable] = None) -> list[RegionStats]:
+    """Compute the metrics of 'regions', and of their individual pages
+    when 'pages' is given, while streaming through their memory"""
+    all_regions = mem.regions()
+    result = []
+    for region in regions:
+        stats = RegionStats(region)
+        try:
+            for beg, end in mem.ranges(region.addr_beg, region.addr_end, resident_only):
+                for addr, chunk in mem.chunks(beg, end):
+                    page_stats = PageStats(chunk, page_size, all_regions)
+                    stats.add(page_stats)
+                    if pages is not None:
+                        pages.add(addr, page_stats)
+        except (OSError, OverflowError) as err:
+            logging.warning("%s: failed to read: %s", region, err)
+        result.append(stats)
+    return result
+
+
+# EOF #
@@ -0,0 +1,133 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from procmem.pack import ctype2dtype
+
+
+# Comparison operators understood by TypedScan and the number of
+# values each of them takes
+SCAN_OPS = {
+    "any": 0,
+    "eq": 1,
+    "ne": 1,
+    "lt": 1,
+    "gt": 1,
+    "range": 2,
+    "approx": 1,
+}
+
+
+def parse_value(text: str, dtype: np.dtype[Any]) -> Union[int, float]:
+    if dtype.kind == "f":
+        return float(text)
+    else:
+        return int(text, 0)
+
+
+def typed_view(haystack: Union[bytes, bytearray], dtype: np.dtype[Any],
+               alignment: int, addr: int = 0) -> tuple[int, npt.NDArray[Any]]:
+    """View 'haystack' as an array of 'dtype' values, one for every
+    'alignment' bytes, starting at the first offset that is aligned
+    when the haystack is located at 'addr'. Values may overlap each
+    other when 'alignment' is smaller than the size of 'dtype'.
+
+    Returns the offset of the first value and the array."""
+    first = -addr % alignment
+    count = max(0, (len(haystack) - first - dtype.itemsize) // alignment + 1)
+    return first, np.ndarray(shape=(count,), dtype=dtype, buffer=haystack,
+                             offset=first if count else 0, strides=(alignment,))
+
+
+class TypedScan:
+    """Find all values of a given type that fulfill a comparison.
+
+    Instead of comparing bytes the haystack is viewed as an array of
+    'ctype' values, one at every 'alignment' bytes, and compared with
+    NumPy in one go.
+
+    Operators are 'eq', 'ne', 'lt', 'gt', 'range' (inclusive),
+    'approx', which matches values within 'tolerance' of the given
+    one, and 'any', which matches everything.
+    """
+
+    # values at neighboring offsets are all reported
+    overlapping = True
+
+    def __init__(self, ctype: str, op: str, values: list[str],
+                 alignment: int = 1, tolerance: float = 0.0) -> None:
+        if op not in SCAN_OPS:
+            raise ValueError("unknown operator: {}".format(op))
+        if len(values) != SCAN_OPS[op]:
+            raise ValueError("operator '{}' takes {} value(s)".format(op, SCAN_OPS[op]))
+        if alignment < 1:
+            raise ValueError("alignment must be positive")
+
+        self.dtype = ctype2dtype(ctype)
+        self.op = op
+        self.values = [parse_value(value, self.dtype) for value in values]
+        self.alignment = alignment
+        self.tolerance = tolerance
+        self.max_length = self.dtype.itemsize
+
+    def __len__(self) -> int:
+        return 1
+
+    def compare(self, arr: npt.NDArray[Any]) -> npt.NDArray[np.bool_]:
+        """Return a mask of the elements of 'arr' matching the comparison"""
+        mask: npt.NDArray[np.bool_]
+        if self.op == "any":
+            mask = np.ones(len(arr), dtype=np.bool_)
+        elif self.op == "eq":
+            mask = np.equal(arr, self.values[0])
+        elif self.op == "ne":
+            mask = np.not_equal(arr, self.values[0])
+        elif self.op == "lt":
+            mask = np.less(arr, self.values[0])
+        elif self.op == "gt":
+            mask = np.greater(arr, self.values[0])
+        elif self.op == "range":
+            mask = np.greater_equal(arr, self.values[0]) & np.less_equal(arr, self.values[1])
+        elif self.op == "approx":
+            mask = np.abs(arr.astype(np.float64) - self.values[0]) <= self.tolerance
+        else:
+            raise RuntimeError("unreachable")
+        return mask
+
+    def find_array(self, haystack: Union[bytes, bytearray],
+                   addr: int = 0) -> tuple[npt.NDArray[np.intp], npt.NDArray[Any]]:
+        """Return the offsets and a copy of the values of all matches as arrays"""
+        first, arr = typed_view(haystack, self.dtype, self.alignment, addr)
+        with np.errstate(invalid="ignore", over="ignore"):
+            indices = np.flatnonzero(self.compare(arr))
+        return first + indices * self.alignment, arr[indices]
+
+    def find(self, haystack: Union[bytes, bytearray], addr: int = 0) -> list[tuple[int, int, int]]:
+        """Return (offset, size, 0) tuples for all matching values"""
+        offsets, _ = self.find_array(haystack, addr)
+        return [(offset, self.max_length, 0) for offset in offsets.tolist()]
+
+    def decode(self, data: bytes) -> Union[int, float]:
+        """Convert the bytes of a match back into a value"""
+        return np.frombuffer(data, dtype=self.dtype, count=1)[0].item()  # type: ignore[no-any-return]
+
+
+# EOF #
@@ -0,0 +1,167 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Any, Optional, TextIO, Union
+
+import json
+import re
+from collections import deque
+
+import numpy as np
+
+from procmem.diff import changed_runs
+from procmem.memory import Memory
+from procmem.pack import ctype2dtype
+
+
+# Number of changes kept by Watcher for export
+DEFAULT_HISTORY_SIZE = 100000
+
+
+class WatchTarget:
+    """A range of memory, either raw bytes or a single typed value"""
+
+    target_re = re.compile(r"^([0-9a-fA-F]+)(?:\+([0-9a-fA-F]+))?:(.+)$")
+
+    @staticmethod
+    def from_string(text: str) -> 'WatchTarget':
+        """Parse 'ADDR[+OFFSET]:TYPE', addresses and offsets are hex,
+        e.g. '7f12a0:int32' or '7f12a0+1c:float' for a struct field"""
+        match = WatchTarget.target_re.match(text)
+        if match is None:
+            raise Exception("invalid watch target: {}".format(text))
+
+        addr = int(match.group(1), 16) + int(match.group(2) or "0", 16)
+        return WatchTarget(addr, ctype=match.group(3), label=text)
+
+    def __init__(self, addr: int, size: Optional[int] = None, ctype: Optional[str] = None,
+                 label: Optional[str] = None) -> None:
+        self.addr = addr
+        self.ctype = ctype
+        self.dtype: Optional[np.dtype[Any]] = None
+
+        if ctype is not None:
+            self.dtype = ctype2dtype(ctype)
+            self.size = self.dtype.itemsize
+        elif size is not None:
+            self.size = size
+        else:
+            raise ValueError("either size or ctype must be given")
+
+        self.label = label or "{:016x}-{:016x}".format(addr, addr + self.size)
+
+    def decode(self, data: bytes) -> Union[int, float, str]:
+        if self.dtype is None:
+            return data.hex(" ")
+        elif len(data) < self.size:
+            return "<unreadable>"
+        else:
+            return np.frombuffer(data, dtype=self.dtype, count=1)[0].item()  # type: ignore[no-any-return]
+
+
+# (timestamp, target index, address, old bytes, new bytes)
+WatchEvent = tuple[float, int, int, bytes, bytes]
+
+
+class Watcher:
+    """Reads all targets with a single readv() per poll() and reports
+    the changes since the previous one"""
+
+    def __init__(self, mem: Memory, targets: list[WatchTarget], history_size: int = DEFAULT_HISTORY_SIZE) -> None:
+        if not targets:
+            raise Exception("nothing to watch")
+
+        self.mem = mem
+        self.targets = targets
+        self.history: deque[WatchEvent] = deque(maxlen=history_size)
+
+        self.offsets = np.cumsum([0] + [target.size for target in targets])
+        total = int(self.offsets[-1])
+
+        # all targets are read into one buffer, the previous content
+        # is kept in a second one to find the changes
+        self._state = bytearray(total)
+        self._prev_state = bytearray(total)
+        self._requests = [(target.addr, memoryview(self._state)[beg:beg + target.size])
+                          for target, beg in zip(targets, self.offsets.tolist())]
+        self._counts: Optional[list[int]] = None
+        self._prev_counts: list[int] = []
+
+    def state(self, idx: int) -> bytes:
+        """Return the bytes of target 'idx' from the last poll()"""
+        assert self._counts is not None
+        beg = int(self.offsets[idx])
+        return bytes(self._state[beg:beg + self._counts[idx]])
+
+    def poll(self, now: float) -> list[WatchEvent]:
+        """Read all targets and return the changes, the first call only
+        records the initial state"""
+        self._prev_state[:] = self._state
+        self._prev_counts = self._counts or []
+        self._counts = self.mem.readv(self._requests)
+
+        if not self._prev_counts or (self._state == self._prev_state and self._counts == self._prev_counts):
+            return []
+
+        diff = np.frombuffer(self._state, dtype=np.uint8) != np.frombuffer(self._prev_state, dtype=np.uint8)
+        changed = np.logical_or.reduceat(diff, self.offsets[:-1])
+        changed |= np.array(self._counts) != np.array(self._prev_counts)
+
+        events: list[WatchEvent] = []
+        for idx in np.flatnonzero(changed).tolist():
+            target = self.targets[idx]
+            beg = int(self.offsets[idx])
+            old = bytes(self._prev_state[beg:beg + self._prev_counts[idx]])
+            new = bytes(self._state[beg:beg + self._counts[idx]])
+
+            if target.dtype is not None or len(old) != len(new):
+                events.append((now, idx, target.addr, old, new))
+            else:
+                # raw ranges only report the bytes that changed
+                for run_beg, run_end in changed_runs(target.addr, old, new):
+                    offset = run_beg - target.addr
+                    events.append((now, idx, run_beg, old[offset:run_end - target.addr],
+                                   new[offset:run_end - target.addr]))
+
+        self.history.extend(events)
+        return events
+
+    def format_event(self, event: WatchEvent) -> str:
+        timestamp, idx, addr, old, new = event
+        target = self.targets[idx]
+        if target.dtype is not None:
+            return "{:.6f}  {}  {} -> {}".format(timestamp, target.label, target.decode(old), target.decode(new))
+        else:
+            return "{:.6f}  {:016x}  {} -> {}".format(timestamp, addr, old.hex(" "), new.hex(" "))
+
+    def export(self, fout: TextIO) -> None:
+        """Write the recorded changes as JSON lines"""
+        for timestamp, idx, addr, old, new in self.history:
+            target = self.targets[idx]
+            js: dict[str, Any] = {
+                "time": timestamp,
+                "target": target.label,
+                "address": "{:x}".format(addr),
+                "old": target.decode(old) if target.dtype is not None else old.hex(),
+                "new": target.decode(new) if target.dtype is not None else new.hex(),
+            }
+            if target.ctype is not None:
+                js["type"] = target.ctype
+            fout.write(json.dumps(js) + "\n")
+
+
+# EOF #
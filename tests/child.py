@@ -0,0 +1,60 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import IO, Iterator
+
+import subprocess
+import sys
+from contextlib import contextmanager
+
+
+# Maps 'pages' pages filled with b"a" and prints their address, on
+# SIGUSR1 the first page is overwritten with b"b" and "written" printed
+CHILD_SCRIPT = """
+import ctypes, mmap, signal, sys
+buf = mmap.mmap(-1, {pages} * mmap.PAGESIZE)
+buf[:] = b"a" * len(buf)
+def on_usr1(signum, frame):
+    buf[:mmap.PAGESIZE] = b"b" * mmap.PAGESIZE
+    print("written", flush=True)
+signal.signal(signal.SIGUSR1, on_usr1)
+obj = ctypes.c_char.from_buffer(buf)
+print(ctypes.addressof(obj), flush=True)
+del obj
+while True:
+    signal.pause()
+"""
+
+
+@contextmanager
+def spawn(pages: int = 2) -> Iterator[tuple[subprocess.Popen[str], int, IO[str]]]:
+    """Run a child process to be inspected, yields the process, the
+    address of its pages and its stdout"""
+    proc = subprocess.Popen([sys.executable, "-c", CHILD_SCRIPT.format(pages=pages)],
+                            stdout=subprocess.PIPE, text=True)
+    try:
+        assert proc.stdout is not None
+        addr = int(proc.stdout.readline())
+        yield proc, addr, proc.stdout
+    finally:
+        proc.kill()
+        proc.wait()
+        if proc.stdout is not None:
+            proc.stdout.close()
+
+
+# EOF #
@@ -0,0 +1,62 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os
+import unittest
+
+from procmem.census import CENSUS_FIELDS, Census, read_smaps_by_pathname, take_census
+from procmem.main_census import main_census
+import stdio
+
+
+class CensusTestCase(unittest.TestCase):
+
+    def test_read_smaps_by_pathname(self) -> None:
+        totals = read_smaps_by_pathname(os.getpid())
+        self.assertIn("[stack]", totals)
+        rss = sum(values[CENSUS_FIELDS.index("Rss")] for values in totals.values())
+        self.assertGreater(rss, 0)
+
+    def test_aggregate(self) -> None:
+        census = Census()
+        census.add(1, {"libfoo.so": [4096, 4096, 2048, 0, 0], "[anon]": [8192, 4096, 2048, 4096, 0]})
+        census.add(2, {"libfoo.so": [4096, 4096, 2048, 0, 0]})
+
+        entries = census.sorted_entries("Pss")
+        self.assertEqual([entry.pathname for entry in entries], ["libfoo.so", "[anon]"])
+        self.assertEqual(entries[0].get("Pss"), 4096)
+        self.assertEqual(entries[0].pids, [1, 2])
+        self.assertEqual(census.totals(), [16384, 12288, 6144, 4096, 0])
+        self.assertEqual([entry.pathname for entry in census.sorted_entries("Anonymous", 1)], ["[anon]"])
+
+    def test_take_census(self) -> None:
+        # the nonexistent process is skipped
+        census = take_census([os.getpid(), 2 ** 31 - 1], jobs=2)
+        self.assertEqual(census.pids, [os.getpid()])
+
+    def test_main_census(self) -> None:
+        args = argparse.Namespace(match=None, pids=[os.getpid()], jobs=2, sort="Rss", limit=3, json=True)
+        with stdio.redirect() as (stdout, stderr):
+            main_census(os.getpid(), args)
+        js = json.loads(stdout.read())
+        self.assertEqual(js["processes"], 1)
+        self.assertEqual(len(js["entries"]), 3)
+
+
+# EOF #
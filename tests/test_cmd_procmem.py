@@ -0,0 +1,40 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from procmem.cmd_procmem import parse_args
+
+
+class ParseArgsTestCase(unittest.TestCase):
+
+    def test_process_regex(self) -> None:
+        # the global -E and the -E of search don't overwrite each other
+        args = parse_args(["-E", "-P", "chil.*", "search", "foo"])
+        self.assertTrue(args.process_regex)
+        self.assertFalse(args.regex)
+
+        args = parse_args(["-P", "python3", "search", "-E", "fo+"])
+        self.assertFalse(args.process_regex)
+        self.assertTrue(args.regex)
+
+        args = parse_args(["-E", "-P", "chil.*", "search", "-E", "fo+"])
+        self.assertTrue(args.process_regex)
+        self.assertTrue(args.regex)
+
+
+# EOF #
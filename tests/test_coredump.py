@@ -0,0 +1,88 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import io
+import os
+import struct
+import unittest
+
+from procmem.coredump import ELF_HEADER, NT_FILE, PROGRAM_HEADER, PT_LOAD, PT_NOTE, write_core
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion
+
+
+def read_notes(data: bytes) -> list[tuple[bytes, int, bytes]]:
+    notes = []
+    pos = 0
+    while pos < len(data):
+        namesz, descsz, note_type = struct.unpack_from("<III", data, pos)
+        pos += 12
+        name = data[pos:pos + namesz - 1]
+        pos += namesz + (-namesz % 4)
+        notes.append((name, note_type, data[pos:pos + descsz]))
+        pos += descsz + (-descsz % 4)
+    return notes
+
+
+class CoreDumpTestCase(unittest.TestCase):
+
+    def test_write_core(self) -> None:
+        data = b"procmem core test " * 1000
+        buf = ctypes.create_string_buffer(data, len(data))
+        addr = ctypes.addressof(buf)
+
+        with Memory.from_pid(os.getpid()) as mem:
+            region = mem.region_at(addr)
+            assert region is not None
+            stack = [info for info in mem.regions() if info.pathname == "[stack]"]
+            guard = MemoryRegion(0x1000, 0x3000, False, False, False, True, 0, "00:00", 0, "")
+            regions = [guard, region] + stack
+
+            fout = io.BytesIO()
+            total = write_core(mem, regions, fout, 4096)
+        core = fout.getvalue()
+        self.assertEqual(total, sum(info.length() for info in regions[1:]))
+
+        header = ELF_HEADER.unpack_from(core, 0)
+        self.assertEqual(header[0][:4], b"\x7fELF")
+        phoff, phnum = header[5], header[10]
+        self.assertEqual(phnum, len(regions) + 1)
+
+        phdrs = [PROGRAM_HEADER.unpack_from(core, phoff + i * PROGRAM_HEADER.size) for i in range(phnum)]
+        self.assertEqual(phdrs[0][0], PT_NOTE)
+        self.assertTrue(all(phdr[0] == PT_LOAD for phdr in phdrs[1:]))
+
+        # unreadable regions have no content in the file
+        self.assertEqual((phdrs[1][3], phdrs[1][5], phdrs[1][6]), (0x1000, 0, 0x2000))
+
+        _, _, offset, vaddr, _, filesz, memsz, _ = phdrs[2]
+        self.assertEqual((vaddr, filesz, memsz), (region.addr_beg, region.length(), region.length()))
+        pos = offset + addr - vaddr
+        self.assertEqual(core[pos:pos + len(data)], data)
+
+        _, _, note_offset, _, _, note_size, _, _ = phdrs[0]
+        notes = read_notes(core[note_offset:note_offset + note_size])
+        self.assertEqual([name for name, _, _ in notes], [b"CORE"] * len(notes))
+        file_notes = [desc for _, note_type, desc in notes if note_type == NT_FILE]
+        self.assertEqual(len(file_notes), 1)
+        count, page_size = struct.unpack_from("<QQ", file_notes[0])
+        self.assertEqual(page_size, 4096)
+        self.assertEqual(count, sum(1 for info in regions if info.inode != 0 and info.pathname.startswith("/")))
+
+
+# EOF #
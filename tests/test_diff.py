@@ -0,0 +1,116 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import mmap
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from procmem.diff import changed_runs, diff_live, diff_snapshots
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion, region_mask
+from procmem.snapshot import Snapshot, SnapshotWriter, take_snapshot
+
+
+PAGE = 4096
+
+
+def make_region(beg: int, end: int, pathname: str = "") -> MemoryRegion:
+    return MemoryRegion(beg, end, True, True, False, True, 0, "00:00", 0, pathname)
+
+
+class DiffTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_changed_runs(self) -> None:
+        self.assertEqual(changed_runs(100, b"abcdefgh", b"abXdeYZh"), [(102, 103), (105, 107)])
+        self.assertEqual(changed_runs(0, b"XbcdefgY", b"abcdefgh"), [(0, 1), (7, 8)])
+        self.assertEqual(changed_runs(0, b"same", b"same"), [])
+
+    def test_region_mask(self) -> None:
+        regions = [make_region(0x3000, 0x4000), make_region(0x1000, 0x2000)]
+        addrs = np.array([0, 0x1000, 0x1fff, 0x2000, 0x3800, 0x4000], dtype=np.uint64)
+        self.assertEqual(region_mask(regions, addrs).tolist(), [False, True, True, False, True, False])
+
+    def test_diff_snapshots(self) -> None:
+        old_regions = [make_region(0x10000, 0x14000, "[heap]"), make_region(0x20000, 0x21000, "gone")]
+        new_regions = [make_region(0x10000, 0x14000, "[heap]"), make_region(0x30000, 0x31000, "new")]
+
+        old_data = bytearray(b"a" * PAGE + bytes(PAGE) + b"c" * 2 * PAGE)
+        new_data = bytearray(old_data)
+        new_data[10:12] = b"XY"
+        new_data[2 * PAGE - 2:2 * PAGE + 3] = b"12345"
+
+        old_file = os.path.join(self.tmpdir.name, "old.snap")
+        with SnapshotWriter(old_file, old_regions, page_size=PAGE) as writer:
+            writer.add(0x10000, old_data)
+            writer.add(0x20000, b"g" * PAGE)
+
+        new_file = os.path.join(self.tmpdir.name, "new.snap")
+        with SnapshotWriter(new_file, new_regions, page_size=PAGE) as writer:
+            writer.add(0x10000, new_data)
+            writer.add(0x30000, b"n" * PAGE)
+
+        with Snapshot.open(old_file) as old, Snapshot.open(new_file) as new:
+            diff = diff_snapshots(old, new, old.regions, new.regions)
+
+        self.assertEqual([region.pathname for region in diff.vanished], ["gone"])
+        self.assertEqual([region.pathname for region in diff.appeared], ["new"])
+        self.assertEqual(diff.runs, [(0x1000a, 0x1000c, b"aa", b"XY"),
+                                     (0x11ffe, 0x12003, b"\0\0ccc", b"12345")])
+        self.assertEqual(diff.changed_pages, [0x10000, 0x11000, 0x12000])
+        self.assertEqual(diff.compared_pages, 4)
+        self.assertEqual(diff.old_only_pages, 1)
+        self.assertEqual(diff.new_only_pages, 1)
+        self.assertEqual([(region.pathname, pages, count) for region, pages, count in diff.region_changes()],
+                         [("[heap]", 3, 7)])
+
+    def test_diff_live(self) -> None:
+        filename = os.path.join(self.tmpdir.name, "live.snap")
+        with mmap.mmap(-1, 4 * PAGE) as buf:
+            buf[PAGE:PAGE + 5] = b"hello"
+            obj = ctypes.c_char.from_buffer(buf)
+            addr = ctypes.addressof(obj)
+            del obj
+
+            regions = [make_region(addr, addr + 4 * PAGE)]
+            with Memory.from_pid(os.getpid()) as mem:
+                with SnapshotWriter(filename, regions, page_size=PAGE) as writer:
+                    take_snapshot(mem, regions, writer)
+
+                buf[PAGE + 1:PAGE + 3] = b"EL"
+                buf[3 * PAGE] = 1
+
+                with Snapshot.open(filename) as old:
+                    diff = diff_live(old, mem, regions, regions)
+
+        self.assertEqual(diff.runs, [(addr + PAGE + 1, addr + PAGE + 3, b"el", b"EL"),
+                                     (addr + 3 * PAGE, addr + 3 * PAGE + 1, b"\0", b"\1")])
+        self.assertEqual(diff.compared_pages, 4)
+        self.assertEqual(diff.old_only_pages, 0)
+        self.assertEqual(diff.new_only_pages, 0)
+
+
+# EOF #
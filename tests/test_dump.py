@@ -0,0 +1,105 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import mmap
+import os
+import tempfile
+import unittest
+import zlib
+
+from procmem.dump import DumpFile, DumpWriter, read_frames, write_dump
+from procmem.memory_region import MemoryRegion
+
+
+PAGE = mmap.PAGESIZE
+
+
+class DumpTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "test.dump")
+        self.region = MemoryRegion(0x10000, 0x41000, True, True, False, True, 0, "00:00", 0, "[heap]")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_writer(self) -> None:
+        with DumpWriter(self.filename, [self.region], "zlib", meta={"pid": 1}) as writer:
+            writer.add(0x10000, 4, zlib.compress(b"abcd"))
+            writer.add(0x10004, 8, b"")
+            writer.add(0x20000, 2, zlib.compress(b"xy"))
+        self.assertRaises(AssertionError, writer.add, 0x10000, 4, b"")
+
+        with DumpFile.open(self.filename) as dump:
+            self.assertEqual(dump.footer["pid"], 1)
+            self.assertEqual(dump.regions[0].to_json(), self.region.to_json())
+            self.assertEqual(len(dump.frames), 3)
+            self.assertEqual(dump.read(0x10000, 0x10010), b"abcd" + bytes(12))
+            self.assertEqual(dump.read(0x1fffe, 0x20004), b"\0\0xy\0\0")
+            self.assertEqual(dump.read(0x0, 0x10), bytes(16))
+
+    def test_incomplete(self) -> None:
+        def write() -> None:
+            with DumpWriter(self.filename, [self.region], "zlib") as writer:
+                writer.add(0x10000, 256, zlib.compress(bytes(range(256))))
+                raise KeyboardInterrupt()
+
+        self.assertRaises(KeyboardInterrupt, write)
+        self.assertRaisesRegex(Exception, "incomplete", DumpFile.open, self.filename)
+
+    def test_write_dump(self) -> None:
+        buf = mmap.mmap(-1, 5 * PAGE)
+        buf[:PAGE] = bytes(range(256)) * (PAGE // 256)
+        buf[2 * PAGE:3 * PAGE] = os.urandom(PAGE)
+        buf[3 * PAGE:4 * PAGE] = b"procmem" * (PAGE // 7) + bytes(PAGE % 7)
+        addr = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+        data = bytes(buf)
+
+        for compression in ["zlib", "lzma", "none"]:
+            with DumpWriter(self.filename, [self.region], compression) as writer:
+                length = write_dump(os.getpid(), [(addr, addr + 3 * PAGE), (addr + 3 * PAGE, addr + 5 * PAGE)],
+                                    writer, readers=2, compressors=2, chunk_size=PAGE)
+            self.assertEqual(length, 5 * PAGE)
+
+            with DumpFile.open(self.filename) as dump:
+                self.assertEqual(dump.compression, compression)
+                self.assertEqual(dump.frames["addr"].tolist(), [addr + idx * PAGE for idx in range(5)])
+                # zero frames take no space, random data is stored as it is
+                self.assertEqual(dump.frames["size"].tolist()[4], 0)
+                self.assertEqual(dump.frames["size"].tolist()[2], PAGE)
+                self.assertEqual(dump.read(addr, addr + 5 * PAGE), data)
+                self.assertEqual(dump.read(addr + PAGE - 3, addr + 3 * PAGE + 3), data[PAGE - 3:3 * PAGE + 3])
+
+    def test_read_frames_hole(self) -> None:
+        buf = mmap.mmap(-1, 3 * PAGE)
+        buf[:] = b"x" * (3 * PAGE)
+        addr = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+        libc = ctypes.CDLL(None)
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        self.assertEqual(libc.munmap(addr + PAGE, PAGE), 0)
+
+        fd = os.open("/proc/self/mem", os.O_RDONLY)
+        try:
+            frames = read_frames(fd, addr, addr + 3 * PAGE, PAGE)
+        finally:
+            os.close(fd)
+        self.assertEqual(frames, [(addr, b"x" * PAGE), (addr + 2 * PAGE, b"x" * PAGE)])
+
+
+# EOF #
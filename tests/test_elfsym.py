@@ -0,0 +1,86 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from procmem.elfsym import SymbolTable, Symbolizer
+from procmem.memory import Memory
+from procmem.memory_region import RegionTable
+
+
+class ElfSymTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        addr = ctypes.cast(ctypes.CDLL(None).malloc, ctypes.c_void_p).value
+        assert addr is not None
+        self.addr = addr
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_symbolize(self) -> None:
+        with Memory.from_pid(os.getpid()) as mem:
+            symbolizer = Symbolizer(mem.regions(), cache_dir=self.tmpdir.name)
+            addrs = np.array([self.addr, self.addr + 4, 0], dtype=np.uint64)
+            symbols = symbolizer.symbolize(addrs)
+            self.assertEqual(symbols[0], "malloc+0x0")
+            self.assertEqual(symbols[1], "malloc+0x4")
+            self.assertIsNone(symbols[2])
+            self.assertTrue(symbolizer.annotate(self.addr).endswith(" malloc+0x0"))
+
+            # a second symbolizer gets the table from the cache
+            cache_files = os.listdir(self.tmpdir.name)
+            self.assertGreater(len(cache_files), 0)
+            table = SymbolTable.load(os.path.join(self.tmpdir.name, cache_files[0]))
+            self.assertGreater(len(table), 0)
+            symbolizer = Symbolizer(mem.regions(), cache_dir=self.tmpdir.name)
+            self.assertEqual(symbolizer.symbolize(addrs[:1]), ["malloc+0x0"])
+
+    def test_process_files(self) -> None:
+        with Memory.from_pid(os.getpid()) as mem:
+            regions = mem.regions()
+            symbolizer = Symbolizer(regions, cache_dir=self.tmpdir.name, pid=os.getpid())
+            self.assertEqual(symbolizer.root, "/proc/{}/root".format(os.getpid()))
+            self.assertEqual(symbolizer.symbolize(np.array([self.addr], dtype=np.uint64)), ["malloc+0x0"])
+
+            # a file that isn't found under its pathname is read through map_files
+            idx = regions.index_of(self.addr)
+            assert idx is not None
+            pathnames = list(regions.pathnames)
+            pathnames[int(regions.path_idx[idx])] = "/nonexistent/libc.so"
+            moved = RegionTable(regions.addr_beg, regions.addr_end, regions.flags, regions.offset, regions.inode,
+                                regions.dev_idx, regions.devs, regions.path_idx, pathnames)
+            symbolizer = Symbolizer(moved, cache_dir=self.tmpdir.name, pid=os.getpid())
+            self.assertEqual(symbolizer.symbolize(np.array([self.addr], dtype=np.uint64)), ["malloc+0x0"])
+
+            # without a pid there is nothing to fall back to
+            symbolizer = Symbolizer(moved, cache_dir=self.tmpdir.name)
+            self.assertEqual(symbolizer.symbolize(np.array([self.addr], dtype=np.uint64)), [None])
+
+    def test_not_elf(self) -> None:
+        self.assertEqual(len(SymbolTable.from_bytes(b"\0" * 128)), 0)
+        idx, _ = SymbolTable.empty().lookup(np.array([1, 2], dtype=np.uint64))
+        self.assertEqual(idx.tolist(), [-1, -1])
+
+
+# EOF #
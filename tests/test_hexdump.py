@@ -0,0 +1,97 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import random
+import string
+import tempfile
+import unittest
+
+from procmem.hexdump import HEX_BLOCK_ROWS, write_hex, write_hex_chunks
+from procmem.itertools import chunk_iter
+
+
+PRINTABLE = string.digits + string.ascii_letters + string.punctuation
+
+
+def reference_hexdump(chunks: list[tuple[int, bytes]], width: int) -> str:
+    """Row by row formatting the batched renderer must agree with"""
+    result = []
+    skipped_zeroes = 0
+    for offset, buf in chunks:
+        for i, row in enumerate(chunk_iter(buf, width)):
+            if row == bytes(width):
+                skipped_zeroes += 1
+                continue
+            elif skipped_zeroes != 0:
+                result.append("  -- skipped zeroes: {}\n".format(skipped_zeroes))
+                skipped_zeroes = 0
+
+            column = "  ".join(" ".join("{:02x}".format(c) for c in group) for group in chunk_iter(row, 8))
+            column = column.ljust(width * 2 + (width - 1) + ((width // 8) - 1))
+            text = "".join(chr(c) if chr(c) in PRINTABLE else "." for c in row)
+            result.append("{:016x}  {}  |{}|\n".format(offset + i * width, column, text.ljust(width)))
+    return "".join(result)
+
+
+class HexdumpTestCase(unittest.TestCase):
+
+    def test_write_hex(self) -> None:
+        out = io.StringIO()
+        write_hex_chunks(out, [(0x1000, b"Hello, World!\x00\x01\x02" + bytes(32)), (0x1030, b"\xffabc")])
+        self.assertEqual(out.getvalue(),
+                         "0000000000001000  48 65 6c 6c 6f 2c 20 57  6f 72 6c 64 21 00 01 02  |Hello,.World!...|\n"
+                         "  -- skipped zeroes: 2\n"
+                         "0000000000001030  ff 61 62 63                                       |.abc            |\n")
+
+        out = io.StringIO()
+        write_hex(out, b"abcdefghijkl", 0x10, width=12)
+        self.assertEqual(out.getvalue(), "0000000000000010  61 62 63 64 65 66 67 68  69 6a 6b 6c  |abcdefghijkl|\n")
+
+    def test_reference(self) -> None:
+        rng = random.Random(0)
+        for width in [1, 5, 8, 12, 16, 32]:
+            chunks = []
+            addr = rng.randrange(0, 2 ** 64 - 2 ** 20) // width * width
+            for _ in range(3):
+                data = b"".join(bytes(width) if rng.random() < 0.5 else rng.randbytes(width)
+                                for _ in range(rng.randrange(100)))
+                chunks.append((addr, data))
+                addr += len(data)
+            chunks.append((addr, rng.randbytes(width - 1)))
+
+            out = io.StringIO()
+            write_hex_chunks(out, chunks, width)
+            self.assertEqual(out.getvalue(), reference_hexdump(chunks, width))
+
+    def test_blocks(self) -> None:
+        # zero runs carry over the block boundaries, output to a real
+        # file bypasses the text layer
+        data = bytes(HEX_BLOCK_ROWS * 16 - 16) + b"x" * 32 + bytes(HEX_BLOCK_ROWS * 16) + b"y"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "hexdump")
+            with open(filename, "w") as fout:
+                fout.write("header\n")
+                write_hex(fout, data, 0)
+                fout.write("footer\n")
+            with open(filename, "r") as fin:
+                content = fin.read()
+        self.assertEqual(content, "header\n" + reference_hexdump([(0, data)], 16) + "footer\n")
+
+
+# EOF #
@@ -29,9 +29,13 @@ class MainInfoTestCase(unittest.TestCase):
         with stdio.redirect() as (stdout, stderr):
             args = argparse.Namespace(
                 raw=False,
+                match=None,
+                pids=None,
                 no_default_filter=False,
                 size=None,
+                rss=None,
                 writable=False,
+                executable=False,
                 pathname=False)
             main_info(os.getpid(), args)
 
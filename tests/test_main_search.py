@@ -0,0 +1,86 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import ctypes
+import os
+import tempfile
+import unittest
+
+from procmem.main_replace import read_pairs, replace_ranges
+from procmem.main_search import read_needles, search_ranges
+from procmem.memory import DEFAULT_CHUNK_SIZE, Memory
+from procmem.multisearch import NeedleSet, RegexSearch
+
+
+class MainSearchTestCase(unittest.TestCase):
+
+    def test_search_ranges_regex(self) -> None:
+        data = bytearray(3 * DEFAULT_CHUNK_SIZE)
+        # place matches right across the chunk boundaries
+        offsets = [100, DEFAULT_CHUNK_SIZE - 10, 2 * DEFAULT_CHUNK_SIZE - 1, len(data) - 30]
+        for offset in offsets:
+            data[offset:offset + 30] = b"token-" + b"x" * 24
+        buf = ctypes.create_string_buffer(bytes(data), len(data))
+        addr = ctypes.addressof(buf)
+
+        regex = RegexSearch(rb"token-x+", 64)
+        with Memory.from_pid(os.getpid()) as mem:
+            for jobs in [1, 2]:
+                matches = list(search_ranges(mem, [(addr, addr + len(data))], regex, jobs))
+                self.assertEqual(matches, [(addr + offset, 30, 0) for offset in offsets])
+
+            # the unreadable range below mmap_min_addr is skipped, the
+            # parallel scan logs the failure in its worker processes
+            with self.assertLogs(level="WARNING"):
+                matches = list(search_ranges(mem, [(0x1000, 0x2000), (addr, addr + len(data))], regex, 1))
+            self.assertEqual(matches, list(search_ranges(mem, [(0x1000, 0x2000), (addr, addr + len(data))], regex, 2)))
+
+    def test_replace_ranges(self) -> None:
+        data = bytearray(2 * DEFAULT_CHUNK_SIZE)
+        # the longer needle crosses the chunk boundary, the shorter
+        # one ends right before it
+        data[DEFAULT_CHUNK_SIZE - 2:DEFAULT_CHUNK_SIZE + 4] = b"abcdef"
+        data[100:102] = b"ab"
+        buf = ctypes.create_string_buffer(bytes(data), len(data))
+        addr = ctypes.addressof(buf)
+
+        needles = NeedleSet([b"ab", b"abcdef"])
+        with Memory.from_pid(os.getpid(), mode='r+b') as mem:
+            replaced = list(replace_ranges(mem, [(addr, addr + len(data))], needles, [b"AB", b"ABCDEF"]))
+        self.assertEqual(replaced, [addr + 100, addr + DEFAULT_CHUNK_SIZE - 2])
+        self.assertEqual(buf.raw[DEFAULT_CHUNK_SIZE - 2:DEFAULT_CHUNK_SIZE + 4], b"ABCDEF")
+        self.assertEqual(buf.raw[100:102], b"AB")
+
+    def test_read_needles(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as fout:
+            fout.write("int32:5\n\nbar\n")
+            fout.flush()
+            # only needles from the file get their 'TYPE:' prefix honoured
+            self.assertEqual(read_needles(["s:foo"], fout.name),
+                             [("s:foo", False), ("int32:5", True), ("bar", True)])
+
+            fout.seek(0)
+            fout.truncate()
+            fout.write("int32:5\tint32:6\n")
+            fout.flush()
+            args = argparse.Namespace(NEEDLE="s:foo", DATA="s:bar", pair=[["a", "b"]], pair_file=fout.name)
+            self.assertEqual(read_pairs(args),
+                             [("s:foo", "s:bar", False), ("a", "b", False), ("int32:5", "int32:6", True)])
+
+
+# EOF #
@@ -0,0 +1,107 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import os
+import unittest
+
+import numpy as np
+
+from procmem.memory import Memory, ProcessVmMemory
+
+
+class MemoryTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.data = bytes(range(256)) * 16
+        self.buf = ctypes.create_string_buffer(self.data, len(self.data))
+        self.addr = ctypes.addressof(self.buf)
+
+    def test_read(self) -> None:
+        with Memory.from_pid(os.getpid()) as mem:
+            self.assertEqual(mem.read(self.addr, self.addr + 100), self.data[:100])
+
+    def test_chunks(self) -> None:
+        with Memory.from_pid(os.getpid()) as mem:
+            result = bytearray()
+            for addr, chunk in mem.chunks(self.addr, self.addr + len(self.data), chunk_size=1000):
+                self.assertEqual(addr, self.addr + len(result))
+                self.assertLessEqual(len(chunk), 1000)
+                result += chunk
+            self.assertEqual(result, self.data)
+
+    def test_chunks_overlap(self) -> None:
+        with Memory.from_pid(os.getpid()) as mem:
+            for addr, chunk in mem.chunks(self.addr, self.addr + len(self.data), chunk_size=1000, overlap=7):
+                offset = addr - self.addr
+                self.assertEqual(chunk, self.data[offset:offset + len(chunk)])
+                if offset != 0:
+                    self.assertEqual(len(chunk), min(1007, len(self.data) - offset))
+
+    def test_region_at(self) -> None:
+        with Memory.from_pid(os.getpid()) as mem:
+            region = mem.region_at(self.addr)
+            assert region is not None
+            self.assertTrue(region.addr_beg <= self.addr < region.addr_end)
+            self.assertEqual(mem.annotate(self.addr).rsplit("+", 1)[1],
+                             "0x{:x}".format(self.addr - region.addr_beg + (region.offset if region.inode else 0)))
+            self.assertIsNone(mem.region_at(0))
+
+
+class ProcessVmMemoryTestCase(unittest.TestCase):
+
+    def test_readv(self) -> None:
+        data = bytes(range(256))
+        src = ctypes.create_string_buffer(data, len(data))
+        addr = ctypes.addressof(src)
+
+        with ProcessVmMemory.from_pid(os.getpid()) as mem:
+            bufs = [bytearray(16), bytearray(16), bytearray(32)]
+            counts = mem.readv([(addr, bufs[0]), (0, bufs[1]), (addr + 100, bufs[2])])
+            self.assertEqual(counts, [16, 0, 32])
+            self.assertEqual(bufs[0], data[:16])
+            self.assertEqual(bufs[2], data[100:132])
+
+            buf = bytearray(64)
+            self.assertEqual(mem.readinto(addr + 10, buf), 64)
+            self.assertEqual(buf, data[10:74])
+
+    def test_readv_fallback(self) -> None:
+        data = b"fallback"
+        src = ctypes.create_string_buffer(data, len(data))
+
+        with ProcessVmMemory.from_pid(os.getpid()) as mem:
+            mem._vm_available = False
+            buf = bytearray(len(data))
+            self.assertEqual(mem.readv([(ctypes.addressof(src), buf)]), [len(data)])
+            self.assertEqual(buf, data)
+
+    def test_gather(self) -> None:
+        data = bytes(range(256)) * 4
+        src = ctypes.create_string_buffer(data, len(data))
+        addr = ctypes.addressof(src)
+
+        offsets = [0, 4, 5, 600, 1020]
+        addrs = np.array([addr + offset for offset in offsets] + [0], dtype=np.uint64)
+        with ProcessVmMemory.from_pid(os.getpid()) as mem:
+            values, valid = mem.gather(addrs, 4)
+            self.assertEqual(valid.tolist(), [True] * len(offsets) + [False])
+            for i, offset in enumerate(offsets):
+                self.assertEqual(values[i].tobytes(), data[offset:offset + 4])
+
+
+# EOF #
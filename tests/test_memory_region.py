@@ -0,0 +1,169 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from procmem.memory_region import MemoryRegion, RegionTable, filter_memory_maps
+
+
+MAPS = (
+    "55d0c8a00000-55d0c8a21000 rw-p 00000000 00:00 0                          [heap]\n"
+    "7f0e1c000000-7f0e1c021000 r-xp 00002000 fd:01 1234                       /usr/lib/lib name.so\n"
+    "7ffd4a1f0000-7ffd4a1f2000 r--p 00000000 00:00 0 \n"
+    "7ffd4a3f0000-7ffd4a3f2000 r--p 00000000 00:00 0                          [vvar]\n"
+)
+
+REGIONS = [
+    MemoryRegion(0x55d0c8a00000, 0x55d0c8a21000, True, True, False, True, 0, "00:00", 0, "[heap]"),
+    MemoryRegion(0x7f0e1c000000, 0x7f0e1c021000, True, False, True, True, 0x2000, "fd:01", 1234,
+                 "/usr/lib/lib name.so"),
+    MemoryRegion(0x7ffd4a1f0000, 0x7ffd4a1f2000, True, False, False, True, 0, "00:00", 0, ""),
+    MemoryRegion(0x7ffd4a3f0000, 0x7ffd4a3f2000, True, False, False, True, 0, "00:00", 0, "[vvar]"),
+]
+
+SMAPS_DETAILS = (
+    "Size:                132 kB\n"
+    "Rss:                  {} kB\n"
+    "ProtectionKey:         0\n"
+    "THPeligible:    0\n"
+    "VmFlags: rd wr mr mw me ac\n"
+)
+
+
+class MapsFileTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.maps_file = os.path.join(self.tmpdir.name, "maps")
+        self.smaps_file = os.path.join(self.tmpdir.name, "smaps")
+        with open(self.maps_file, "w") as fout:
+            fout.write(MAPS)
+        with open(self.smaps_file, "w") as fout:
+            for idx, line in enumerate(MAPS.splitlines(keepends=True)):
+                fout.write(line)
+                fout.write(SMAPS_DETAILS.format(idx * 4))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+
+class MemoryRegionTestCase(MapsFileTestCase):
+
+    def test_lazy_smaps(self) -> None:
+        regions = RegionTable.from_maps_file(self.maps_file, self.smaps_file)
+        self.assertEqual(len(regions), 4)
+        self.assertNotIn("info", regions[0].to_json())
+
+        # the first access loads the details of all regions
+        self.assertEqual(regions[1].info["Rss"], 4096)
+        self.assertEqual(regions[2].info, {"Size": 132 * 1024, "Rss": 8192})
+        self.assertEqual(regions[0].vmflags, ["rd", "wr", "mr", "mw", "me", "ac"])
+        self.assertIn("info", regions[0].to_json())
+
+    def test_without_smaps(self) -> None:
+        regions = RegionTable.from_maps_file(self.maps_file)
+        self.assertEqual(regions[0].info, {})
+        self.assertEqual(regions[0].vmflags, [])
+
+
+def make_args(**kwargs: object) -> argparse.Namespace:
+    args = argparse.Namespace(no_default_filter=False, size=None, rss=None, writable=False,
+                              executable=False, pathname=None)
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return args
+
+
+class RegionTableTestCase(MapsFileTestCase):
+
+    def test_rows(self) -> None:
+        table = RegionTable.from_maps_file(self.maps_file, self.smaps_file)
+        self.assertEqual(len(table), 4)
+        self.assertFalse(table.smaps_loaded)
+        for region, row in zip(REGIONS, table):
+            expected = region.to_json()
+            del expected["info"], expected["vmflags"]
+            self.assertEqual(row.to_json(), expected)
+        self.assertEqual(table[-1].pathname, "[vvar]")
+        self.assertEqual(table[1].pathname, "/usr/lib/lib name.so")
+        self.assertEqual(table[1].perms(), "r-xp")
+        self.assertEqual(table[1].offset, 0x2000)
+        self.assertRaises(IndexError, lambda: table[4])
+
+        # smaps gets loaded when a row asks for its details
+        self.assertEqual(table[2].info, {"Size": 132 * 1024, "Rss": 8192})
+        self.assertEqual(table[2].vmflags, ["rd", "wr", "mr", "mw", "me", "ac"])
+        self.assertTrue(table.smaps_loaded)
+
+    def test_filter(self) -> None:
+        table = RegionTable.from_maps_file(self.maps_file, self.smaps_file)
+        # the rows as a plain list go through the non-vectorized filter
+        regions = list(RegionTable.from_maps_file(self.maps_file, self.smaps_file))
+
+        for args in [make_args(), make_args(no_default_filter=True), make_args(writable=True),
+                     make_args(executable=True), make_args(pathname="[heap]"), make_args(size=0x21000),
+                     make_args(rss=4096)]:
+            filtered = filter_memory_maps(args, table)
+            self.assertIsInstance(filtered, RegionTable)
+            self.assertEqual([region.to_json() for region in filtered],
+                             [region.to_json() for region in filter_memory_maps(args, regions)])
+
+        filtered = filter_memory_maps(make_args(rss=4096), table)
+        self.assertEqual([region.info["Rss"] for region in filtered], [4096, 8192])
+
+    def test_locate(self) -> None:
+        table = RegionTable.from_maps_file(self.maps_file)
+        addrs = np.array([0x55d0c8a00000, 0x55d0c8a20fff, 0x55d0c8a21000, 0x7f0e1c000010, 0x10, 0x7ffd4a3f1000],
+                         dtype=np.uint64)
+        self.assertEqual(table.locate(addrs).tolist(), [0, 0, -1, 1, -1, 3])
+        self.assertEqual(table.index_of(0x7ffd4a1f0000), 2)
+        self.assertIsNone(table.index_of(0xffffffffffffffff))
+
+        self.assertEqual(table.annotate(0x55d0c8a00010), "[heap]+0x10")
+        # file mappings are annotated with the offset into the file
+        self.assertEqual(table.annotate(0x7f0e1c000010), "/usr/lib/lib name.so+0x2010")
+        self.assertEqual(table.annotate(0x7ffd4a1f0004), "[anon]+0x4")
+        self.assertEqual(table.annotate(0x10), "unmapped")
+
+    def test_split_range(self) -> None:
+        table = RegionTable.from_maps_file(self.maps_file)
+        pieces, gaps = table.split_range(0x55d0c8a20000, 0x7f0e1c001000)
+        self.assertEqual(pieces, [(0x55d0c8a20000, 0x55d0c8a21000), (0x7f0e1c000000, 0x7f0e1c001000)])
+        self.assertEqual(gaps, [(0x55d0c8a21000, 0x7f0e1c000000)])
+
+        pieces, gaps = table.split_range(0x7ffd4a1f1000, 0x7ffd4a500000)
+        self.assertEqual(pieces, [(0x7ffd4a1f1000, 0x7ffd4a1f2000), (0x7ffd4a3f0000, 0x7ffd4a3f2000)])
+        self.assertEqual(gaps, [(0x7ffd4a1f2000, 0x7ffd4a3f0000), (0x7ffd4a3f2000, 0x7ffd4a500000)])
+
+        self.assertEqual(table.split_range(0x1000, 0x2000), ([], [(0x1000, 0x2000)]))
+
+    def test_from_pid(self) -> None:
+        with open("/proc/self/maps", "r") as fin:
+            ranges = [tuple(int(addr, 16) for addr in line.split()[0].split("-")) for line in fin]
+        table = RegionTable.from_pid(os.getpid())
+        self.assertEqual([(region.addr_beg, region.addr_end) for region in table], ranges)
+        # filtering the columns gives the same result as filtering the rows
+        self.assertEqual([str(region) for region in filter_memory_maps(make_args(), table)],
+                         [str(region) for region in filter_memory_maps(make_args(), list(table))])
+
+
+# EOF #
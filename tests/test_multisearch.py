@@ -0,0 +1,64 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+import unittest
+
+from procmem.multisearch import NeedleSet, PatternSet, RegexSearch, search
+from procmem.pack import text2pattern
+
+
+class MultiSearchTestCase(unittest.TestCase):
+
+    def test_search(self) -> None:
+        self.assertEqual(search(b"aa", b"xaaax"), [1, 2])
+        self.assertEqual(search(b"aa", bytearray(b"xaaax")), [1, 2])
+
+    def test_needle_set(self) -> None:
+        needles = NeedleSet([b"a", b"ab", b"abc", b"bc"])
+        self.assertEqual(needles.find(b"xxabcab"),
+                         [(2, 3, 2), (2, 2, 1), (2, 1, 0), (3, 2, 3), (5, 2, 1), (5, 1, 0)])
+
+        needles = NeedleSet([b"Hello", b"World", b"llo W"])
+        self.assertEqual(needles.find(bytearray(b"Hello World")), [(0, 5, 0), (2, 5, 2), (6, 5, 1)])
+        self.assertEqual(needles.find(b"Hell"), [])
+
+    def test_needle_set_random(self) -> None:
+        rnd = random.Random(0)
+        haystack = bytes(rnd.randrange(4) for _ in range(20000))
+        needles = [bytes(rnd.randrange(4) for _ in range(rnd.randint(3, 8))) for _ in range(30)]
+
+        expected = sorted((offset, len(needle), idx)
+                          for idx, needle in enumerate(needles)
+                          for offset in search(needle, haystack))
+        self.assertTrue(sorted(NeedleSet(needles).find(haystack)) == expected)
+
+    def test_regex_search(self) -> None:
+        regex = RegexSearch(rb"[0-9a-f]{8}-[0-9a-f]{4}", 13)
+        self.assertEqual(regex.find(b"xx01234567-89abyy"), [(2, 13, 0)])
+        self.assertEqual(RegexSearch(rb"x*", 4).find(b"axxb"), [(1, 2, 0)])
+
+    def test_pattern_set(self) -> None:
+        patterns = PatternSet([text2pattern("48 8B ?? ?? 89 ?5"), text2pattern("?? 89")])
+        haystack = b"\x00\x48\x8b\x01\x02\x89\x15\x48\x8b\x01\x02\x89\x16"
+        self.assertEqual(patterns.find(haystack), [(1, 6, 0), (4, 2, 1), (10, 2, 1)])
+
+        with self.assertRaises(ValueError):
+            PatternSet([text2pattern("?? ??")])
+
+
+# EOF #
@@ -16,7 +16,9 @@
 
 import unittest
 
-from procmem.pack import text2bytes
+import numpy as np
+
+from procmem.pack import ctype2dtype, text2bytes, text2pattern, typed_text2bytes, typed_text2pattern
 
 
 class PackTestCase(unittest.TestCase):
@@ -38,5 +40,31 @@ class PackTestCase(unittest.TestCase):
         self.assertEqual(text2bytes("12345.67", "<float"), b'\xae\xe6@F')
         self.assertEqual(text2bytes("12345.67", "<double"), b')\\\x8f\xc2\xd5\x1c\xc8@')
 
+    def test_typed_text2bytes(self) -> None:
+        self.assertEqual(typed_text2bytes("int16:5", "string"), b'\x05\x00')
+        self.assertEqual(typed_text2bytes(">i16:5", "string"), b'\x00\x05')
+        self.assertEqual(typed_text2bytes("bytes:de ad", "string"), b'\xde\xad')
+        self.assertEqual(typed_text2bytes("http://x", "string"), b'http://x')
+        self.assertEqual(typed_text2bytes("5", "uint8"), b'\x05')
+
+        # without 'prefix' the text is taken literally
+        self.assertEqual(typed_text2bytes("s:foo", "string", prefix=False), b's:foo')
+        self.assertEqual(typed_text2bytes("float:abc", "string", prefix=False), b'float:abc')
+
+    def test_text2pattern(self) -> None:
+        self.assertEqual(text2pattern("48 8B ?? ?? 89 ?5"),
+                         (b'\x48\x8b\x00\x00\x89\x05', b'\xff\xff\x00\x00\xff\x0f'))
+        self.assertEqual(text2pattern("488b ? 4?"), (b'\x48\x8b\x00\x40', b'\xff\xff\x00\xf0'))
+        self.assertEqual(typed_text2pattern("int16:5", "bytes-pattern"), (b'\x05\x00', b'\xff\xff'))
+        self.assertEqual(typed_text2pattern("de ?d", "bp"), (b'\xde\x0d', b'\xff\x0f'))
+        self.assertEqual(typed_text2pattern("bytes:zz", "string", prefix=False), (b'bytes:zz', b'\xff' * 8))
+
+    def test_ctype2dtype(self) -> None:
+        self.assertEqual(ctype2dtype("int8"), np.dtype("i1"))
+        self.assertEqual(ctype2dtype(">ui16"), np.dtype(">u2"))
+        self.assertEqual(ctype2dtype("<float"), np.dtype("<f4"))
+        self.assertEqual(ctype2dtype("!double"), np.dtype(">f8"))
+        self.assertEqual(ctype2dtype("<int32").itemsize, len(text2bytes("5", "<int32")))
+
 
 # EOF #
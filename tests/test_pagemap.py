@@ -0,0 +1,55 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import mmap
+import os
+import unittest
+
+import numpy as np
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion
+from procmem.pagemap import PAGE_SIZE, page_runs
+
+
+class PagemapTestCase(unittest.TestCase):
+
+    def test_page_runs(self) -> None:
+        RAM = MemoryRegion.PAGE_RAM
+        SWAP = MemoryRegion.PAGE_SWAP
+        entries = np.array([RAM, RAM, 0, SWAP, RAM, 0, RAM], dtype=np.uint64)
+        self.assertEqual(page_runs(entries, RAM), [(0, 2), (4, 5), (6, 7)])
+        self.assertEqual(page_runs(entries, RAM | SWAP), [(0, 2), (3, 5), (6, 7)])
+        self.assertEqual(page_runs(np.zeros(4, dtype=np.uint64), RAM), [])
+
+    def test_resident_ranges(self) -> None:
+        with mmap.mmap(-1, 8 * PAGE_SIZE) as mm:
+            # touch pages 1, 2 and 5
+            for page in [1, 2, 5]:
+                mm[page * PAGE_SIZE] = 1
+
+            addr = np.frombuffer(mm, dtype=np.uint8).ctypes.data
+            with Memory.from_pid(os.getpid()) as mem:
+                ranges = list(mem.resident_ranges(addr, addr + 8 * PAGE_SIZE))
+                self.assertEqual(ranges, [(addr + 1 * PAGE_SIZE, addr + 3 * PAGE_SIZE),
+                                          (addr + 5 * PAGE_SIZE, addr + 6 * PAGE_SIZE)])
+
+                ranges = list(mem.resident_ranges(addr + 100, addr + 2 * PAGE_SIZE + 100))
+                self.assertEqual(ranges, [(addr + PAGE_SIZE, addr + 2 * PAGE_SIZE + 100)])
+
+
+# EOF #
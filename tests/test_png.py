@@ -0,0 +1,111 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+
+from procmem.memory import Memory
+from procmem.overview import UNREAD_COLOR, page_colors, write_overview
+from procmem.png import COLOR_RGB, PNG_SIGNATURE, PngWriter
+
+
+def decode_png(data: bytes) -> tuple[int, int, int, bytes]:
+    """Return width, height, color type and the unfiltered pixel data"""
+    assert data[:8] == PNG_SIGNATURE
+    pos = 8
+    idat = b""
+    header = b""
+    while pos < len(data):
+        length, kind = struct.unpack_from(">I4s", data, pos)
+        chunk = data[pos + 8:pos + 8 + length]
+        crc, = struct.unpack_from(">I", data, pos + 8 + length)
+        assert crc == zlib.crc32(chunk, zlib.crc32(kind))
+        if kind == b"IHDR":
+            header = chunk
+        elif kind == b"IDAT":
+            idat += chunk
+        pos += 12 + length
+
+    width, height, _, color_type = struct.unpack_from(">IIBB", header)
+    row_bytes = width * (3 if color_type == COLOR_RGB else 1)
+    raw = zlib.decompress(idat)
+    assert len(raw) == height * (row_bytes + 1)
+    rows = [raw[i * (row_bytes + 1):(i + 1) * (row_bytes + 1)] for i in range(height)]
+    assert all(row[0] == 0 for row in rows)
+    return width, height, color_type, b"".join(row[1:] for row in rows)
+
+
+class PngTestCase(unittest.TestCase):
+
+    def test_png_writer(self) -> None:
+        data = bytes(range(256)) * 10
+        fout = io.BytesIO()
+        with PngWriter(fout, 100, 30) as png:
+            # rows split across writes
+            png.write(data[:150])
+            png.write(data[150:])
+            self.assertEqual(png.position, len(data))
+
+        width, height, color_type, pixels = decode_png(fout.getvalue())
+        self.assertEqual((width, height, color_type), (100, 30, 0))
+        self.assertEqual(pixels, data + bytes(30 * 100 - len(data)))
+
+    def test_png_skip(self) -> None:
+        fout = io.BytesIO()
+        with PngWriter(fout, 100, 30) as png:
+            png.write(b"a" * 50)
+            # completes the pending row, skips whole rows and leaves a partial one
+            png.skip(50 + 1000 + 20)
+            png.write(b"b" * 30)
+            self.assertEqual(png.position, 1150)
+            # gaps beyond the image are dropped without being allocated
+            png.skip(1 << 40)
+            self.assertEqual(png.position, 30 * 100)
+
+        _, _, _, pixels = decode_png(fout.getvalue())
+        self.assertEqual(pixels, b"a" * 50 + bytes(1070) + b"b" * 30 + bytes(30 * 100 - 1150))
+
+    def test_page_colors(self) -> None:
+        page = np.random.default_rng(0).integers(0, 256, 4096, dtype=np.uint8).tobytes()
+        colors = page_colors(bytes(4096) + page + b"\x01" * 4096, 4096)
+        self.assertEqual(colors[0].tolist(), [0, 0, 0])
+        self.assertGreater(colors[1][1], 240)
+        self.assertEqual(colors[2].tolist(), [0, 0, 255])
+
+    def test_overview(self) -> None:
+        buf = bytearray(b"\xaa" * 4096 * 4)
+        with Memory.from_pid(os.getpid()) as mem, tempfile.TemporaryDirectory() as tmpdir:
+            region = mem.region_at(np.frombuffer(buf, dtype=np.uint8).ctypes.data)
+            assert region is not None
+            filename = os.path.join(tmpdir, "overview.png")
+            pages = write_overview(mem, [region], filename, width=16)
+            self.assertEqual(pages, region.length() // 4096)
+
+            with open(filename, "rb") as fin:
+                width, height, color_type, pixels = decode_png(fin.read())
+            self.assertEqual((width, color_type), (16, COLOR_RGB))
+            self.assertEqual(height, (pages + 15) // 16)
+            self.assertNotIn(bytes(UNREAD_COLOR), [pixels[i:i + 3] for i in range(0, pages * 3, 3)])
+
+
+# EOF #
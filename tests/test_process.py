@@ -0,0 +1,177 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import os
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from procmem.main_info import main_info
+from procmem.main_statm import main_statm
+from procmem.process import (ProcessCache, ProcessInfo, ProcessMatcher, find_processes, list_pids,
+                             read_cmdline, read_comm, read_smaps_rollup, read_stat, read_statm, sample,
+                             read_task_states, scan_processes, select_pids, stopped)
+import child
+import stdio
+
+
+class ProcessTestCase(unittest.TestCase):
+
+    def test_list_pids(self) -> None:
+        self.assertIn(os.getpid(), list_pids())
+
+    def test_read(self) -> None:
+        statm = read_statm(os.getpid())
+        self.assertEqual(len(statm), 7)
+        self.assertGreater(statm[1], 0)
+
+        rollup = read_smaps_rollup(os.getpid())
+        self.assertGreater(rollup["Rss"], 0)
+        self.assertEqual(rollup["Rss"] % 1024, 0)
+
+    def test_select_pids(self) -> None:
+        pid = os.getpid()
+        self.assertIn(pid, select_pids("^{}$".format(read_comm(pid))))
+        self.assertEqual(select_pids(None, [3, 1]), [1, 3])
+        self.assertEqual(select_pids("^no such process name$"), [])
+
+    def test_sample(self) -> None:
+        pid = os.getpid()
+        # a pid beyond pid_max never exists and is skipped
+        result = sample([pid, 2 ** 31 - 1], read_statm, jobs=2)
+        self.assertEqual([p for p, _ in result], [pid])
+
+    def test_read_stat(self) -> None:
+        name, start_time = read_stat(os.getpid())
+        self.assertEqual(name, read_comm(os.getpid()))
+        self.assertGreater(start_time, 0)
+        self.assertGreater(len(read_cmdline(os.getpid())), 0)
+
+    def test_scan_processes(self) -> None:
+        processes = {process.pid: process for process in scan_processes()}
+        self.assertEqual(processes[os.getpid()].name, read_comm(os.getpid()))
+
+    def test_matcher(self) -> None:
+        process = ProcessInfo(1, "foo-bar", 0)
+        process._cmdline = ["/usr/bin/foo-bar", "--baz"]
+        self.assertTrue(ProcessMatcher("foo-bar").match(process))
+        self.assertFalse(ProcessMatcher("foo").match(process))
+        self.assertTrue(ProcessMatcher("^foo", regex=True).match(process))
+        self.assertTrue(ProcessMatcher("--baz", cmdline=True).match(process))
+        self.assertFalse(ProcessMatcher("--qux", cmdline=True).match(process))
+
+        # truncated names are completed from the command line
+        process = ProcessInfo(1, "a-very-long-nam", 0)
+        process._cmdline = ["/usr/bin/a-very-long-name"]
+        self.assertTrue(ProcessMatcher("a-very-long-name").match(process))
+
+    def test_cache(self) -> None:
+        pid = os.getpid()
+        name, start_time = read_stat(pid)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ProcessCache(os.path.join(tmpdir, "processes.json"))
+            self.assertIsNone(cache.load())
+
+            # only our own process exists as far as the test is concerned
+            with mock.patch("procmem.process.scan_processes",
+                            return_value=[ProcessInfo(pid, name, start_time)]) as scan:
+                self.assertEqual(find_processes(ProcessMatcher(name), cache), [pid])
+                self.assertEqual(scan.call_count, 1)
+                processes = cache.load()
+                assert processes is not None
+                self.assertEqual([process.pid for process in processes], [pid])
+
+                # a hit doesn't scan
+                self.assertEqual(find_processes(ProcessMatcher(name), cache), [pid])
+                self.assertEqual(scan.call_count, 1)
+
+                # entries whose start time doesn't match are stale, the
+                # miss falls back to a scan which replaces the cache
+                cache.save([ProcessInfo(pid, "stale-name", start_time + 1), ProcessInfo(pid, name, start_time)])
+                self.assertEqual(find_processes(ProcessMatcher("stale-name"), cache), [])
+                self.assertEqual(scan.call_count, 2)
+                processes = cache.load()
+                assert processes is not None
+                self.assertEqual([process.name for process in processes], [name])
+                self.assertEqual(find_processes(ProcessMatcher(name), cache), [pid])
+                self.assertEqual(scan.call_count, 2)
+
+            self.assertIsNone(ProcessCache(cache.path, ttl=0.0).load())
+
+    def test_cache_untrusted(self) -> None:
+        pid = os.getpid()
+        name, start_time = read_stat(pid)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "processes.json")
+            cache = ProcessCache(path)
+            cache.save([ProcessInfo(pid, name, start_time)])
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+            # a cache readable or writable by others isn't trusted
+            os.chmod(path, 0o622)
+            self.assertIsNone(cache.load())
+
+            # neither is a symlink, nor is it followed when saving
+            target = os.path.join(tmpdir, "target")
+            with open(target, "w") as fout:
+                fout.write("untouched")
+            os.unlink(path)
+            os.symlink(target, path)
+            self.assertIsNone(cache.load())
+            os.symlink(target, "{}.{}".format(path, os.getpid()))
+            cache.save([ProcessInfo(pid, name, start_time)])
+            with open(target) as fin:
+                self.assertEqual(fin.read(), "untouched")
+            self.assertFalse(os.path.islink(path))
+
+    def test_cache_default_path(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch.dict(os.environ, {"XDG_RUNTIME_DIR": tmpdir}):
+                self.assertEqual(os.path.dirname(ProcessCache.default_path() or ""), tmpdir)
+
+                # a runtime directory accessible by others isn't used
+                os.chmod(tmpdir, 0o777)
+                self.assertIsNone(ProcessCache.default_path())
+                self.assertIsNone(ProcessCache().load())
+
+    def test_stopped(self) -> None:
+        with child.spawn() as (proc, addr, stdout):
+            with stopped(proc.pid):
+                self.assertEqual(set(read_task_states(proc.pid)), {"T"})
+                # an already stopped process stays stopped
+                with stopped(proc.pid):
+                    pass
+                self.assertEqual(set(read_task_states(proc.pid)), {"T"})
+            self.assertNotIn("T", read_task_states(proc.pid))
+
+        # the own process isn't stopped
+        with stopped(os.getpid()):
+            pass
+
+    def test_main_multi(self) -> None:
+        args = argparse.Namespace(match=None, pids=[os.getpid()], jobs=4)
+        with stdio.redirect() as (stdout, stderr):
+            main_info(os.getpid(), args)
+            main_statm(os.getpid(), args)
+        lines = stdout.read().splitlines()
+        self.assertEqual(len(lines), 8)
+        self.assertTrue(lines[1].split()[0] == str(os.getpid()))
+
+
+# EOF #
@@ -0,0 +1,46 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import os
+import unittest
+
+from procmem.multisearch import NeedleSet
+from procmem.scan import parallel_scan, split_ranges
+
+
+class ScanTestCase(unittest.TestCase):
+
+    def test_split_ranges(self) -> None:
+        self.assertEqual(split_ranges([(0, 10), (20, 25)], 4, 2),
+                         [(0, 4, 6), (4, 8, 10), (8, 10, 10), (20, 24, 25), (24, 25, 25)])
+
+    def test_parallel_scan(self) -> None:
+        data = bytearray(100000)
+        offsets = list(range(0, len(data) - 6, 997))
+        for offset in offsets:
+            data[offset:offset + 6] = b"needle"
+        buf = ctypes.create_string_buffer(bytes(data), len(data))
+        addr = ctypes.addressof(buf)
+
+        # small chunks so that plenty of matches straddle chunk boundaries
+        matches = list(parallel_scan(os.getpid(), [(addr, addr + len(data))],
+                                     NeedleSet([b"needle"]).find, overlap=5, jobs=3, chunk_size=1000))
+        self.assertEqual(matches, [(addr + offset, 6, 0) for offset in offsets])
+
+
+# EOF #
@@ -0,0 +1,99 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from procmem.main_scan import first_scan, next_scan
+from procmem.memory import ProcessVmMemory
+from procmem.session import ScanSession
+from procmem.typedscan import TypedScan
+
+
+# below mmap_min_addr, never mapped
+UNMAPPED = (0x1000, 0x2000)
+
+
+class ScanSessionTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "session")
+        self.values = (ctypes.c_int32 * 1024)(*range(1024))
+        self.addr = ctypes.addressof(self.values)
+        self.ranges = [(self.addr, self.addr + ctypes.sizeof(self.values))]
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def candidates(self, session: ScanSession) -> list[tuple[int, int]]:
+        return [(addr, value)
+                for addrs, values in ScanSession.load(session.path).candidates(block_size=100)
+                for addr, value in zip(addrs.tolist(), values.tolist())]
+
+    def test_narrowing(self) -> None:
+        with ProcessVmMemory.from_pid(os.getpid()) as mem, \
+             mock.patch("procmem.session.SPILL_THRESHOLD", 100):
+            session = ScanSession.create(self.path, os.getpid(), "int32", 4)
+            first_scan(mem, session, self.ranges, TypedScan("int32", "any", [], 4))
+            self.assertEqual(session.count, 1024)
+            self.assertTrue(self.candidates(session) == [(self.addr + 4 * i, i) for i in range(1024)])
+
+            next_scan(mem, session, "unchanged", [])
+            self.assertEqual(session.count, 1024)
+
+            for i in range(0, 1024, 2):
+                self.values[i] += 1
+            self.values[3] -= 1
+            next_scan(mem, session, "increased", [])
+            self.assertEqual(session.count, 512)
+            self.assertEqual(self.candidates(session)[:2], [(self.addr, 1), (self.addr + 8, 3)])
+
+            next_scan(mem, session, "lt", ["100"])
+            self.assertEqual(self.candidates(session), [(self.addr + 4 * i, i + 1) for i in range(0, 99, 2)])
+
+            self.values[10] = 77
+            next_scan(mem, session, "changed", [])
+            self.assertEqual(self.candidates(session), [(self.addr + 40, 77)])
+            self.assertEqual(session.generation, 5)
+
+    def test_first_scan_value(self) -> None:
+        with ProcessVmMemory.from_pid(os.getpid()) as mem:
+            session = ScanSession.create(self.path, os.getpid(), "int32", 4)
+            # unreadable ranges are skipped
+            with self.assertLogs(level="WARNING"):
+                first_scan(mem, session, [UNMAPPED] + self.ranges, TypedScan("int32", "range", ["10", "12"], 4))
+            self.assertEqual(self.candidates(session), [(self.addr + 4 * i, i) for i in range(10, 13)])
+
+            next_scan(mem, session, "eq", ["11"])
+            self.assertEqual(self.candidates(session), [(self.addr + 44, 11)])
+
+    def test_empty(self) -> None:
+        session = ScanSession.create(self.path, os.getpid(), "int32", 4)
+        self.assertEqual(list(session.candidates()), [])
+        with ProcessVmMemory.from_pid(os.getpid()) as mem:
+            next_scan(mem, session, "changed", [])
+        self.assertEqual(session.count, 0)
+        self.assertEqual(np.fromfile(session.addr_file, dtype=np.uint64).tolist(), [])
+
+
+# EOF #
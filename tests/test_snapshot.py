@@ -0,0 +1,206 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Iterator
+
+import ctypes
+import mmap
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion
+from procmem.process import read_task_states
+from procmem.snapshot import Snapshot, SnapshotWriter, take_delta_snapshot, take_snapshot
+import child
+
+
+PAGE = 4096
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, "test.snap")
+        self.region = MemoryRegion(0x10000, 0x41000, True, True, False, True, 0, "00:00", 0, "[heap]")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_roundtrip(self) -> None:
+        pages = [bytes(PAGE), b"a" * PAGE, bytes(range(256)) * 16, b"a" * PAGE]
+        data = b"".join(pages) * 10
+        with SnapshotWriter(self.filename, [self.region], page_size=PAGE) as writer:
+            writer.add(0x10000, data)
+            writer.add(0x40000, b"b" * PAGE)
+
+        self.assertEqual(writer.pages, 41)
+        self.assertEqual(writer.zero_pages, 10)
+        self.assertEqual(writer.unique_pages, 3)
+        self.assertEqual(writer.duplicate_pages, 28)
+
+        with Snapshot.open(self.filename) as snap:
+            self.assertEqual(len(snap.page_addrs), 41)
+            self.assertEqual(snap.regions[0].to_json(), self.region.to_json())
+            self.assertEqual(snap.read_page(0), bytes(PAGE))
+            self.assertEqual(snap.read(0x10000, 0x10000 + len(data)), data)
+            self.assertEqual(snap.read(0x10ffe, 0x11002), b"\0\0aa")
+            self.assertEqual(snap.read(0x3fffe, 0x40002), b"\0\0bb")
+            self.assertEqual(snap.find_page(0x40123), 40)
+            self.assertIsNone(snap.find_page(0x38000))
+
+    def test_empty(self) -> None:
+        with SnapshotWriter(self.filename, [], page_size=PAGE):
+            pass
+
+        with Snapshot.open(self.filename) as snap:
+            self.assertEqual(snap.regions, [])
+            self.assertEqual(len(snap.page_addrs), 0)
+            self.assertEqual(snap.read(0, 4), bytes(4))
+
+    def test_incomplete(self) -> None:
+        def write() -> None:
+            with SnapshotWriter(self.filename, [self.region], page_size=PAGE) as writer:
+                writer.add(0x10000, b"a" * PAGE)
+                raise KeyboardInterrupt()
+
+        self.assertRaises(KeyboardInterrupt, write)
+        self.assertRaisesRegex(Exception, "incomplete", Snapshot.open, self.filename)
+
+    def test_take_snapshot(self) -> None:
+        with mmap.mmap(-1, 8 * PAGE) as buf:
+            buf[PAGE:PAGE + 5] = b"hello"
+            buf[5 * PAGE:6 * PAGE] = b"x" * PAGE
+            obj = ctypes.c_char.from_buffer(buf)
+            addr = ctypes.addressof(obj)
+            del obj
+
+            region = MemoryRegion(addr, addr + 8 * PAGE, True, True, False, True, 0, "00:00", 0, "")
+            with Memory.from_pid(os.getpid()) as mem:
+                with SnapshotWriter(self.filename, [region], page_size=PAGE) as writer:
+                    take_snapshot(mem, [region], writer)
+
+            with Snapshot.open(self.filename) as snap:
+                self.assertEqual(snap.read(addr, addr + 8 * PAGE), buf[:])
+
+    def test_layers(self) -> None:
+        base = os.path.join(self.tmpdir.name, "base.snap")
+        with SnapshotWriter(base, [self.region], page_size=PAGE) as writer:
+            writer.add(0x10000, b"a" * PAGE + b"b" * PAGE + b"c" * PAGE)
+
+        delta = os.path.join(self.tmpdir.name, "base.snap.1")
+        with SnapshotWriter(delta, [self.region], page_size=PAGE, meta={"parent": "base.snap"}) as writer:
+            writer.add(0x11000, b"B" * PAGE)
+            writer.add(0x14000, b"e" * PAGE)
+
+        # the region shrank, so the third page of the base is gone
+        shrunk = MemoryRegion(0x10000, 0x12000, True, True, False, True, 0, "00:00", 0, "[heap]")
+        grown = MemoryRegion(0x14000, 0x15000, True, True, False, True, 0, "00:00", 0, "")
+        delta2 = os.path.join(self.tmpdir.name, "base.snap.2")
+        with SnapshotWriter(delta2, [shrunk, grown], page_size=PAGE, meta={"parent": "base.snap.1"}) as writer:
+            writer.add(0x10000, bytes(PAGE))
+
+        with Snapshot.open(delta) as snap:
+            self.assertEqual(snap.page_addrs.tolist(), [0x10000, 0x11000, 0x12000, 0x14000])
+            self.assertEqual(snap.read(0x10ffe, 0x11002), b"aaBB")
+            self.assertEqual(snap.read(0x12000, 0x12002), b"cc")
+
+        with Snapshot.open(delta2) as snap:
+            self.assertEqual(snap.page_addrs.tolist(), [0x10000, 0x11000, 0x14000])
+            self.assertEqual(snap.read(0x10ffe, 0x11002), b"\0\0BB")
+            self.assertEqual(snap.read(0x12000, 0x12002), b"\0\0")
+            self.assertEqual(snap.read(0x14000, 0x14002), b"ee")
+
+    def test_many_layers(self) -> None:
+        # deeper than the recursion limit, every layer changes one of four pages
+        count = sys.getrecursionlimit() + 100
+        region = MemoryRegion(0x10000, 0x14000, True, True, False, True, 0, "00:00", 0, "")
+        parent = None
+        for layer in range(count):
+            filename = os.path.join(self.tmpdir.name, "series.snap.{}".format(layer))
+            with SnapshotWriter(filename, [region], page_size=PAGE, meta={"parent": parent}) as writer:
+                if layer == 0:
+                    writer.add(0x10000, b"".join(bytes([i]) * PAGE for i in range(4)))
+                else:
+                    writer.add(0x10000 + layer % 4 * PAGE, (layer % 256).to_bytes(1, "little") * PAGE)
+            parent = os.path.basename(filename)
+
+        with Snapshot.open(filename) as snap:
+            # only the layers holding a page that gets read are opened
+            self.assertEqual(len(snap.layer_files), count - 1)
+            self.assertEqual(snap._layers, {})
+            self.assertEqual(snap.page_layers.tolist(), [3, 2, 1, 0])
+            self.assertEqual(snap.read(0x10000, 0x14000),
+                             b"".join(((count - 4 + i) % 256).to_bytes(1, "little") * PAGE for i in range(4)))
+            self.assertEqual(sorted(snap._layers), [1, 2, 3])
+
+    def test_take_delta_snapshot(self) -> None:
+        with mmap.mmap(-1, 4 * PAGE) as buf:
+            buf[:] = b"d" * 4 * PAGE
+            obj = ctypes.c_char.from_buffer(buf)
+            addr = ctypes.addressof(obj)
+            del obj
+
+            region = MemoryRegion(addr, addr + 4 * PAGE, True, True, False, True, 0, "00:00", 0, "")
+            with Memory.from_pid(os.getpid()) as mem, \
+                 mock.patch.object(mem, "dirty_ranges", return_value=iter([(addr + PAGE, addr + 3 * PAGE)])), \
+                 mock.patch.object(mem, "clear_soft_dirty") as clear_soft_dirty:
+                with SnapshotWriter(self.filename, [region], page_size=PAGE) as writer:
+                    take_delta_snapshot(mem, [region], writer)
+                clear_soft_dirty.assert_called_once()
+
+        with Snapshot.open(self.filename) as snap:
+            self.assertEqual(snap.page_addrs.tolist(), [addr + PAGE, addr + 2 * PAGE])
+
+    def test_take_delta_snapshot_race(self) -> None:
+        with child.spawn() as (proc, addr, stdout), Memory.from_pid(proc.pid) as mem:
+            region = MemoryRegion(addr, addr + 2 * mmap.PAGESIZE, True, True, False, True, 0, "00:00", 0, "")
+            states: list[list[str]] = []
+
+            def dirty_ranges(beg: int, end: int) -> Iterator[tuple[int, int]]:
+                states.append(read_task_states(proc.pid))
+                return iter([])
+
+            def clear_soft_dirty() -> None:
+                # the child writes to a page between the lookup of the
+                # dirty pages and the clearing of the bits
+                proc.send_signal(signal.SIGUSR1)
+                time.sleep(0.1)
+                states.append(read_task_states(proc.pid))
+                self.assertEqual(mem.read(addr, addr + 1), b"a")
+
+            with mock.patch.object(mem, "dirty_ranges", side_effect=dirty_ranges), \
+                 mock.patch.object(mem, "clear_soft_dirty", side_effect=clear_soft_dirty):
+                with SnapshotWriter(self.filename, [region], page_size=mmap.PAGESIZE) as writer:
+                    take_delta_snapshot(mem, [region], writer)
+
+            # the process was stopped throughout, the write only
+            # happens after the bits were cleared, so it is left for
+            # the next delta
+            self.assertEqual(len(states), 2)
+            self.assertTrue(all(state == "T" for tasks in states for state in tasks))
+            self.assertEqual(stdout.readline(), "written\n")
+            self.assertEqual(mem.read(addr, addr + 1), b"b")
+
+
+# EOF #
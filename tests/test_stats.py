@@ -0,0 +1,87 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import json
+import os
+import unittest
+
+import numpy as np
+
+from procmem.main_stats import main_stats
+from procmem.memory import Memory
+from procmem.memory_region import MemoryRegion
+from procmem.stats import PageStats, PageTable, RegionStats, histogram_entropy
+import stdio
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        with Memory.from_pid(os.getpid()) as mem:
+            self.regions = mem.regions()
+        # zero page, random page, a page half filled with pointers and a page of 0xff
+        pointers = np.zeros(512, dtype=np.uint64)
+        pointers[::2] = self.regions.addr_beg[0]
+        self.data = (bytes(4096) + rng.integers(0, 256, 4096, dtype=np.uint8).tobytes() +
+                     pointers.tobytes() + b"\xff" * 4096)
+
+    def test_page_stats(self) -> None:
+        stats = PageStats(self.data, 4096, self.regions)
+        self.assertEqual(len(stats), 4)
+        entropy = stats.entropy()
+        self.assertEqual(entropy[0], 0.0)
+        self.assertGreater(entropy[1], 0.95)
+        self.assertEqual(entropy[3], 0.0)
+        self.assertEqual(stats.zero().tolist()[0], 1.0)
+        self.assertEqual(stats.zero().tolist()[3], 0.0)
+        self.assertEqual(stats.pointer().tolist()[2], 0.5)
+        self.assertEqual(stats.histograms.sum(axis=1).tolist(), [4096] * 4)
+
+        # without regions no pointers are looked for
+        self.assertEqual(PageStats(self.data, 4096).pointer().tolist(), [0.0] * 4)
+
+    def test_region_stats(self) -> None:
+        stats = RegionStats(MemoryRegion(0x1000, 0x5000, True, True, False, True, 0, "00:00", 0, "[test]"))
+        stats.add(PageStats(self.data[:8192], 4096, self.regions))
+        stats.add(PageStats(self.data[8192:], 4096, self.regions))
+        self.assertEqual(stats.metric("size"), 16384)
+        self.assertEqual(stats.metric("pointer"), 256 / 2048)
+        self.assertAlmostEqual(stats.metric("entropy"), float(histogram_entropy(stats.histogram)))
+        self.assertEqual(stats.most_common()[0][0], 0)
+        self.assertEqual(len(stats.to_json(histogram=True)["histogram"]), 256)
+
+    def test_page_table(self) -> None:
+        pages = PageTable()
+        pages.add(0x10000, PageStats(self.data, 4096, self.regions))
+        self.assertEqual([page["address"] for page in pages.sorted("entropy", 1)], [0x11000])
+        self.assertEqual([page["address"] for page in pages.sorted("zero")][0], 0x10000)
+        self.assertEqual([page["address"] for page in pages.sorted("pointer", 1)], [0x12000])
+
+    def test_main_stats(self) -> None:
+        args = argparse.Namespace(pathname="[stack]", writable=False, executable=False, size=None, rss=None,
+                                  no_default_filter=False, resident_only=False,
+                                  sort="entropy", limit=2, pages=True, histogram=False, json=True)
+        with stdio.redirect() as (stdout, stderr):
+            main_stats(os.getpid(), args)
+        js = json.loads(stdout.read())
+        self.assertEqual(len(js["regions"]), 1)
+        self.assertEqual(len(js["pages"]), 2)
+
+
+# EOF #
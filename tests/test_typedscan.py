@@ -0,0 +1,58 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import struct
+import unittest
+
+from procmem.typedscan import TypedScan
+
+
+class TypedScanTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.haystack = bytearray(64)
+        struct.pack_into("<i", self.haystack, 5, 100)
+        struct.pack_into("<i", self.haystack, 16, 105)
+        struct.pack_into("<f", self.haystack, 40, 3.1415)
+
+    def test_eq(self) -> None:
+        self.assertEqual(TypedScan("<int32", "eq", ["100"]).find(self.haystack), [(5, 4, 0)])
+        self.assertEqual(TypedScan(">int32", "eq", ["100"]).find(self.haystack), [(2, 4, 0)])
+
+    def test_alignment(self) -> None:
+        scan = TypedScan("<int32", "eq", ["100"], alignment=4)
+        self.assertEqual(scan.find(self.haystack), [])
+        self.assertEqual(scan.find(self.haystack, addr=0x1003), [(5, 4, 0)])
+
+    def test_range(self) -> None:
+        scan = TypedScan("<int32", "range", ["90", "110"], alignment=4)
+        self.assertEqual(scan.find(self.haystack), [(16, 4, 0)])
+        self.assertEqual(scan.decode(bytes(self.haystack[16:20])), 105)
+
+    def test_approx(self) -> None:
+        scan = TypedScan("<float", "approx", ["3.14"], alignment=4, tolerance=0.01)
+        self.assertEqual(scan.find(self.haystack), [(40, 4, 0)])
+        scan = TypedScan("<float", "approx", ["3.14"], alignment=4, tolerance=0.001)
+        self.assertEqual(scan.find(self.haystack), [])
+
+    def test_lt_gt_ne(self) -> None:
+        self.assertEqual(len(TypedScan("uint8", "ne", ["0"]).find(self.haystack)), 6)
+        self.assertEqual(TypedScan("uint8", "gt", ["100"]).find(self.haystack), [(16, 1, 0)])
+        self.assertEqual(TypedScan("<int32", "lt", ["-1"], alignment=4).find(self.haystack), [])
+
+
+# EOF #
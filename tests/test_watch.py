@@ -0,0 +1,74 @@
+# procmem - A process memory inspection tool
+# Copyright (C) 2018 Ingo Ruhnke <grumbel@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import ctypes
+import io
+import json
+import os
+import unittest
+
+from procmem.memory import ProcessVmMemory
+from procmem.watch import Watcher, WatchTarget
+
+
+class WatchTestCase(unittest.TestCase):
+
+    def test_from_string(self) -> None:
+        target = WatchTarget.from_string("1000+1c:float")
+        self.assertEqual(target.addr, 0x101c)
+        self.assertEqual(target.size, 4)
+        self.assertEqual(target.label, "1000+1c:float")
+
+        self.assertRaises(Exception, WatchTarget.from_string, "xyz:int32")
+
+    def test_watcher(self) -> None:
+        counter = ctypes.c_int32(5)
+        ratio = ctypes.c_double(0.5)
+        raw = ctypes.create_string_buffer(b"abcdefgh", 8)
+        targets = [WatchTarget.from_string("{:x}:int32".format(ctypes.addressof(counter))),
+                   WatchTarget.from_string("{:x}:double".format(ctypes.addressof(ratio))),
+                   WatchTarget(ctypes.addressof(raw), size=8)]
+
+        with ProcessVmMemory.from_pid(os.getpid()) as mem:
+            watcher = Watcher(mem, targets, history_size=3)
+            self.assertEqual(watcher.poll(1.0), [])
+            self.assertEqual(targets[0].decode(watcher.state(0)), 5)
+            self.assertEqual(watcher.poll(2.0), [])
+
+            counter.value = 6
+            raw[1] = b"B"
+            raw[5] = b"F"
+            raw[6] = b"G"
+            events = watcher.poll(3.0)
+            self.assertEqual(events, [(3.0, 0, ctypes.addressof(counter), b"\5\0\0\0", b"\6\0\0\0"),
+                                      (3.0, 2, ctypes.addressof(raw) + 1, b"b", b"B"),
+                                      (3.0, 2, ctypes.addressof(raw) + 5, b"fg", b"FG")])
+            self.assertTrue(watcher.format_event(events[0]).endswith(":int32  5 -> 6"))
+
+            ratio.value = 0.25
+            self.assertEqual(len(watcher.poll(4.0)), 1)
+
+        # the history only keeps the last three changes
+        fout = io.StringIO()
+        watcher.export(fout)
+        lines = [json.loads(line) for line in fout.getvalue().splitlines()]
+        self.assertEqual([(js["time"], js["old"], js["new"]) for js in lines],
+                         [(3.0, "62", "42"), (3.0, "6667", "4647"), (4.0, 0.5, 0.25)])
+        self.assertEqual(lines[2]["type"], "double")
+
+
+# EOF #